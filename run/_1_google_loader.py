@@ -1,11 +1,17 @@
+import atexit
 import json
 import logging
 import os
+import sys
 import threading
 import time
+from collections.abc import MutableMapping
 import gspread
+from gspread.utils import absolute_range_name, rowcol_to_a1
 from oauth2client.service_account import ServiceAccountCredentials
 
+from concurrency import backend_slot
+
 def load_config():
     # Загружаем конфигурацию только из переменных окружения
     config = {
@@ -23,6 +29,12 @@ def load_config():
             "OPENAI_SECOND_SYSTEM_PROMPT_FILE",
             "prompts/second_system.txt",
         ),
+        "openai_single_pass": os.getenv("OPENAI_SINGLE_PASS", "false").lower() == "true",
+        "openai_single_pass_prompt_file": os.getenv(
+            "OPENAI_SINGLE_PASS_PROMPT_FILE",
+            "prompts/single_pass_rules.txt",
+        ),
+        "openai_structured_output": os.getenv("OPENAI_STRUCTURED_OUTPUT", "true").lower() == "true",
         "opencage_api_key": os.getenv("OPENCAGE_API_KEY"),
         "wp_url": os.getenv("WP_URL"),
         "wp_admin_user": os.getenv("WP_ADMIN_USER"),
@@ -35,7 +47,8 @@ def load_config():
         "wcapi_timeout_sec": float(os.getenv("WCAPI_TIMEOUT_SEC", "20")),
         "fetch_user_agent": os.getenv("HTTP_FETCH_USER_AGENT"),
         "fetch_retry_delays_sec": os.getenv("HTTP_FETCH_RETRY_DELAYS_SEC", "60,120"),
-        "fetch_insecure_hosts": os.getenv("HTTP_FETCH_INSECURE_HOSTS", "")
+        "fetch_insecure_hosts": os.getenv("HTTP_FETCH_INSECURE_HOSTS", ""),
+        "fetch_max_bytes": int(os.getenv("HTTP_FETCH_MAX_BYTES", str(50 * 1024 * 1024)))
     }
     
     # Проверяем, что все обязательные переменные заданы
@@ -91,6 +104,21 @@ _worksheet_lock = threading.Lock()
 _update_retry_attempts = int(os.getenv("GOOGLE_SHEETS_UPDATE_MAX_ATTEMPTS", "3"))
 _update_retry_base_delay = float(os.getenv("GOOGLE_SHEETS_UPDATE_BASE_DELAY_SEC", "1"))
 
+# Write-behind: записи копятся в памяти и журнале и уходят в таблицу одним запросом на контрольных точках.
+_WRITE_BEHIND_ENABLED = os.getenv("GOOGLE_SHEETS_WRITE_BEHIND", "true").lower() == "true"
+_WRITE_FLUSH_INTERVAL_SEC = float(os.getenv("GOOGLE_SHEETS_FLUSH_INTERVAL_SEC", "30"))
+_WRITE_JOURNAL_FILE = os.getenv("GOOGLE_SHEETS_WRITE_JOURNAL", "/app/logs/sheet_write_journal.jsonl")
+
+_pending_writes = {}
+_pending_headers = None
+# _pending_lock защищает только буфер и журнал (короткие операции в памяти/на диске);
+# _flush_lock упорядочивает отправки, чтобы более старый пакет не перезаписал более новый.
+_pending_lock = threading.RLock()
+_flush_lock = threading.Lock()
+_last_flush_ts = time.time()
+_flush_timer = None
+_flush_timer_stop = threading.Event()
+
 
 def _load_credentials():
     credentials_json = os.getenv("GOOGLE_SERVICE_ACCOUNT_JSON")
@@ -151,26 +179,139 @@ def _get_sheet_with_retry(max_attempts: int = 3, base_delay_sec: int = 2):
     # Если все попытки исчерпаны — пробрасываем исключение
     raise last_err
 
-def load_revised_rows():
-    # Загружаем лист с ретраями на случай временных сетевых ошибок
+class SheetHeaders(list):
+    """Заголовки листа с индексом колонка → позиция, построенным один раз.
+
+    Остаётся списком (совместим с кодом, который передаёт headers дальше),
+    но `in` и `index()` работают за O(1) вместо линейного поиска.
+    """
+
+    def __init__(self, values=()):
+        super().__init__(values)
+        self._positions = {}
+        for position, name in enumerate(self):
+            self._positions.setdefault(name, position)
+
+    def __contains__(self, name):
+        return name in self._positions
+
+    def index(self, name, *args):
+        if args:
+            return super().index(name, *args)
+        try:
+            return self._positions[name]
+        except KeyError:
+            raise ValueError(f"{name!r} is not in headers") from None
+
+
+class SheetRow(MutableMapping):
+    """Строка листа поверх исходного массива значений.
+
+    Значения колонок читаются из списка, полученного от Sheets API, без
+    копирования в dict; записи (LAT/LON, сгенерированный контент и т.п.)
+    хранятся в отдельном небольшом словаре поверх массива.
+    """
+
+    __slots__ = ("_values", "_headers", "_overrides")
+
+    def __init__(self, values: list, headers: SheetHeaders):
+        self._values = values
+        self._headers = headers
+        self._overrides = {}
+
+    def __getitem__(self, key):
+        if key in self._overrides:
+            return self._overrides[key]
+        position = self._headers._positions.get(key)
+        if position is None:
+            raise KeyError(key)
+        return self._values[position] if position < len(self._values) else ""
+
+    def __setitem__(self, key, value):
+        self._overrides[key] = value
+
+    def __delitem__(self, key):
+        del self._overrides[key]
+
+    def __iter__(self):
+        yield from self._headers._positions
+        for key in self._overrides:
+            if key not in self._headers._positions:
+                yield key
+
+    def __len__(self):
+        extra = sum(1 for key in self._overrides if key not in self._headers._positions)
+        return len(self._headers._positions) + extra
+
+    def copy(self) -> dict:
+        return dict(self)
+
+    def __repr__(self):
+        return f"SheetRow({dict(self)!r})"
+
+
+class SheetSnapshot:
+    """Снимок листа, полученный одним запросом get_values."""
+
+    __slots__ = ("headers", "values")
+
+    def __init__(self, values: list[list]):
+        self.headers = SheetHeaders(values[0] if values else [])
+        self.values = values[1:]
+
+    def iter_rows(self):
+        for position, row_values in enumerate(self.values):
+            yield position + 2, SheetRow(row_values, self.headers)  # +2 из-за заголовка и 1-индексации
+
+    def memory_report(self) -> dict:
+        # Сравниваем контейнеры: массивы строк снимка против list-of-dicts из get_all_records.
+        # Сами строковые значения общие для обеих схем, поэтому считаются один раз.
+        values_bytes = sum(sys.getsizeof(value) for row in self.values for value in row)
+        array_bytes = sys.getsizeof(self.values) + sum(sys.getsizeof(row) for row in self.values)
+        dict_bytes = sys.getsizeof(self.values)
+        width = len(self.headers)
+        for row in self.values:
+            padded = list(row[:width]) + [""] * max(0, width - len(row))
+            dict_bytes += sys.getsizeof(dict(zip(self.headers, padded)))
+        return {
+            "rows": len(self.values),
+            "columns": width,
+            "values_bytes": values_bytes,
+            "array_layout_bytes": array_bytes,
+            "dict_layout_bytes": dict_bytes,
+        }
+
+
+def load_sheet_snapshot() -> SheetSnapshot:
+    # Загружаем весь лист одним запросом с ретраями на случай временных сетевых ошибок
     sheet = _get_sheet_with_retry()
-    data = sheet.get_all_records()
-    headers = sheet.row_values(1)
+    with backend_slot("sheets"):
+        values = sheet.get_values(pad_values=False)
+    snapshot = SheetSnapshot(values)
+    if logging.getLogger().isEnabledFor(logging.DEBUG):
+        report = snapshot.memory_report()
+        logging.debug(
+            "📊 Снимок листа: %s строк × %s колонок; контейнеры: массивы %.1f КБ против list-of-dicts %.1f КБ (+ значения %.1f КБ)",
+            report["rows"],
+            report["columns"],
+            report["array_layout_bytes"] / 1024,
+            report["dict_layout_bytes"] / 1024,
+            report["values_bytes"] / 1024,
+        )
+    return snapshot
+
+
+def load_revised_rows():
+    snapshot = load_sheet_snapshot()
     revised_rows = []
-    for i, row in enumerate(data):
+    for row_index, row in snapshot.iter_rows():
         if str(row.get("STATUS", "")).strip().lower() == "revised (complete)":
-            revised_rows.append((i + 2, row))  # +2 из-за заголовка и 1-индексации
-    return revised_rows, headers
+            revised_rows.append((row_index, row))
+    return revised_rows, snapshot.headers
 
 def load_all_rows():
-    # Загружаем лист с ретраями на случай временных сетевых ошибок
-    sheet = _get_sheet_with_retry()
-    data = sheet.get_all_records()
-    headers = sheet.row_values(1)
-    all_rows = []
-    for i, row in enumerate(data):
-        all_rows.append((i + 2, row))  # +2 из-за заголовка
-    return all_rows, headers
+    snapshot = load_sheet_snapshot()
+    return list(snapshot.iter_rows()), snapshot.headers
 
 def update_cell(row_index, column_name, value, headers):
     # Обновляем ячейку с контролируемыми ретраями и переинициализацией клиента при необходимости
@@ -184,7 +325,8 @@ def update_cell(row_index, column_name, value, headers):
     for attempt in range(1, _update_retry_attempts + 1):
         try:
             sheet = _get_sheet_with_retry()
-            sheet.update_cell(row_index, col_index, value)
+            with backend_slot("sheets"):
+                sheet.update_cell(row_index, col_index, value)
             return
         except Exception as err:
             last_err = err
@@ -202,9 +344,210 @@ def update_cell(row_index, column_name, value, headers):
 def update_status_to_published(row_index, headers):
     update_cell(row_index, "STATUS", "Published", headers)
 
+
+def _build_row_ranges(sheet_title: str, row_index: int, cells: dict) -> list[dict]:
+    # Склеиваем соседние колонки строки в один диапазон, чтобы уменьшить размер запроса.
+    ranges = []
+    run_start = None
+    run_values = []
+    prev_col = None
+    for col_index in sorted(cells):
+        if prev_col is not None and col_index == prev_col + 1:
+            run_values.append(cells[col_index])
+        else:
+            if run_start is not None:
+                ranges.append((run_start, run_values))
+            run_start = col_index
+            run_values = [cells[col_index]]
+        prev_col = col_index
+    if run_start is not None:
+        ranges.append((run_start, run_values))
+
+    return [
+        {
+            "range": absolute_range_name(sheet_title, rowcol_to_a1(row_index, start_col)),
+            "values": [values],
+        }
+        for start_col, values in ranges
+    ]
+
+
+def batch_update_rows(updates_by_row: dict, headers) -> bool:
+    # Пишем обновления нескольких строк одним запросом values_batch_update с теми же ретраями, что и update_cell.
+    cells_by_row = {}
+    for row_index, updates in updates_by_row.items():
+        for column_name, value in (updates or {}).items():
+            if column_name not in headers:
+                logging.error(f"Ошибка при обновлении ячейки {column_name} в строке {row_index}: колонка не найдена в заголовках")
+                continue
+            col_index = headers.index(column_name) + 1
+            cells_by_row.setdefault(int(row_index), {})[col_index] = value
+
+    if not cells_by_row:
+        return True
+
+    rows_label = ", ".join(str(row_index) for row_index in sorted(cells_by_row))
+    last_err = None
+    for attempt in range(1, _update_retry_attempts + 1):
+        try:
+            sheet = _get_sheet_with_retry()
+            data = []
+            for row_index in sorted(cells_by_row):
+                data.extend(_build_row_ranges(sheet.title, row_index, cells_by_row[row_index]))
+            with backend_slot("sheets"):
+                sheet.spreadsheet.values_batch_update(
+                    {"valueInputOption": "USER_ENTERED", "data": data}
+                )
+            return True
+        except Exception as err:
+            last_err = err
+            _reset_sheet_cache()
+            if attempt < _update_retry_attempts:
+                delay = _update_retry_base_delay * (2 ** (attempt - 1))
+                logging.warning(
+                    f"⚠️ Не удалось обновить строки {rows_label} (попытка {attempt}/{_update_retry_attempts}): {err}"
+                )
+                logging.info(f"⏳ Повторная попытка обновления через {delay} сек...")
+                time.sleep(delay)
+
+    logging.error(f"Ошибка при пакетном обновлении строк {rows_label}: {last_err}")
+    return False
+
+
+def _append_to_journal(row_index, updates: dict):
+    if not _WRITE_JOURNAL_FILE:
+        return
+    try:
+        journal_dir = os.path.dirname(_WRITE_JOURNAL_FILE)
+        if journal_dir:
+            os.makedirs(journal_dir, exist_ok=True)
+        with open(_WRITE_JOURNAL_FILE, "a", encoding="utf-8") as journal:
+            for column_name, value in updates.items():
+                journal.write(
+                    json.dumps({"row": int(row_index), "column": column_name, "value": value}, ensure_ascii=False) + "\n"
+                )
+            journal.flush()
+            os.fsync(journal.fileno())
+    except Exception as exc:
+        logging.warning("⚠️ Не удалось записать журнал отложенных обновлений %s: %s", _WRITE_JOURNAL_FILE, exc)
+
+
+def _rewrite_journal(pending: dict):
+    # Журнал = текущий буфер: пусто после записи всего, иначе — только ещё не записанные ячейки.
+    if not _WRITE_JOURNAL_FILE or (not pending and not os.path.exists(_WRITE_JOURNAL_FILE)):
+        return
+    try:
+        with open(_WRITE_JOURNAL_FILE, "w", encoding="utf-8") as journal:
+            for row_index, updates in pending.items():
+                for column_name, value in updates.items():
+                    journal.write(
+                        json.dumps({"row": int(row_index), "column": column_name, "value": value}, ensure_ascii=False) + "\n"
+                    )
+            journal.flush()
+            os.fsync(journal.fileno())
+    except Exception as exc:
+        logging.warning("⚠️ Не удалось обновить журнал отложенных обновлений %s: %s", _WRITE_JOURNAL_FILE, exc)
+
+
+def _flush_timer_loop():
+    # Запись по интервалу не зависит от новых обновлений: воркер может долго ждать OpenAI/WooCommerce.
+    while not _flush_timer_stop.wait(max(0.05, min(1.0, _WRITE_FLUSH_INTERVAL_SEC))):
+        if _pending_writes and time.time() - _last_flush_ts >= _WRITE_FLUSH_INTERVAL_SEC:
+            try:
+                flush_pending_updates()
+            except Exception as exc:
+                logging.warning("⚠️ Ошибка фоновой записи отложенных обновлений: %s", exc)
+
+
+def _ensure_flush_timer():
+    global _flush_timer
+    if _WRITE_FLUSH_INTERVAL_SEC <= 0 or (_flush_timer is not None and _flush_timer.is_alive()):
+        return
+    _flush_timer_stop.clear()
+    _flush_timer = threading.Thread(target=_flush_timer_loop, name="sheets-write-behind", daemon=True)
+    _flush_timer.start()
+
+
+def _shutdown_write_behind():
+    _flush_timer_stop.set()
+    flush_pending_updates()
+
+
+def queue_cell_updates(row_index, updates: dict, headers):
+    # Кладём обновления в буфер (повторная запись в ту же ячейку перезаписывает значение) и журнал.
+    global _pending_headers
+    if not updates:
+        return
+    with _pending_lock:
+        _pending_writes.setdefault(int(row_index), {}).update(updates)
+        _pending_headers = headers
+        _append_to_journal(row_index, updates)
+    _ensure_flush_timer()
+
+
+def flush_pending_updates() -> bool:
+    # Отправляем накопленные записи одним запросом вне _pending_lock: воркеры продолжают ставить записи в буфер.
+    # При ошибке пакет возвращается в буфер, не перетирая более новые значения, журнал сохраняется.
+    global _last_flush_ts
+    with _flush_lock:
+        with _pending_lock:
+            _last_flush_ts = time.time()
+            if not _pending_writes:
+                return True
+            batch = {row_index: dict(updates) for row_index, updates in _pending_writes.items()}
+            _pending_writes.clear()
+            headers = _pending_headers or []
+        pending_count = sum(len(updates) for updates in batch.values())
+        sent = batch_update_rows(batch, headers)
+        with _pending_lock:
+            if not sent:
+                for row_index, updates in batch.items():
+                    row_updates = _pending_writes.setdefault(row_index, {})
+                    for column_name, value in updates.items():
+                        row_updates.setdefault(column_name, value)
+                logging.warning("⚠️ Отложенные обновления (%s ячеек) не записаны, повторим на следующей контрольной точке", pending_count)
+                return False
+            logging.debug("📝 Записано отложенных обновлений: %s ячеек в %s строках", pending_count, len(batch))
+            _rewrite_journal(_pending_writes)
+            return True
+
+
+def replay_write_journal() -> int:
+    # Повторяем записи, оставшиеся в журнале после аварийного завершения процесса.
+    global _pending_headers
+    if not _WRITE_JOURNAL_FILE or not os.path.exists(_WRITE_JOURNAL_FILE):
+        return 0
+    with _pending_lock:
+        replayed = 0
+        with open(_WRITE_JOURNAL_FILE, "r", encoding="utf-8") as journal:
+            for line in journal:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    logging.warning("⚠️ Пропущена повреждённая запись журнала: %s", line[:200])
+                    continue
+                _pending_writes.setdefault(int(entry["row"]), {})[entry["column"]] = entry.get("value", "")
+                replayed += 1
+        if not replayed:
+            return 0
+        logging.info("♻️ Найдено %s незаписанных обновлений в журнале, повторяем запись", replayed)
+        if _pending_headers is None:
+            _pending_headers = SheetHeaders(_get_sheet_with_retry().row_values(1))
+    flush_pending_updates()
+    return replayed
+
+
 def batch_update_cells(row_index, updates: dict, headers):
-    for key, value in updates.items():
-        update_cell(row_index, key, value, headers)
+    if _WRITE_BEHIND_ENABLED:
+        queue_cell_updates(row_index, updates, headers)
+        return True
+    return batch_update_rows({row_index: updates}, headers)
+
+
+atexit.register(_shutdown_write_behind)
 
 def get_logger():
     logging.basicConfig(level=_LOG_LEVEL, format="%(asctime)s [%(levelname)s] %(message)s")
@@ -2,6 +2,7 @@ import json
 import logging
 import os
 import re
+import tempfile
 import time
 import base64
 from io import BytesIO
@@ -14,8 +15,16 @@ from PIL import Image
 from openai import OpenAI
 from _1_google_loader import load_config, get_logger
 from _3_create_product import get_jwt_token
+from assistant_schema import race_content_text_format
+from concurrency import backend_slot
+from geocode_cache import lookup_coordinates, store_coordinates
+import http_client
+from llm_cache import lookup_response, response_cache_key, store_response
+from source_budget import fit_sources_to_budget
+from source_cache import lookup_source_text, store_source_text
 from translation_prompt import build_translation_messages
 from url_utils import normalize_http_url
+import run_metrics
 
 logger = get_logger()
 config = load_config()
@@ -37,7 +46,7 @@ def _parse_retry_delays(value: str | None) -> list[float]:
             logger.warning("⚠️ Некорректное значение задержки ретрая: %s", item)
     return delays
 
-def _build_request_headers() -> dict:
+def source_request_headers() -> dict:
     user_agent = config.get("fetch_user_agent") or "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0 Safari/537.36"
     return {
         "User-Agent": user_agent,
@@ -56,7 +65,7 @@ def _parse_insecure_hosts(value: str | None) -> set[str]:
         hosts.add(item)
     return hosts
 
-def _resolve_requests_verify(url: str):
+def source_fetch_verify(url: str):
     parsed = urlparse(url)
     host = (parsed.hostname or "").lower()
     insecure_hosts = _parse_insecure_hosts(config.get("fetch_insecure_hosts"))
@@ -65,24 +74,36 @@ def _resolve_requests_verify(url: str):
         return False
     return os.getenv("REQUESTS_CA_BUNDLE") or os.getenv("SSL_CERT_FILE") or True
 
-def _fetch_with_retries(url: str):
-    delays = _parse_retry_delays(config.get("fetch_retry_delays_sec"))
-    attempts = [0.0] + delays
+def source_fetch_attempts() -> list[float]:
+    """Задержки перед каждой попыткой загрузки источника: первая без ожидания, затем FETCH_RETRY_DELAYS_SEC."""
+    return [0.0] + _parse_retry_delays(config.get("fetch_retry_delays_sec"))
+
+def _fetch_with_retries(url: str, read_response):
+    """Загружает url потоково и отдаёт ответ в read_response(response) в рамках той же попытки.
+
+    Обрыв соединения посреди тела повторяется так же, как ошибка запроса.
+    """
+    attempts = source_fetch_attempts()
     last_err = None
     for attempt_index, delay in enumerate(attempts, start=1):
         if delay:
             logger.info("⏳ Повторная попытка загрузки через %s сек...", delay)
             time.sleep(delay)
         try:
-            verify = _resolve_requests_verify(url)
-            response = requests.get(
-                url,
-                headers=_build_request_headers(),
-                timeout=20,
-                verify=verify
-            )
-            response.raise_for_status()
-            return response
+            verify = source_fetch_verify(url)
+            with backend_slot("website"):
+                response = requests.get(
+                    url,
+                    headers=source_request_headers(),
+                    timeout=20,
+                    verify=verify,
+                    stream=True
+                )
+                try:
+                    response.raise_for_status()
+                    return read_response(response)
+                finally:
+                    response.close()
         except Exception as exc:
             last_err = exc
             logger.warning(
@@ -95,6 +116,10 @@ def _fetch_with_retries(url: str):
     raise last_err
 
 
+# full_path -> (mtime_ns, size, текст): промпт читается с диска один раз и перечитывается после правки файла.
+_PROMPT_CACHE: dict[str, tuple[int, int, str]] = {}
+
+
 def _load_prompt_file(path: str) -> str:
     if not path:
         return ""
@@ -104,8 +129,14 @@ def _load_prompt_file(path: str) -> str:
         full_path = os.path.join(os.path.dirname(__file__), path)
 
     try:
+        stat = os.stat(full_path)
+        cached = _PROMPT_CACHE.get(full_path)
+        if cached and cached[0] == stat.st_mtime_ns and cached[1] == stat.st_size:
+            return cached[2]
         with open(full_path, "r", encoding="utf-8") as prompt_file:
-            return prompt_file.read().strip()
+            text = prompt_file.read().strip()
+        _PROMPT_CACHE[full_path] = (stat.st_mtime_ns, stat.st_size, text)
+        return text
     except FileNotFoundError:
         logger.error("❌ Не найден файл промпта: %s", full_path)
     except Exception as exc:
@@ -132,57 +163,197 @@ def convert_google_drive_url(url):
     # Если это не Google Drive ссылка, возвращаем исходную
     return url
 
+def resolve_source_url(url: str) -> str:
+    """Нормализует URL источника и преобразует ссылку Google Drive в прямую; '' для пустого URL."""
+    normalized_url = normalize_http_url(url)
+    if not normalized_url:
+        return ""
+    return convert_google_drive_url(normalized_url)
+
+
+def is_pdf_source_url(direct_url: str) -> bool:
+    return direct_url.lower().endswith(".pdf") or "drive.google.com/uc?export=download" in direct_url
+
+
+SOURCE_STREAM_CHUNK_BYTES = 64 * 1024
+PDF_MAGIC = b"%PDF-"
+
+
+def source_fetch_max_bytes() -> int:
+    return int(config.get("fetch_max_bytes") or 50 * 1024 * 1024)
+
+
+def _charset_from_content_type(content_type: str) -> str | None:
+    for part in content_type.split(";")[1:]:
+        key, _, value = part.partition("=")
+        if key.strip().lower() == "charset" and value.strip():
+            return value.strip().strip('"\'')
+    return None
+
+
+class SourceBodyReader:
+    """Потоковый разбор тела источника (сайт или регламент).
+
+    Тело подаётся кусками через feed(); feed() возвращает False, когда дальше
+    читать не нужно. Тип определяется по первым байтам (%PDF-) для любой
+    ссылки, а не по её окончанию: PDF пишется сразу в уникальный временный
+    файл, остальное копится как HTML. Размер тела ограничен max_bytes: HTML
+    обрезается (текст всё равно укорачивается перед отправкой в модель),
+    слишком большой PDF отбрасывается.
+    finish() возвращает (текст страницы, None) или ("", путь к PDF).
+    """
+
+    def __init__(self, url: str, direct_url: str, headers, status_code=None, max_bytes: int | None = None):
+        self.url = url
+        self.direct_url = direct_url
+        self.content_type = (headers.get("content-type") or "").lower()
+        self.status_code = status_code
+        self.max_bytes = max_bytes or source_fetch_max_bytes()
+        self.is_pdf = None
+        self.size = 0
+        self._head = b""
+        self._chunks = []
+        self._pdf_file = None
+        self._done = False
+        self._rejected = False
+        self._truncated = False
+
+        if "drive.google.com" in direct_url and is_pdf_source_url(direct_url) and "text/html" in self.content_type:
+            # Google Drive вместо файла отдаёт HTML-обёртку (нет публичного доступа / предупреждение о вирусах)
+            logger.warning(f"⚠️ Google Drive файл может быть недоступен для публичного скачивания: {url}")
+            logger.warning("⚠️ Убедитесь, что файл имеет публичный доступ")
+            self._reject()
+
+    def _reject(self):
+        self._rejected = True
+        self._done = True
+        self.discard()
+
+    def _detect_type(self):
+        self.is_pdf = self._head.startswith(PDF_MAGIC)
+        if self.is_pdf:
+            # Уникальный файл на каждую загрузку: события обрабатываются параллельно.
+            self._pdf_file = tempfile.NamedTemporaryFile(prefix="regulations_", suffix=".pdf", delete=False)
+
+    def feed(self, chunk: bytes) -> bool:
+        if self._done or not chunk:
+            return not self._done
+        if self.is_pdf is None:
+            self._head += chunk
+            if len(self._head) < len(PDF_MAGIC):
+                return True
+            self._detect_type()
+            chunk, self._head = self._head, b""
+
+        remaining = self.max_bytes - self.size
+        if len(chunk) > remaining:
+            if self.is_pdf:
+                logger.warning(
+                    "⚠️ PDF %s больше лимита HTTP_FETCH_MAX_BYTES (%s байт) — пропускаем файл",
+                    self.url,
+                    self.max_bytes
+                )
+                self._reject()
+                return False
+            chunk = chunk[:remaining]
+            self._truncated = True
+            self._done = True
+        self.size += len(chunk)
+
+        if self.is_pdf:
+            self._pdf_file.write(chunk)
+        else:
+            self._chunks.append(chunk)
+        return not self._done
+
+    def discard(self):
+        if self._pdf_file is not None:
+            self._pdf_file.close()
+            os.remove(self._pdf_file.name)
+            self._pdf_file = None
+        self._chunks = []
+
+    def finish(self):
+        if self._rejected:
+            return "", None
+        if self.is_pdf is None:
+            # Тело короче сигнатуры — это точно не PDF
+            self.is_pdf = False
+            self._chunks, self.size, self._head = [self._head], len(self._head), b""
+        if self.is_pdf:
+            self._pdf_file.close()
+            pdf_path = self._pdf_file.name
+            self._pdf_file = None
+            logger.info(f"📄 Обнаружен PDF: {self.url}")
+            return "", pdf_path
+
+        # Для обычных веб-страниц
+        body = b"".join(self._chunks)
+        self._chunks = []
+        if self._truncated:
+            logger.warning(
+                "⚠️ Страница %s больше лимита HTTP_FETCH_MAX_BYTES (%s байт) — разбираем только начало",
+                self.url,
+                self.max_bytes
+            )
+        charset = _charset_from_content_type(self.content_type)
+        markup = body
+        if charset:
+            try:
+                markup = body.decode(charset, errors="replace")
+            except LookupError:
+                markup = body
+        # Без charset в заголовке кодировку определяет BeautifulSoup (meta charset / BOM).
+        soup = BeautifulSoup(markup, 'html.parser')
+        text = soup.get_text(separator=' ', strip=True)
+        logger.info("🌐 Обработан сайт: %s", self.url)
+        logger.debug(
+            "🌐 Метаданные сайта: status=%s, content-type=%s, bytes=%s, text_len=%s",
+            self.status_code,
+            self.content_type,
+            self.size,
+            len(text.strip())
+        )
+        return text.strip(), None
+
+
+def _read_source_response(url: str, direct_url: str, response):
+    reader = SourceBodyReader(url, direct_url, response.headers, response.status_code)
+    try:
+        for chunk in response.iter_content(chunk_size=SOURCE_STREAM_CHUNK_BYTES):
+            if not reader.feed(chunk):
+                break
+        return reader.finish()
+    except BaseException:
+        reader.discard()
+        raise
+
+
 def extract_text_from_url(url):
     try:
         # Преобразуем Google Drive ссылку в прямую ссылку, если необходимо
-        normalized_url = normalize_http_url(url)
-        if not normalized_url:
+        direct_url = resolve_source_url(url)
+        if not direct_url:
             logger.warning("⚠️ Пустой URL, пропускаем загрузку")
             return "", None
-        direct_url = convert_google_drive_url(normalized_url)
-        
-        if direct_url.lower().endswith(".pdf") or "drive.google.com/uc?export=download" in direct_url:
-            # Для PDF файлов (включая Google Drive)
-            response = _fetch_with_retries(direct_url)
-            
-            # Проверяем, что получили именно PDF, а не HTML страницу (обёртка/ошибка)
-            content_type = response.headers.get('content-type', '').lower()
-            if 'text/html' in content_type and 'drive.google.com' in direct_url:
-                logger.warning(f"⚠️ Google Drive файл может быть недоступен для публичного скачивания: {url}")
-                logger.warning("⚠️ Убедитесь, что файл имеет публичный доступ")
-                return "", None
-            is_pdf_bytes = response.content[:5] == b"%PDF-"
-            if 'text/html' in content_type or not is_pdf_bytes:
-                logger.warning(
-                    "⚠️ Ожидался PDF, но получен не-PDF контент (content-type=%s) для %s — пропускаем загрузку файла",
-                    content_type,
-                    url
-                )
-                return "", None
-            
-            pdf_path = "/tmp/temp.pdf"
-            with open(pdf_path, "wb") as f:
-                f.write(response.content)
-            logger.info(f"📄 Обнаружен PDF: {url}")
-            return "", pdf_path
-        else:
-            # Для обычных веб-страниц
-            response = _fetch_with_retries(direct_url)
-            soup = BeautifulSoup(response.text, 'html.parser')
-            text = soup.get_text(separator=' ', strip=True)
-            logger.info("🌐 Обработан сайт: %s", url)
-            logger.debug(
-                "🌐 Метаданные сайта: status=%s, content-type=%s, text_len=%s",
-                response.status_code,
-                response.headers.get("content-type", ""),
-                len(text.strip())
-            )
-            return text.strip(), None
+        cached_text = lookup_source_text(direct_url)
+        if cached_text is not None:
+            logger.info("📦 Текст источника взят из кеша: %s", url)
+            return cached_text, None
+        text, pdf_path = _fetch_with_retries(
+            direct_url,
+            lambda response: _read_source_response(url, direct_url, response)
+        )
+        if not pdf_path:
+            store_source_text(direct_url, text)
+        return text, pdf_path
     except Exception as e:
         logger.error(f"❌ Ошибка загрузки из {url}: {e}")
         return "", None
 
 def build_first_assistant_prompt(regulations_url: str, regulations_text: str, website_text: str) -> str:
+    # Вместо обрезки готового промпта: без повторов и шума, самое полезное в пределах SOURCE_TOKEN_BUDGET.
+    regulations_text, website_text = fit_sources_to_budget(regulations_text, website_text)
     parts = []
     if regulations_url:
         parts.append(f"REGULATIONS LINK:\n{regulations_url}")
@@ -235,6 +406,114 @@ def normalize_regulations_link_block(payload: dict, regulations_url: str) -> dic
         payload["org_info_pt"] = "\n".join(lines)
     return payload
 
+# Детерминированная часть second_system.txt: в однопроходном режиме (OPENAI_SINGLE_PASS)
+# эти правила применяет clean_assistant_result вместо второго ассистента.
+_ORG_INFO_HEADINGS = {
+    "age categories/divisions",
+    "start/finish locations",
+    "start times per category/distance",
+    "cut-off times",
+    "bib pick-up time and location",
+    "participants limit",
+    "participant limit",
+    "registration deadline",
+    "surface types",
+    "course format",
+    "race routes",
+    "timing method",
+    "toilets and aid station placement",
+    "parking and shuttle details",
+    "drop bag policy",
+    "prizes",
+    "escalões/categorias",
+    "locais de partida/chegada",
+    "horários de partida por categoria/distância",
+    "tempos limite",
+    "levantamento de dorsais (data/hora e local)",
+    "limite de participantes",
+    "prazo de inscrição",
+    "tipos de piso",
+    "formato do percurso",
+    "percursos da prova",
+    "método de cronometragem",
+    "wc e localização dos abastecimentos",
+    "estacionamento e shuttles",
+    "política de saco de atleta (drop bag)",
+    "prémios",
+}
+_REGULATIONS_LINK_LABELS = ("Regulation link", "Regulamento ↗")
+_HEADING_RE = re.compile(r"^\s*<strong>(.*?)</strong>(.*)$", re.IGNORECASE | re.DOTALL)
+_PLACEHOLDER_RE = re.compile(
+    r"(?:^|[\s:>–-])(?:not\s+(?:explicitly\s+)?(?:specified|provided|stated|available|mentioned)"
+    r"|n[ãa]o\s+(?:especificad[oa]s?|indicad[oa]s?|dispon[ií]vel|mencionad[oa]s?|fornecid[oa]s?))"
+    r"\.?\s*(?:</strong>)?\s*$",
+    re.IGNORECASE,
+)
+
+
+def _is_placeholder_line(line: str) -> bool:
+    stripped = line.strip()
+    return stripped == "[]" or bool(_PLACEHOLDER_RE.search(stripped))
+
+
+def _is_allowed_heading(heading: str) -> bool:
+    normalized = re.sub(r"<[^>]+>", "", heading).strip().rstrip(":").strip().lower()
+    # Маршруты модель подписывает по дистанциям («Half Marathon 21,1 km ROUTE»).
+    return normalized in _ORG_INFO_HEADINGS or "route" in normalized or "percurso" in normalized
+
+
+def _clean_org_info(org_info: str, regulations_url: str) -> str:
+    blocks = []
+    link_block = None
+    for raw_block in re.split(r"\n\s*\n", org_info.replace("\r\n", "\n")):
+        lines = [line for line in raw_block.split("\n") if line.strip() and not _is_placeholder_line(line)]
+        if not lines:
+            continue
+        if any(label in lines[0] for label in _REGULATIONS_LINK_LABELS):
+            if regulations_url and link_block is None:
+                link_block = "\n".join(lines)
+            continue
+        heading = _HEADING_RE.match(lines[0])
+        if heading:
+            if not _is_allowed_heading(heading.group(1)):
+                continue
+            if not heading.group(2).strip() and len(lines) == 1:
+                continue
+        blocks.append("\n".join(lines))
+    if link_block:
+        blocks.insert(0, link_block)
+    return "\n\n".join(blocks)
+
+
+def _clean_benefits(benefits):
+    if isinstance(benefits, list):
+        return [item for item in benefits if isinstance(item, str) and item.strip() and not _is_placeholder_line(item)]
+    if isinstance(benefits, str):
+        return "\n".join(line for line in benefits.split("\n") if line.strip() and not _is_placeholder_line(line))
+    return benefits
+
+
+def clean_assistant_result(payload: dict, regulations_url: str) -> dict:
+    """Удаляет заглушки «Not specified», пустые и недопустимые блоки org_info, «[]» в benefits.
+
+    Без REGULATIONS LINK блок ссылки на регламент удаляется, с ним — ставится первым.
+    summary, faq, cancellation, image_prompt и организатор не меняются.
+    """
+    if not isinstance(payload, dict):
+        return payload
+    for key in ("org_info", "org_info_pt"):
+        if isinstance(payload.get(key), str):
+            payload[key] = _clean_org_info(payload[key], regulations_url)
+    for key in ("benefits", "benefits_pt"):
+        if key in payload:
+            payload[key] = _clean_benefits(payload[key])
+    return normalize_regulations_link_block(payload, regulations_url)
+
+
+TITLE_TRANSLATION_MODEL = "gpt-4o-mini"
+TITLE_TRANSLATION_TEMPERATURE = 0.3
+
+
 def translate_title_to_en(title: str) -> str:
     """
     Переводит заголовок с португальского на английский через GPT.
@@ -242,11 +521,12 @@ def translate_title_to_en(title: str) -> str:
     if not title:
         return ""
     try:
-        response = openai.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=build_translation_messages(title),
-            temperature=0.3
-        )
+        with backend_slot("openai"):
+            response = openai.chat.completions.create(
+                model=TITLE_TRANSLATION_MODEL,
+                messages=build_translation_messages(title),
+                temperature=TITLE_TRANSLATION_TEMPERATURE
+            )
         en_title = response.choices[0].message.content.strip()
         logger.info(f"🌍 Переведён заголовок (PT→EN): '{title}' → '{en_title}'")
         return en_title
@@ -254,152 +534,261 @@ def translate_title_to_en(title: str) -> str:
         logger.error(f"❌ Ошибка при переводе заголовка: {e}")
         return ""
 
-def call_openai_assistant(text, file_ids=None):
+def _first_system_prompt(single_pass: bool = False) -> str:
+    system_prompt = _load_prompt_file(config.get("openai_system_prompt_file"))
+    if single_pass:
+        rules = _load_prompt_file(config.get("openai_single_pass_prompt_file"))
+        if rules:
+            system_prompt = f"{system_prompt}\n\n{rules}" if system_prompt else rules
+    return system_prompt
+
+
+def _first_assistant_cache_key(text, file_ids=None, single_pass: bool = False) -> str:
+    return response_cache_key(
+        config.get("openai_text_model"),
+        config.get("openai_text_reasoning_effort"),
+        config.get("openai_text_temperature"),
+        _first_system_prompt(single_pass),
+        text,
+        file_ids,
+    )
+
+
+def _apply_sampling_options(request_kwargs: dict, reasoning_effort, temperature, step_label: str):
+    model = request_kwargs["model"]
+    if reasoning_effort:
+        logger.info("🧠 Уровень размышления для %s: %s", step_label, reasoning_effort)
+        request_kwargs["reasoning"] = {"effort": reasoning_effort}
+    if temperature:
+        lowered_model = (model or "").lower()
+        if lowered_model.startswith(("gpt-5", "o1")):
+            logger.info("🌡️ Температура для %s пропущена для модели: %s", step_label, model)
+        else:
+            request_kwargs["temperature"] = float(temperature)
+            logger.info("🌡️ Температура для %s: %s", step_label, temperature)
+
+
+_STRICT_JSON_NOTE = "СТРОГО: Верни только валидный завершённый JSON без обрезанных строк, без текста вне JSON."
+
+
+def _build_first_assistant_request(text, file_ids=None, attempt: int = 1, single_pass: bool = False) -> dict:
+    model = config["openai_text_model"]
+    system_prompt = _first_system_prompt(single_pass)
+    user_prompt = text
+
+    if system_prompt:
+        logger.debug("🧾 System промпт (до 10000 символов):\n%s", system_prompt[:10000])
+    logger.debug("🧾 User промпт (до 40000 символов):\n%s", user_prompt[:40000])
+    if file_ids:
+        logger.info("📎 Файлы для OpenAI: %s", ", ".join(file_ids))
+
+    user_content = [{"type": "input_text", "text": user_prompt}]
+    for file_id in file_ids or []:
+        user_content.append({"type": "input_file", "file_id": file_id})
+    if attempt > 1:
+        # Напоминание о формате — в конце user-сообщения: system-промпт остаётся побайтно
+        # одинаковым во всех запросах и попадает в кеш префикса на стороне OpenAI.
+        user_content.append({"type": "input_text", "text": _STRICT_JSON_NOTE})
+
+    input_payload = []
+    if system_prompt:
+        input_payload.append(
+            {"role": "system", "content": [{"type": "input_text", "text": system_prompt}]}
+        )
+    input_payload.append({"role": "user", "content": user_content})
+
+    request_kwargs = {
+        "model": model,
+        "input": input_payload,
+    }
+    if config.get("openai_structured_output"):
+        request_kwargs["text"] = race_content_text_format("race_content_first")
+    _apply_sampling_options(
+        request_kwargs,
+        config.get("openai_text_reasoning_effort"),
+        config.get("openai_text_temperature"),
+        "текста",
+    )
+    return request_kwargs
+
+
+def _create_response(request_kwargs: dict):
+    try:
+        with backend_slot("openai"):
+            return _OPENAI_CLIENT.responses.create(**request_kwargs)
+    except Exception as e:
+        message = str(e)
+        if "Unsupported parameter: 'temperature'" in message and "temperature" in request_kwargs:
+            logger.warning("⚠️ Модель не поддерживает temperature, повторяем без неё.")
+            request_kwargs.pop("temperature", None)
+            with backend_slot("openai"):
+                return _OPENAI_CLIENT.responses.create(**request_kwargs)
+        raise
+
+
+def _record_usage(response, retry: bool):
+    # Токены по запуску; повторные попытки считаем отдельно, чтобы видеть цену повторов.
+    usage = getattr(response, "usage", None)
+    input_tokens = getattr(usage, "input_tokens", 0) or 0
+    output_tokens = getattr(usage, "output_tokens", 0) or 0
+    cached_tokens = getattr(getattr(usage, "input_tokens_details", None), "cached_tokens", 0) or 0
+    run_metrics.increment("openai_input_tokens", input_tokens)
+    run_metrics.increment("openai_cached_input_tokens", cached_tokens)
+    run_metrics.increment("openai_output_tokens", output_tokens)
+    if input_tokens:
+        logger.debug("🧮 Токены OpenAI: вход %s (из кеша префикса %s), выход %s", input_tokens, cached_tokens, output_tokens)
+    if retry:
+        run_metrics.increment("openai_retries")
+        run_metrics.increment("openai_retry_tokens", input_tokens + output_tokens)
+
+
+def _response_reply(response) -> str:
+    if getattr(response, "status", None) == "incomplete":
+        details = getattr(response, "incomplete_details", None)
+        logger.warning("⚠️ Ответ OpenAI обрезан (status=incomplete, reason=%s)", getattr(details, "reason", None))
+    return response.output_text or ""
+
+
+def first_assistant_batch_request(text, file_ids=None, single_pass: bool = False):
+    """(ключ кеша ответов, тело запроса Responses API) первого ассистента — для OpenAI Batch."""
+    return (
+        _first_assistant_cache_key(text, file_ids, single_pass),
+        _build_first_assistant_request(text, file_ids, single_pass=single_pass),
+    )
+
+
+def call_openai_assistant(text, file_ids=None, use_cache=True, single_pass: bool = False):
+    """
+    Первый ассистент. single_pass=True добавляет к system-промпту правила второго
+    ассистента (OPENAI_SINGLE_PASS): ответ после clean_assistant_result публикуется сразу.
+    """
+    cache_key = _first_assistant_cache_key(text, file_ids, single_pass)
+    if use_cache:
+        cached = lookup_response(cache_key)
+        if cached is not None:
+            logger.info("💾 Ответ первого ассистента взят из кеша")
+            return cached
+
     max_attempts = 3
     for attempt in range(1, max_attempts + 1):
         try:
-            model = config["openai_text_model"]
-            system_prompt = _load_prompt_file(config["openai_system_prompt_file"])
-            user_prompt = text
-
-            logger.info("🤖 Отправка в OpenAI Responses API, модель: %s", model)
-            if system_prompt:
-                logger.debug("🧾 System промпт (до 10000 символов):\n%s", system_prompt[:10000])
-            logger.debug("🧾 User промпт (до 40000 символов):\n%s", user_prompt[:40000])
-            if file_ids:
-                logger.info("📎 Файлы для OpenAI: %s", ", ".join(file_ids))
-
-            user_content = [{"type": "input_text", "text": user_prompt[:40000]}]
-            for file_id in file_ids or []:
-                user_content.append({"type": "input_file", "file_id": file_id})
-
-            input_payload = []
-            if system_prompt:
-                strict_note = ""
-                if attempt > 1:
-                    strict_note = "\n\nСТРОГО: Верни только валидный завершённый JSON без обрезанных строк, без текста вне JSON."
-                input_payload.append(
-                    {"role": "system", "content": [{"type": "input_text", "text": system_prompt + strict_note}]}
-                )
-            input_payload.append({"role": "user", "content": user_content})
+            request_kwargs = _build_first_assistant_request(text, file_ids, attempt, single_pass)
+            logger.info("🤖 Отправка в OpenAI Responses API, модель: %s", request_kwargs["model"])
+            response = _create_response(request_kwargs)
+            _record_usage(response, retry=attempt > 1)
 
-            request_kwargs = {
-                "model": model,
-                "input": input_payload,
-            }
-            reasoning_effort = config.get("openai_text_reasoning_effort")
-            if reasoning_effort:
-                logger.info("🧠 Уровень размышления для текста: %s", reasoning_effort)
-                request_kwargs["reasoning"] = {"effort": reasoning_effort}
-            temperature = config.get("openai_text_temperature")
-            if temperature:
-                lowered_model = (model or "").lower()
-                if lowered_model.startswith(("gpt-5", "o1")):
-                    logger.info("🌡️ Температура для текста пропущена для модели: %s", model)
-                else:
-                    request_kwargs["temperature"] = float(temperature)
-                    logger.info("🌡️ Температура для текста: %s", temperature)
-
-            try:
-                response = _OPENAI_CLIENT.responses.create(**request_kwargs)
-            except Exception as e:
-                message = str(e)
-                if "Unsupported parameter: 'temperature'" in message and "temperature" in request_kwargs:
-                    logger.warning("⚠️ Модель не поддерживает temperature, повторяем без неё.")
-                    request_kwargs.pop("temperature", None)
-                    response = _OPENAI_CLIENT.responses.create(**request_kwargs)
-                else:
-                    raise
-
-            reply = response.output_text or ""
+            reply = _response_reply(response)
             try:
-                return json.loads(reply)
+                result = json.loads(reply)
             except json.JSONDecodeError:
                 logger.error("❌ Ответ OpenAI не является JSON: %s", reply[:2000])
                 if attempt == max_attempts:
                     raise ValueError("Ответ OpenAI не является JSON")
                 continue
+            store_response(cache_key, result)
+            return result
 
         except Exception as e:
             logger.error("❌ Ошибка OpenAI Responses API (попытка %s/%s): %s", attempt, max_attempts, e)
             if attempt == max_attempts:
                 return None
 
-def call_second_openai_assistant(first_result, regulations_hint: str | None = None):
+
+def _second_assistant_user_prompt(first_result, regulations_hint: str | None) -> str:
+    if isinstance(first_result, dict):
+        text_content = json.dumps(first_result, ensure_ascii=False, indent=2)
+    else:
+        text_content = str(first_result)
+    if regulations_hint:
+        return f"{regulations_hint}\n{text_content}"
+    return text_content
+
+
+def _second_assistant_cache_key(user_prompt: str) -> str:
+    return response_cache_key(
+        config.get("openai_second_model"),
+        config.get("openai_second_reasoning_effort"),
+        config.get("openai_second_temperature"),
+        _load_prompt_file(config.get("openai_second_system_prompt_file")),
+        user_prompt[:40000],
+    )
+
+
+def _build_second_assistant_request(user_prompt: str) -> dict:
+    model = config["openai_second_model"]
+    system_prompt = _load_prompt_file(config["openai_second_system_prompt_file"])
+    logger.debug("📤 Второй промпт (до 40000 символов):\n%s", user_prompt[:40000])
+
+    input_payload = []
+    if system_prompt:
+        input_payload.append(
+            {"role": "system", "content": [{"type": "input_text", "text": system_prompt}]}
+        )
+    input_payload.append(
+        {"role": "user", "content": [{"type": "input_text", "text": user_prompt[:40000]}]}
+    )
+
+    request_kwargs = {
+        "model": model,
+        "input": input_payload,
+    }
+    if config.get("openai_structured_output"):
+        request_kwargs["text"] = race_content_text_format("race_content_second")
+    _apply_sampling_options(
+        request_kwargs,
+        config.get("openai_second_reasoning_effort"),
+        config.get("openai_second_temperature"),
+        "второго шага",
+    )
+    return request_kwargs
+
+
+def second_assistant_batch_request(first_result, regulations_hint: str | None = None):
+    """(ключ кеша ответов, тело запроса Responses API) второго ассистента — для OpenAI Batch."""
+    user_prompt = _second_assistant_user_prompt(first_result, regulations_hint)
+    return _second_assistant_cache_key(user_prompt), _build_second_assistant_request(user_prompt)
+
+
+def call_second_openai_assistant(first_result, regulations_hint: str | None = None, use_cache=True, retry=False):
     """
     Вызывает второй запрос OpenAI Responses API с результатом первого ассистента.
+    retry=True — повтор по решению вызывающего (например, пропущены PT-поля): учитывается в метриках повторов.
     """
+    user_prompt = _second_assistant_user_prompt(first_result, regulations_hint)
+    cache_key = _second_assistant_cache_key(user_prompt)
+    if use_cache:
+        cached = lookup_response(cache_key)
+        if cached is not None:
+            logger.info("💾 Ответ второго ассистента взят из кеша")
+            return cached
+
     max_attempts = 3
     for attempt in range(1, max_attempts + 1):
         try:
-            model = config["openai_second_model"]
-            system_prompt = _load_prompt_file(config["openai_second_system_prompt_file"])
-            if isinstance(first_result, dict):
-                text_content = json.dumps(first_result, ensure_ascii=False, indent=2)
-            else:
-                text_content = str(first_result)
-            if regulations_hint:
-                user_prompt = f"{regulations_hint}\n{text_content}"
-            else:
-                user_prompt = text_content
-
-            logger.info("🤖 Отправка во второй Responses API, модель: %s", model)
-            logger.debug("📤 Второй промпт (до 40000 символов):\n%s", user_prompt[:40000])
-
-            input_payload = []
-            if system_prompt:
-                input_payload.append(
-                    {"role": "system", "content": [{"type": "input_text", "text": system_prompt}]}
-                )
-            input_payload.append(
-                {"role": "user", "content": [{"type": "input_text", "text": user_prompt[:40000]}]}
-            )
+            request_kwargs = _build_second_assistant_request(user_prompt)
+            logger.info("🤖 Отправка во второй Responses API, модель: %s", request_kwargs["model"])
+            response = _create_response(request_kwargs)
+            _record_usage(response, retry=retry or attempt > 1)
 
-            request_kwargs = {
-                "model": model,
-                "input": input_payload,
-            }
-            reasoning_effort = config.get("openai_second_reasoning_effort")
-            if reasoning_effort:
-                logger.info("🧠 Уровень размышления для второго шага: %s", reasoning_effort)
-                request_kwargs["reasoning"] = {"effort": reasoning_effort}
-            temperature = config.get("openai_second_temperature")
-            if temperature:
-                lowered_model = (model or "").lower()
-                if lowered_model.startswith(("gpt-5", "o1")):
-                    logger.info("🌡️ Температура для второго шага пропущена для модели: %s", model)
-                else:
-                    request_kwargs["temperature"] = float(temperature)
-                    logger.info("🌡️ Температура для второго шага: %s", temperature)
-
-            try:
-                response = _OPENAI_CLIENT.responses.create(**request_kwargs)
-            except Exception as e:
-                message = str(e)
-                if "Unsupported parameter: 'temperature'" in message and "temperature" in request_kwargs:
-                    logger.warning("⚠️ Модель не поддерживает temperature, повторяем без неё.")
-                    request_kwargs.pop("temperature", None)
-                    response = _OPENAI_CLIENT.responses.create(**request_kwargs)
-                else:
-                    raise
-
-            reply = response.output_text or ""
+            reply = _response_reply(response)
             try:
-                return json.loads(reply)
+                result = json.loads(reply)
             except json.JSONDecodeError:
                 logger.error("❌ Ответ второго OpenAI не является JSON: %s", reply[:2000])
                 raise ValueError("Ответ второго OpenAI не является JSON")
+            store_response(cache_key, result)
+            return result
 
         except Exception as e:
             logger.error("❌ Ошибка второго OpenAI Responses API (попытка %s/%s): %s", attempt, max_attempts, e)
             if attempt == max_attempts:
                 return None
 
-def get_coordinates_from_location(location: str):
-    if not location:
-        return None, None
+OPENCAGE_URL = "https://api.opencagedata.com/geocode/v1/json"
+
 
-    params = {
+def opencage_params(location: str) -> dict:
+    return {
         "q": location,
         "key": OPENCAGE_API_KEY,
         "language": "en",
@@ -408,16 +797,10 @@ def get_coordinates_from_location(location: str):
         "no_annotations": 1,
     }
 
-    try:
-        response = requests.get("https://api.opencagedata.com/geocode/v1/json", params=params, timeout=15)
-        response.raise_for_status()
-    except Exception as exc:
-        logger.error("❌ Ошибка запроса координат для '%s': %s", location, exc)
-        return None, None
 
-    data = response.json()
-    results = data.get("results", [])
-    for result in results:
+def pick_portugal_coordinates(location: str, data: dict):
+    """Первые координаты в Португалии из ответа OpenCage; результат (в т.ч. промах) кладётся в кеш."""
+    for result in data.get("results", []):
         components = result.get("components", {})
         if components.get("country_code") != "pt":
             continue
@@ -425,12 +808,34 @@ def get_coordinates_from_location(location: str):
         lat = geometry.get("lat")
         lon = geometry.get("lng")
         if lat is not None and lon is not None:
+            store_coordinates(location, lat, lon)
             return lat, lon
 
     logger.warning("⚠️ Не удалось найти координаты в Португалии для '%s'", location)
+    store_coordinates(location, None, None)
     return None, None
 
 
+def get_coordinates_from_location(location: str):
+    if not location:
+        return None, None
+
+    cached = lookup_coordinates(location)
+    if cached is not None:
+        logger.debug("📍 Координаты для '%s' взяты из кеша: %s", location, cached)
+        return cached
+
+    try:
+        with backend_slot("opencage"):
+            response = requests.get(OPENCAGE_URL, params=opencage_params(location), timeout=15)
+        response.raise_for_status()
+    except Exception as exc:
+        logger.error("❌ Ошибка запроса координат для '%s': %s", location, exc)
+        return None, None
+
+    return pick_portugal_coordinates(location, response.json())
+
+
 def get_coordinates_with_city_fallback(location: str, location_city: str):
     lat, lon = get_coordinates_from_location(location)
     if lat is not None and lon is not None:
@@ -456,14 +861,16 @@ def check_wp_upload(jwt_token):
     )
 
     try:
-        response = requests.post(wp_url, headers=headers, files={"file": ("test.png", minimal_png)})
+        with backend_slot("woocommerce"):
+            response = http_client.post(wp_url, headers=headers, files={"file": ("test.png", minimal_png)})
         if response.status_code == 201:
             media_id = response.json().get("id")
             logger.info(f"✅ Проверка загрузки в WP успешна, media ID: {media_id}")
 
             # Удаляем тестовый файл сразу
             delete_url = f"{wp_url}/{media_id}?force=true"
-            del_resp = requests.delete(delete_url, headers={"Authorization": f"Bearer {jwt_token}"})
+            with backend_slot("woocommerce"):
+                del_resp = http_client.delete(delete_url, headers={"Authorization": f"Bearer {jwt_token}"})
             if del_resp.status_code == 200:
                 logger.info("🗑️ Тестовый файл удалён из WP")
             else:
@@ -491,7 +898,8 @@ def generate_image(prompt):
                 "Content-Disposition": f"attachment; filename={filename}"
             }
 
-            response = requests.post(wp_url, headers=headers, files={"file": (filename, image_bytes)})
+            with backend_slot("woocommerce"):
+                response = http_client.post(wp_url, headers=headers, files={"file": (filename, image_bytes)})
             response.raise_for_status()
             wp_response = response.json()
             logger.info(f"🖼️ Загружено в WP: {wp_response.get('source_url')}")
@@ -514,11 +922,12 @@ def generate_image(prompt):
             "size": "1024x1024"
         }
 
-        response = openai.images.generate(**kwargs)
+        with backend_slot("openai"):
+            response = openai.images.generate(**kwargs)
         data = response.data[0]
 
         if hasattr(data, "url") and data.url:
-            image_response = requests.get(data.url)
+            image_response = http_client.get(data.url)
             image_response.raise_for_status()
             image_bytes = image_response.content
         elif hasattr(data, "b64_json") and data.b64_json:
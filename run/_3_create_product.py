@@ -3,6 +3,8 @@ import requests
 import base64
 import os
 import datetime
+import threading
+import time
 import openai
 import logging
 from io import BytesIO
@@ -13,6 +15,9 @@ from wordpress_xmlrpc.compat import xmlrpc_client
 from openai import OpenAI
 
 from _1_google_loader import load_config
+from concurrency import backend_slot
+import http_client
+import run_metrics
 from utils import normalize_category_pairs, parse_faq_items
 
 config = load_config()
@@ -27,6 +32,12 @@ headers = {
 _OPENAI_CLIENT = OpenAI(api_key=config.get("openai_api_key"))
 
 
+def _wp_request(method: str, url: str, **kwargs):
+    # Все HTTP-запросы к WordPress/WooCommerce идут через общий пул соединений и лимит параллельности.
+    with backend_slot("woocommerce"):
+        return getattr(http_client, method)(url, **kwargs)
+
+
 def _translate_category_name_to_pt(name: str) -> str:
     text = str(name or "").strip()
     if not text:
@@ -57,7 +68,7 @@ def download_image_from_url(image_url):
     Возвращает путь к локальному файлу.
     """
     try:
-        response = requests.get(image_url)
+        response = _wp_request("get", image_url)
         response.raise_for_status()
         img = Image.open(BytesIO(response.content))
         filename = "generated_image.jpg"
@@ -74,7 +85,8 @@ def upload_image_from_path(image_path, token):
             image_data = img.read()
         filename = os.path.basename(image_path)
 
-        response = requests.post(
+        response = _wp_request(
+            "post",
             WC_API_URL + "/wp-json/wp/v2/media",
             headers={
                 "Authorization": f"Bearer {token}",
@@ -100,6 +112,72 @@ def upload_image_from_path(image_path, token):
         print(f"⚠️ Другая ошибка загрузки изображения в WP: {e}")
         return None
 
+_CATEGORY_DEFAULT_LANG = "pt"
+_category_index = None
+_category_translations = {}
+_category_index_lock = threading.RLock()
+
+
+def _category_key(name, parent_id, lang):
+    try:
+        parent = int(parent_id or 0)
+    except (TypeError, ValueError):
+        parent = parent_id
+    return (str(lang or _CATEGORY_DEFAULT_LANG).lower(), str(name or "").lower(), parent)
+
+
+def _remember_category(term: dict, lang=None):
+    term_id = term.get("id")
+    if not term_id:
+        return
+    term_lang = term.get("lang") or lang
+    if term_lang:
+        # Термин без языка (WPML не отдал lang) в индекс не кладём: поиск по нему
+        # пойдёт запросом search= + lang, а не создаст дубль в другом языке.
+        _category_index.setdefault(_category_key(term.get("name"), term.get("parent"), term_lang), int(term_id))
+    translations = term.get("translations")
+    if isinstance(translations, dict):
+        _category_translations[int(term_id)] = {
+            str(code).lower(): int(value) for code, value in translations.items() if value
+        }
+
+
+def _load_category_index():
+    # Все термины product_cat всех языков (lang=all) одной пагинацией: WPML отдаёт
+    # в каждом термине его язык и связи переводов, поэтому поиск и переводы работают без запросов.
+    global _category_index
+    _category_index = {}
+    _category_translations.clear()
+    page = 1
+    total = 0
+    while True:
+        response = _wp_request(
+            "get",
+            WC_API_URL + "/wp-json/wc/v3/products/categories",
+            auth=(WC_CONSUMER_KEY, WC_CONSUMER_SECRET),
+            params={"per_page": 100, "page": page, "lang": "all"},
+        )
+        response.raise_for_status()
+        batch = response.json() or []
+        if not isinstance(batch, list) or not batch:
+            break
+        for term in batch:
+            _remember_category(term)
+        total += len(batch)
+        if len(batch) < 100:
+            break
+        page += 1
+    logging.info("🗂️ Индекс категорий загружен: %s терминов", total)
+
+
+def reset_category_index():
+    """Сбрасывает индекс категорий: следующий поиск перечитает их из WooCommerce (раз за запуск)."""
+    global _category_index
+    with _category_index_lock:
+        _category_index = None
+        _category_translations.clear()
+
+
 def get_category_id_by_name(name, parent_id=None, lang=None):
     """
     Возвращает ID категории WooCommerce по названию.
@@ -107,13 +185,34 @@ def get_category_id_by_name(name, parent_id=None, lang=None):
     Если parent_id указан, ищет категорию с этим родителем.
     Если parent_id не указан — ищет категорию с parent == 0 (верхний уровень).
     """
+    with _category_index_lock:
+        if _category_index is None:
+            _load_category_index()
+        cached_id = _category_index.get(_category_key(name, parent_id, lang))
+        if cached_id:
+            run_metrics.increment("category_index_hit")
+            print(f"✅ Найдена точная категория '{name}' с ID {cached_id} (parent: {parent_id or 0})")
+            return cached_id
+        found_id = _search_category(name, parent_id=parent_id, lang=lang)
+        if found_id:
+            _category_index[_category_key(name, parent_id, lang)] = int(found_id)
+            return found_id
+        created_id = _create_category(name, parent_id=parent_id, lang=lang)
+        if created_id:
+            _category_index[_category_key(name, parent_id, lang)] = int(created_id)
+        return created_id
+
+
+def _search_category(name, parent_id=None, lang=None):
+    # Промах индекса перепроверяем запросом search= в нужном языке, прежде чем создавать категорию.
     categories = []
     page = 1
     while True:
-        response = requests.get(
+        response = _wp_request(
+            "get",
             WC_API_URL + "/wp-json/wc/v3/products/categories",
             auth=(WC_CONSUMER_KEY, WC_CONSUMER_SECRET),
-            params={"search": name, "per_page": 100, "page": page, **({"lang": lang} if lang else {})}
+            params={"search": name, "per_page": 100, "page": page, **({"lang": lang} if lang else {})},
         )
         response.raise_for_status()
         batch = response.json() or []
@@ -125,21 +224,18 @@ def get_category_id_by_name(name, parent_id=None, lang=None):
         page += 1
 
     print(f"🔍 Поиск категории '{name}': {len(categories)} найдено")
-    # Фильтруем категории по точному совпадению имени
-    matched = [cat for cat in categories if cat["name"].lower() == name.lower()]
-
-    # Если есть parent_id — фильтруем по нему
-    if parent_id is not None:
-        matched = [cat for cat in matched if cat.get("parent") == parent_id]
-    else:
-        # Если parent_id не указан — ищем категории с parent == 0 (верхний уровень)
-        matched = [cat for cat in matched if cat.get("parent") == 0]
+    parent = parent_id if parent_id is not None else 0
+    matched = [
+        cat for cat in categories
+        if str(cat.get("name") or "").lower() == str(name or "").lower() and cat.get("parent") == parent
+    ]
+    if not matched:
+        return None
+    print(f"✅ Найдена точная категория '{name}' с ID {matched[0]['id']} (parent: {parent})")
+    return matched[0]["id"]
 
-    if matched:
-        cat = matched[0]
-        print(f"✅ Найдена точная категория '{name}' с ID {cat['id']} (parent: {cat.get('parent')})")
-        return cat["id"]
 
+def _create_category(name, parent_id=None, lang=None):
     print(f"❌ Точная категория '{name}' не найдена с parent_id={parent_id}")
 
     # Если не найдено — создаём категорию
@@ -164,7 +260,8 @@ def get_category_id_by_name(name, parent_id=None, lang=None):
         payload["parent"] = parent_id
     if lang:
         payload["lang"] = lang
-    create_response = requests.post(
+    create_response = _wp_request(
+        "post",
         WC_API_URL + "/wp-json/wc/v3/products/categories",
         auth=(WC_CONSUMER_KEY, WC_CONSUMER_SECRET),
         headers=headers,
@@ -189,8 +286,30 @@ def get_category_id_by_name(name, parent_id=None, lang=None):
     return created_cat.get("id")
 
 
+def _cached_category_translation(category_id, target_lang):
+    with _category_index_lock:
+        try:
+            translations = _category_translations.get(int(category_id))
+        except (TypeError, ValueError):
+            return None
+        if translations is None:
+            return None
+        run_metrics.increment("category_index_hit")
+        return translations.get(str(target_lang).lower(), 0)
+
+
+def _remember_category_translation(category_id, target_lang, target_id):
+    with _category_index_lock:
+        _category_translations.setdefault(int(category_id), {})[str(target_lang).lower()] = int(target_id)
+
+
 def get_category_translation_id(category_id, target_lang):
-    response = requests.get(
+    cached = _cached_category_translation(category_id, target_lang)
+    if cached is not None:
+        return cached or None
+
+    response = _wp_request(
+        "get",
         f"{WC_API_URL}/wp-json/wc/v3/products/categories/{category_id}",
         auth=(WC_CONSUMER_KEY, WC_CONSUMER_SECRET),
         params={"lang": "all"},
@@ -205,7 +324,12 @@ def get_category_translation_id(category_id, target_lang):
 
 
 def ensure_category_translation(category_id: int, source_lang: str, target_lang: str, target_parent_id: int | None = None):
-    response = requests.get(
+    cached = _cached_category_translation(category_id, target_lang)
+    if cached:
+        return cached
+
+    response = _wp_request(
+        "get",
         f"{WC_API_URL}/wp-json/wc/v3/products/categories/{category_id}",
         auth=(WC_CONSUMER_KEY, WC_CONSUMER_SECRET),
         params={"lang": "all"},
@@ -235,7 +359,8 @@ def ensure_category_translation(category_id: int, source_lang: str, target_lang:
         "lang_code": target_lang,
     }
     wpml_auth = (config["wp_admin_user"], config["wp_admin_pass"])
-    wpml_response = requests.post(
+    wpml_response = _wp_request(
+        "post",
         f"{WC_API_URL}/wp-json/custom-api/v1/set-term-translation/",
         auth=wpml_auth,
         headers=headers,
@@ -246,13 +371,33 @@ def ensure_category_translation(category_id: int, source_lang: str, target_lang:
             f"WPML set-translation failed: {wpml_response.status_code} {wpml_response.text}",
             response=wpml_response,
         )
+    _remember_category_translation(category_id, target_lang, target_id)
     return int(target_id)
 
-def get_jwt_token():
+_JWT_REFRESH_MARGIN_SEC = float(os.getenv("JWT_REFRESH_MARGIN_SEC", "60"))
+_JWT_FALLBACK_TTL_SEC = float(os.getenv("JWT_FALLBACK_TTL_SEC", "600"))
+_jwt_token = None
+_jwt_expires_at = 0.0
+_jwt_lock = threading.Lock()
+
+
+def _jwt_expiry(token: str) -> float:
+    # Срок жизни берём из claim exp; если его нет или он не читается — консервативный fallback.
+    try:
+        payload_segment = token.split(".")[1]
+        payload_segment += "=" * (-len(payload_segment) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(payload_segment))
+        return float(payload["exp"])
+    except Exception:
+        return time.time() + _JWT_FALLBACK_TTL_SEC
+
+
+def _fetch_jwt_token():
     admin_username = config["wp_admin_user"]
     admin_password = config["wp_admin_pass"]
 
-    response = requests.post(
+    response = _wp_request(
+        "post",
         f"{WC_API_URL}/wp-json/jwt-auth/v1/token",
         headers={"Content-Type": "application/json"},
         data=json.dumps({
@@ -265,6 +410,30 @@ def get_jwt_token():
     print("🔑 Получен новый JWT токен")
     return token
 
+
+def get_jwt_token():
+    # Один токен на все ACF/медиа-запросы процесса; обновляем незадолго до exp.
+    global _jwt_token, _jwt_expires_at
+    with _jwt_lock:
+        if _jwt_token and time.time() < _jwt_expires_at - _JWT_REFRESH_MARGIN_SEC:
+            run_metrics.increment("jwt_cache_hit")
+            return _jwt_token
+        _jwt_token = _fetch_jwt_token()
+        _jwt_expires_at = _jwt_expiry(_jwt_token) if _jwt_token else 0.0
+        run_metrics.increment("jwt_fetch")
+        return _jwt_token
+
+
+def refresh_jwt_token(stale_token: str | None):
+    """Принудительно обновляет токен после 401, если его ещё не обновил другой поток."""
+    global _jwt_token, _jwt_expires_at
+    with _jwt_lock:
+        if _jwt_token and _jwt_token != stale_token:
+            return _jwt_token
+        _jwt_token = None
+        _jwt_expires_at = 0.0
+    return get_jwt_token()
+
 def format_date_ymd(date_str):
     if not date_str:
         return ""
@@ -283,7 +452,8 @@ def send_acf_data(product_id, acf_data, token):
         "Content-Type": "application/json"
     }
 
-    acf_response = requests.post(
+    acf_response = _wp_request(
+        "post",
         f"{WC_API_URL}/wp-json/acf/v3/product/{product_id}",
         headers=acf_headers,
         data=json.dumps(acf_data)
@@ -292,9 +462,10 @@ def send_acf_data(product_id, acf_data, token):
     # Если токен истёк или неверен — получим новый и попробуем снова
     if acf_response.status_code == 401:
         print("🔁 Токен истёк, получаем новый и повторяем запрос...")
-        token = get_jwt_token()
+        token = refresh_jwt_token(token)
         acf_headers["Authorization"] = f"Bearer {token}"
-        acf_response = requests.post(
+        acf_response = _wp_request(
+            "post",
             f"{WC_API_URL}/wp-json/acf/v3/product/{product_id}",
             headers=acf_headers,
             data=json.dumps(acf_data)
@@ -406,7 +577,8 @@ def create_product(data):
 
     # Основной POST-запрос для создания товара
     try:
-        response = requests.post(
+        response = _wp_request(
+            "post",
             WC_API_URL + "/wp-json/wc/v3/products",
             auth=(WC_CONSUMER_KEY, WC_CONSUMER_SECRET),
             headers=headers,
@@ -539,7 +711,8 @@ def _product_exists(product_id) -> bool:
     """Проверяет, существует ли WC-продукт. При неопределённости (сетевые ошибки)
     возвращает True, чтобы не создать дубль на ровном месте."""
     try:
-        r = requests.get(
+        r = _wp_request(
+            "get",
             f"{WC_API_URL}/wp-json/wc/v3/products/{product_id}",
             auth=(WC_CONSUMER_KEY, WC_CONSUMER_SECRET),
             timeout=15,
@@ -567,7 +740,8 @@ def create_or_update_product(data, existing_product_id=None):
             {"key": "_rf_location_municipality_name", "value": data["RF_MUNICIPALITY_NAME"]}
         ]
 
-    response = requests.put(
+    response = _wp_request(
+        "put",
         f"{WC_API_URL}/wp-json/wc/v3/products/{existing_product_id}",
         auth=(WC_CONSUMER_KEY, WC_CONSUMER_SECRET),
         headers=headers,
@@ -1,8 +1,7 @@
 import requests
 from requests.auth import HTTPBasicAuth
 from _5_taxonomy_and_attributes import assign_attributes_to_product
-from _6_create_variations import create_variations
-from _3_create_product import get_jwt_token
+from _3_create_product import get_jwt_token, refresh_jwt_token, _wp_request
 from _3_create_product import get_category_id_by_name
 from utils import normalize_category_pairs, parse_faq_items
 import logging
@@ -13,23 +12,34 @@ def send_acf_data_translation(base_url, product_id, acf_data, token):
         "Content-Type": "application/json",
         "Authorization": f"Bearer {token}"
     }
-    return requests.post(
+    response = _wp_request(
+        "post",
         f"{base_url}/wp-json/acf/v3/product/{product_id}",
         headers=acf_headers,
         data=json.dumps(acf_data)
     )
+    if response.status_code == 401:
+        logging.info("🔁 JWT токен отклонён, обновляем и повторяем запрос ACF...")
+        acf_headers["Authorization"] = f"Bearer {refresh_jwt_token(token)}"
+        response = _wp_request(
+            "post",
+            f"{base_url}/wp-json/acf/v3/product/{product_id}",
+            headers=acf_headers,
+            data=json.dumps(acf_data)
+        )
+    return response
 
 
-def create_product_translation_en(row, pt_product_id, attributes=None, last_variations=None, config=None):
+def create_product_translation_en(row, pt_product_id, attributes=None, config=None):
     auth = HTTPBasicAuth(config["consumer_key"], config["consumer_secret"])
     wpml_auth = HTTPBasicAuth(config["wp_admin_user"], config["wp_admin_pass"])
     base_url = config["wp_url"]
 
     logging.info("🌍 Создаём перевод продукта на английский")
-    logging.debug("📦 Получены last_variations в create_product_translation_en: %s", json.dumps(last_variations or [], ensure_ascii=False))
 
     # Получаем slug оригинала
-    response_en = requests.get(
+    response_en = _wp_request(
+        "get",
         f"{base_url}/wp-json/wc/v3/products/{pt_product_id}",
         auth=auth
     )
@@ -109,7 +119,8 @@ def create_product_translation_en(row, pt_product_id, attributes=None, last_vari
 
         if category_ids:
             data["categories"] = category_ids
-        response = requests.post(
+        response = _wp_request(
+            "post",
             f"{base_url}/wp-json/wc/v3/products",
             auth=auth,
             json=data
@@ -144,7 +155,8 @@ def create_product_translation_en(row, pt_product_id, attributes=None, last_vari
             "name": row.get("RACE NAME", "") or row.get("RACE NAME (PT)", ""),
             "lang": "en"
         }
-        update_response = requests.put(
+        update_response = _wp_request(
+            "put",
             f"{base_url}/wp-json/wc/v3/products/{en_id}",
             auth=auth,
             json=update_payload
@@ -193,7 +205,8 @@ def create_product_translation_en(row, pt_product_id, attributes=None, last_vari
         logging.debug("📨 Данные для связывания: %s", json.dumps(hook_payload))
 
         try:
-            hook_response = requests.post(
+            hook_response = _wp_request(
+                "post",
                 f"{base_url}/wp-json/custom-api/v1/set-translation/",
                 json=hook_payload,
                 auth=wpml_auth
@@ -209,16 +222,10 @@ def create_product_translation_en(row, pt_product_id, attributes=None, last_vari
         except Exception as hook_error:
             logging.exception(f"❌ Ошибка при связывании перевода через WPML API: {hook_error}")
 
-        # Присваиваем атрибуты и создаём вариации
+        # Присваиваем атрибуты; вариации синхронизирует вызывающий код (sync_variations_by_ids)
         if attributes:
             logging.debug("🧩 Присваиваемые атрибуты: %s", json.dumps(attributes, ensure_ascii=False))
             assign_attributes_to_product(en_id, attributes, lang="en")
-        if last_variations:
-            logging.info(f"🔁 Создаём вариации для EN-перевода ID={en_id}")
-            logging.debug("🧬 last_variations для create_variations: %s", json.dumps(last_variations, ensure_ascii=False))
-            create_variations(en_id, last_variations)
-        else:
-            logging.warning("⚠️ last_variations пуст или не передан — вариации не будут созданы")
 
         return en_id
 
@@ -229,7 +236,7 @@ def create_product_translation_en(row, pt_product_id, attributes=None, last_vari
 def _en_product_exists(base_url, auth, product_id) -> bool:
     """Существует ли EN-продукт. При неопределённости возвращает True (не плодим дубли)."""
     try:
-        r = requests.get(f"{base_url}/wp-json/wc/v3/products/{product_id}", auth=auth, timeout=15)
+        r = _wp_request("get", f"{base_url}/wp-json/wc/v3/products/{product_id}", auth=auth, timeout=15)
         if r.status_code == 200:
             return True
         if r.status_code == 404 or "woocommerce_rest_product_invalid_id" in (r.text or ""):
@@ -243,7 +250,6 @@ def create_or_update_product_pt(
     row,
     pt_product_id,
     attributes=None,
-    last_variations=None,
     config=None,
     existing_pt_product_id=None
 ):
@@ -252,7 +258,6 @@ def create_or_update_product_pt(
             row,
             pt_product_id,
             attributes=attributes,
-            last_variations=last_variations,
             config=config
         )
 
@@ -298,7 +303,8 @@ def create_or_update_product_pt(
     if category_ids:
         update_payload["categories"] = category_ids
 
-    response = requests.put(
+    response = _wp_request(
+        "put",
         f"{base_url}/wp-json/wc/v3/products/{en_id}",
         auth=auth,
         json=update_payload
@@ -308,8 +314,7 @@ def create_or_update_product_pt(
         if not _en_product_exists(base_url, auth, en_id):
             logging.warning("♻️ EN-перевод %s не существует (устаревший ID) — создаём заново", en_id)
             return create_product_translation_en(
-                row, pt_product_id, attributes=attributes,
-                last_variations=last_variations, config=config,
+                row, pt_product_id, attributes=attributes, config=config,
             )
         logging.error(
             "❌ Ошибка обновления EN-перевода %s: %s %s",
@@ -338,8 +343,6 @@ def create_or_update_product_pt(
 
     if attributes:
         assign_attributes_to_product(en_id, attributes, lang="en")
-    if last_variations:
-        create_variations(en_id, last_variations)
 
     logging.info(f"♻️ EN-перевод обновлён: ID={en_id}")
     return en_id
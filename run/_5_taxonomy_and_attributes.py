@@ -1,52 +1,95 @@
 import logging
-import os
-import time
+import threading
 
 import requests
-from woocommerce import API
 
 from _1_google_loader import load_config
+from concurrency import backend_slot
+from http_client import WooCommerceClient
+import run_metrics
 from utils import select_attribute_id
 from utils import merge_attribute_map_case_insensitive
 
 config = load_config()
-wcapi = API(
+# Повторы временных ошибок (WCAPI_MAX_ATTEMPTS попыток, пауза от WCAPI_BASE_DELAY_SEC) делает сам клиент.
+wcapi = WooCommerceClient(
     url=config["wp_url"],
     consumer_key=config["consumer_key"],
     consumer_secret=config["consumer_secret"],
     version="wc/v3",
-    timeout=float(config.get("wcapi_timeout_sec", 20))
+    timeout=float(config.get("wcapi_timeout_sec", 20)),
+    max_retries=max(0, int(config.get("wcapi_max_attempts", 4)) - 1),
+    retry_base_delay=float(config.get("wcapi_base_delay_sec", 1.5)),
 )
 
-_WCAPI_MAX_ATTEMPTS = int(os.getenv("WCAPI_MAX_ATTEMPTS", "4"))
-_WCAPI_BASE_DELAY_SEC = float(os.getenv("WCAPI_BASE_DELAY_SEC", "1.5"))
-
 
 def _safe_wc_request(method: str, endpoint: str, **kwargs):
-    """Execute WooCommerce API call with retry on transient connection issues."""
-    last_err = None
-    delay = _WCAPI_BASE_DELAY_SEC
-
-    for attempt in range(1, _WCAPI_MAX_ATTEMPTS + 1):
-        try:
-            return getattr(wcapi, method)(endpoint, **kwargs)
-        except requests.exceptions.RequestException as err:
-            last_err = err
-            if attempt == _WCAPI_MAX_ATTEMPTS:
-                break
-
-            logging.warning(
-                f"⚠️ Ошибка соединения с WooCommerce {method.upper()} {endpoint} (попытка {attempt}/{_WCAPI_MAX_ATTEMPTS}): {err}"
-            )
-            logging.info(f"⏳ Повторная попытка обращения к WooCommerce через {delay} сек...")
-            time.sleep(delay)
-            delay *= 2
+    """WooCommerce API call within the woocommerce concurrency slot; retries happen in http_client."""
+    with backend_slot("woocommerce"):
+        return getattr(wcapi, method)(endpoint, **kwargs)
+
+
+# Реестр атрибутов и термов на время одного запуска: списки читаются из WooCommerce один раз,
+# дальше поиск идёт по индексам. Сбрасывается только после создания или конфликта 400.
+_registry_lock = threading.RLock()
+_attributes_cache = None
+_attributes_pages = 0
+_terms_cache = {}
+
+
+def reset_attribute_registry():
+    global _attributes_cache, _attributes_pages
+    with _registry_lock:
+        _attributes_cache = None
+        _attributes_pages = 0
+        _terms_cache.clear()
+
+
+def _get_attributes(refresh: bool = False) -> list:
+    global _attributes_cache, _attributes_pages
+    with _registry_lock:
+        if _attributes_cache is not None and not refresh:
+            run_metrics.increment("wc_registry_calls_saved", _attributes_pages)
+            return _attributes_cache
+        _attributes_cache, _attributes_pages = _list_all_attributes()
+        return _attributes_cache
+
+
+def _term_slug(value: str) -> str:
+    return str(value or "").strip().lower().replace(" ", "-")
+
 
-    raise last_err
+def _get_term_index(attr_id: int, lang: str | None, refresh: bool = False) -> dict:
+    key = (int(attr_id), lang or "")
+    with _registry_lock:
+        entry = _terms_cache.get(key)
+        if entry is not None and not refresh:
+            run_metrics.increment("wc_registry_calls_saved", entry["pages"])
+            return entry
+        terms, pages = _list_all_attribute_terms(attr_id, lang=lang)
+        entry = {"pages": pages, "by_name": {}, "by_slug": {}}
+        for term in terms:
+            entry["by_name"].setdefault(str(term.get("name", "")).lower(), term["id"])
+            if term.get("slug"):
+                entry["by_slug"].setdefault(str(term["slug"]).lower(), term["id"])
+        _terms_cache[key] = entry
+        return entry
+
+
+def _remember_term(attr_id: int, lang: str | None, value: str, term_id):
+    with _registry_lock:
+        entry = _terms_cache.get((int(attr_id), lang or ""))
+        if entry is not None:
+            entry["by_name"].setdefault(value.lower(), term_id)
+
+
+def _forget_terms(attr_id: int, lang: str | None):
+    with _registry_lock:
+        _terms_cache.pop((int(attr_id), lang or ""), None)
 
 
 def get_or_create_attribute(name):
-    attributes = _list_all_attributes()
+    attributes = _get_attributes()
     existing_id = _select_attribute_id_lenient(attributes, name)
     if existing_id is not None:
         return existing_id
@@ -62,6 +105,9 @@ def get_or_create_attribute(name):
             raise RuntimeError(
                 f"Ответ WooCommerce при создании атрибута '{name}' не содержит id: {new_attr}"
             )
+        with _registry_lock:
+            if _attributes_cache is not None:
+                _attributes_cache.append(new_attr)
         return new_attr["id"]
     except requests.exceptions.HTTPError:
         if create_response.status_code == 400:
@@ -71,7 +117,7 @@ def get_or_create_attribute(name):
                 create_response.text,
             )
             # Fallback: атрибут мог быть создан ранее/параллельно или конфликтует по slug.
-            retry_attrs = _list_all_attributes()
+            retry_attrs = _get_attributes(refresh=True)
             existing_id = _select_attribute_id_lenient(retry_attrs, name)
             if existing_id is not None:
                 logging.warning(
@@ -92,8 +138,8 @@ def get_or_create_attribute(name):
         )
 
 
-def _list_all_attributes() -> list:
-    """Fetch all WooCommerce global attributes with pagination."""
+def _list_all_attributes() -> tuple[list, int]:
+    """Fetch all WooCommerce global attributes with pagination; returns (attributes, pages requested)."""
     all_attrs = []
     page = 1
     while True:
@@ -105,7 +151,7 @@ def _list_all_attributes() -> list:
         if len(chunk) < 100:
             break
         page += 1
-    return all_attrs
+    return all_attrs, page
 
 
 def _select_attribute_id_lenient(attributes: list, name: str):
@@ -152,11 +198,10 @@ def get_or_create_attribute_term(attr_id, value, lang=None):
         logging.warning(f"⚠️ Пустое значение терма для атрибута ID={attr_id}, пропускаем создание терма.")
         return None
 
-    terms = _list_all_attribute_terms(attr_id, lang=lang)
-
-    for term in terms:
-        if term['name'].lower() == value.lower():
-            return term['id']
+    term_index = _get_term_index(attr_id, lang)
+    existing_id = term_index["by_name"].get(value.lower()) or term_index["by_slug"].get(_term_slug(value))
+    if existing_id:
+        return existing_id
 
     data = {"name": value}
     logging.debug(f"🔧 Пытаемся создать терм '{value}' в атрибуте ID={attr_id}")
@@ -171,10 +216,13 @@ def get_or_create_attribute_term(attr_id, value, lang=None):
         if "id" not in term_data:
             logging.error("❌ Ответ не содержит 'id' при создании терма: %s", term_data)
             raise Exception("Нет ID в ответе от WooCommerce при создании терма")
+        _remember_term(attr_id, lang, value, term_data["id"])
         return term_data["id"]
 
     except requests.exceptions.HTTPError as e:
         if response.status_code == 400:
+            # Реестр термов устарел (терм создан вне этого запуска) — перечитаем при следующем обращении.
+            _forget_terms(attr_id, lang)
             try:
                 error_data = response.json()
                 if error_data.get("code") == "term_exists":
@@ -189,7 +237,7 @@ def get_or_create_attribute_term(attr_id, value, lang=None):
         raise
 
 
-def _list_all_attribute_terms(attr_id: int, lang: str | None = None) -> list:
+def _list_all_attribute_terms(attr_id: int, lang: str | None = None) -> tuple[list, int]:
     terms = []
     page = 1
     while True:
@@ -205,10 +253,11 @@ def _list_all_attribute_terms(attr_id: int, lang: str | None = None) -> list:
         if len(batch) < 100:
             break
         page += 1
-    return terms
+    return terms, page
 
 
-def assign_attributes_to_product(product_id, attributes_dict, lang=None):
+def register_attribute_terms(attributes_dict, lang=None):
+    """Находит/создаёт атрибуты и термы; возвращает (attr_payload для продукта, variation_attrs)."""
     attr_payload = []
     variation_attrs = []
 
@@ -252,6 +301,12 @@ def assign_attributes_to_product(product_id, attributes_dict, lang=None):
             "options": options
         })
 
+    return attr_payload, variation_attrs
+
+
+def assign_attributes_to_product(product_id, attributes_dict, lang=None):
+    attr_payload, variation_attrs = register_attribute_terms(attributes_dict, lang=lang)
+
     if attr_payload:
         product_endpoint = f"products/{product_id}"
         if lang:
@@ -1,49 +1,39 @@
-from woocommerce import API
-import json
+import html
 import logging
-import time
+import re
 
 from _1_google_loader import load_config
+from concurrency import backend_slot
+from http_client import WooCommerceClient
 config = load_config()
 
-wcapi = API(
+# Повторы временных ошибок (WCAPI_MAX_ATTEMPTS попыток, пауза от WCAPI_BASE_DELAY_SEC) делает сам клиент.
+wcapi = WooCommerceClient(
     url=config["wp_url"],
     consumer_key=config["consumer_key"],
     consumer_secret=config["consumer_secret"],
     version="wc/v3",
-    timeout=float(config.get("wcapi_timeout_sec", 20))
+    timeout=float(config.get("wcapi_timeout_sec", 20)),
+    max_retries=max(0, int(config.get("wcapi_max_attempts", 4)) - 1),
+    retry_base_delay=float(config.get("wcapi_base_delay_sec", 1.5)),
 )
 
+# Лимит WooCommerce на количество объектов в одном запросе variations/batch.
+_VARIATION_BATCH_SIZE = 100
+
+
 def _wcapi_request_with_retry(method: str, endpoint: str, payload: dict | None = None):
-    max_attempts = int(config.get("wcapi_max_attempts", 4))
-    base_delay = float(config.get("wcapi_base_delay_sec", 1.5))
-    last_err = None
-    for attempt in range(1, max_attempts + 1):
-        try:
-            if method == "GET":
-                return wcapi.get(endpoint)
-            if method == "POST":
-                return wcapi.post(endpoint, payload)
-            if method == "PUT":
-                return wcapi.put(endpoint, payload)
-            if method == "DELETE":
-                return wcapi.delete(endpoint, params=payload or {})
-            raise ValueError(f"Неизвестный метод запроса: {method}")
-        except Exception as exc:
-            last_err = exc
-            if attempt < max_attempts:
-                delay = base_delay * (2 ** (attempt - 1))
-                logging.warning(
-                    "⚠️ Ошибка запроса WooCommerce %s %s (попытка %s/%s): %s",
-                    method,
-                    endpoint,
-                    attempt,
-                    max_attempts,
-                    exc
-                )
-                logging.info("⏳ Повтор через %.1f сек...", delay)
-                time.sleep(delay)
-    raise last_err
+    # Повторы — в WooCommerceClient (http_client): POST variations/batch после ReadTimeout не повторяется.
+    with backend_slot("woocommerce"):
+        if method == "GET":
+            return wcapi.get(endpoint)
+        if method == "POST":
+            return wcapi.post(endpoint, payload)
+        if method == "PUT":
+            return wcapi.put(endpoint, payload)
+        if method == "DELETE":
+            return wcapi.delete(endpoint, params=payload or {})
+    raise ValueError(f"Неизвестный метод запроса: {method}")
 
 
 def _as_int(value):
@@ -68,6 +58,11 @@ def _norm_key(value):
     return _norm_text(value).casefold()
 
 
+def _option_key(value):
+    # Для глобальных атрибутов WooCommerce возвращает каноническое имя терма («5 KM», «Trail &amp; Run»).
+    return re.sub(r"\s+", " ", html.unescape(_norm_text(value))).casefold()
+
+
 def _load_all_variations(product_id, lang: str | None = None):
     items = []
     page = 1
@@ -149,9 +144,10 @@ def _build_payload(entry, attr_name_to_id):
 
 
 def _normalize_payload(payload):
+    # Опции сравниваются через _option_key и при планировании, и при проверке результата batch.
     attrs = payload.get("attributes", [])
     attrs_norm = sorted(
-        (int(attr.get("id", 0)), _norm_text(attr.get("option")))
+        (int(attr.get("id", 0)), _option_key(attr.get("option")))
         for attr in attrs
         if attr.get("id")
     )
@@ -167,7 +163,7 @@ def _normalize_existing_variation(variation):
         attr_id = _as_int(attr.get("id"))
         if not attr_id:
             continue
-        attrs.append((attr_id, _norm_text(attr.get("option"))))
+        attrs.append((attr_id, _option_key(attr.get("option"))))
     return {
         "regular_price": _norm_text(variation.get("regular_price")),
         "attributes": sorted(attrs),
@@ -180,6 +176,8 @@ def sync_variations_by_ids(product_id, variation_entries, lang: str | None = Non
     - update существующих по existing_variation_id,
     - create для отсутствующих,
     - delete всех лишних в WP.
+    Все изменения отправляются через products/{id}/variations/batch пакетами до 100 объектов.
+    Если часть операций не применилась — VariationBatchError с ошибками по row_index.
 
     variation_entries: список dict:
     {
@@ -206,7 +204,10 @@ def sync_variations_by_ids(product_id, variation_entries, lang: str | None = Non
 
     row_to_variation_id = {}
     kept_ids = set()
+    creates = []
+    updates = []
 
+    # Сначала строим полный план изменений, затем применяем его пакетами через variations/batch.
     for entry in variation_entries:
         row_index = entry.get("row_index")
         payload = _build_payload(entry, attr_name_to_id)
@@ -230,12 +231,7 @@ def sync_variations_by_ids(product_id, variation_entries, lang: str | None = Non
                         final_id
                     )
                 else:
-                    endpoint = f"products/{product_id}/variations/{existing_id}"
-                    if lang:
-                        endpoint += f"?lang={lang}"
-                    response = _wcapi_request_with_retry("PUT", endpoint, payload)
-                    response.raise_for_status()
-                    logging.info("♻️ Вариация обновлена: product=%s variation=%s", product_id, existing_id)
+                    updates.append((row_index, {"id": existing_id, **payload}))
                     final_id = existing_id
         else:
             # Для пустого/битого ID из таблицы сначала пробуем найти вариацию по фактическим данным.
@@ -244,118 +240,108 @@ def sync_variations_by_ids(product_id, variation_entries, lang: str | None = Non
                 final_id = matched_ids[0]
                 logging.info("🔁 Найдена существующая вариация по ключу: product=%s variation=%s", product_id, final_id)
             else:
-                endpoint = f"products/{product_id}/variations"
-                if lang:
-                    endpoint += f"?lang={lang}"
-                response = _wcapi_request_with_retry("POST", endpoint, payload)
-                response.raise_for_status()
-                body = response.json() or {}
-                created_id = body.get("id")
-                if not created_id:
-                    raise RuntimeError(f"Не удалось получить ID созданной вариации (product_id={product_id})")
-                final_id = int(created_id)
-                logging.info("🆕 Вариация создана: product=%s variation=%s", product_id, final_id)
+                creates.append((row_index, payload))
+                continue
 
         if row_index is not None:
             row_to_variation_id[row_index] = final_id
         kept_ids.add(final_id)
 
     stale_ids = sorted(set(existing_by_id.keys()) - kept_ids)
-    for variation_id in stale_ids:
-        endpoint = f"products/{product_id}/variations/{variation_id}"
-        if lang:
-            endpoint += f"?lang={lang}"
-        response = _wcapi_request_with_retry("DELETE", endpoint, {"force": True})
-        response.raise_for_status()
-        logging.info("🗑️ Вариация удалена: product=%s variation=%s", product_id, variation_id)
+    operations = (
+        [("create", row_index, payload) for row_index, payload in creates]
+        + [("update", row_index, payload) for row_index, payload in updates]
+        + [("delete", None, variation_id) for variation_id in stale_ids]
+    )
+    failed_rows = _apply_variation_batches(product_id, operations, row_to_variation_id, lang)
+    if failed_rows:
+        raise VariationBatchError(product_id, failed_rows, row_to_variation_id)
 
     return row_to_variation_id
 
-def create_variations(product_id, variation_data_list):
-    """
-    Создаёт вариации для variable-продукта.
-    variation_data_list - список словарей с ключами:
-    - regular_price (str)
-    - attributes (list of dict) с ключами name и option, например:
-      [{"name": "Type", "option": "Road Running"}, {"name": "Distance", "option": "10 km"}]
-    """
-
-    # Получаем список атрибутов продукта (чтобы взять их id)
-    response = _wcapi_request_with_retry("GET", f"products/{product_id}")
-    product = response.json()
-    product_attributes = product.get("attributes", [])
 
-    def _norm_text(value):
-        if value is None:
-            return ""
-        return str(value).strip()
-
-    # Создаём словарь для быстрого поиска id атрибута по имени.
-    # Нормализуем ключ, чтобы "Running " и "Running" считались одним атрибутом.
-    attr_name_to_id = {
-        _norm_text(attr.get("name")): attr["id"]
-        for attr in product_attributes
-        if "id" in attr and _norm_text(attr.get("name"))
-    }
+class VariationBatchError(RuntimeError):
+    """Часть операций variations/batch не применилась; row_to_variation_id содержит только успешные строки."""
 
-    # Получаем уже существующие вариации
-    existing_response = _wcapi_request_with_retry("GET", f"products/{product_id}/variations")
-    existing_response.raise_for_status()
-    existing_variations = existing_response.json()
-
-    # Собираем множество уже существующих комбинаций атрибутов
-    existing_combinations = set()
-    for variation in existing_variations:
-        combo = tuple(
-            sorted(
-                (_norm_text(attr.get("name")), _norm_text(attr.get("option")))
-                for attr in variation.get("attributes", [])
-                if _norm_text(attr.get("name")) and _norm_text(attr.get("option"))
-            )
-        )
-        existing_combinations.add(combo)
-
-    for var_data in variation_data_list:
-        attrs_for_api = []
-        # Проверка на дубликат
-        combo_key = tuple(
-            sorted(
-                (_norm_text(attr.get("name")), _norm_text(attr.get("option")))
-                for attr in var_data.get("attributes", [])
-                if _norm_text(attr.get("name")) and _norm_text(attr.get("option"))
-            )
-        )
-        if combo_key in existing_combinations:
-            print(f"⚠️ Вариация уже существует, пропускаем: {combo_key}")
-            continue
+    def __init__(self, product_id, failed_rows: dict, row_to_variation_id: dict):
+        self.failed_rows = failed_rows
+        self.row_to_variation_id = row_to_variation_id
+        details = ", ".join(f"row={row}: {message}" for row, message in failed_rows.items())
+        super().__init__(f"Не удалось синхронизировать вариации product_id={product_id}: {details}")
 
-        for attr in var_data.get("attributes", []):
-            name = _norm_text(attr.get("name"))
-            option = _norm_text(attr.get("option"))
 
-            if not name or not option:
-                continue
+def _batch_item_error(item) -> str | None:
+    if not isinstance(item, dict):
+        return "пустой ответ"
+    error = item.get("error")
+    if error:
+        if isinstance(error, dict):
+            return error.get("message") or error.get("code") or str(error)
+        return str(error)
+    return None
 
-            attr_id = attr_name_to_id.get(name)
-            if not attr_id:
-                print(f"⚠️ Атрибут с именем '{name}' не найден у продукта ID={product_id}, пропускаем.")
-                continue
 
-            attrs_for_api.append({
-                "id": attr_id,
-                "option": option
-            })
-
-        payload = {
-            "regular_price": var_data.get("regular_price", "0"),
-            "attributes": attrs_for_api
-        }
-
-        try:
-            logging.debug(f"📤 Отправка вариации для товара {product_id}: {json.dumps(payload, ensure_ascii=False)}")
-            res = _wcapi_request_with_retry("POST", f"products/{product_id}/variations", payload)
-            res.raise_for_status()
-            logging.debug(f"📥 Ответ WooCommerce: {res.status_code} — {res.text}")
-            print("✅ Вариация создана:", payload)
-        except Exception as e:
-            print(f"❌ Ошибка создания вариации для продукта {product_id}:", e, res.text if 'res' in locals() else "")
+def _price_matches(expected, actual) -> bool:
+    try:
+        return float(_norm_text(expected) or 0) == float(_norm_text(actual) or 0)
+    except ValueError:
+        return _norm_text(expected) == _norm_text(actual)
+
+
+def _verify_applied_variation(payload: dict, item: dict) -> str | None:
+    """Сверяет вариацию из ответа batch с отправленными данными — повторная загрузка вариаций не нужна."""
+    desired = _normalize_payload(payload)
+    actual = _normalize_existing_variation(item)
+    if actual["attributes"] != desired["attributes"]:
+        return f"атрибуты {actual['attributes']} вместо {desired['attributes']}"
+    if not _price_matches(desired["regular_price"], actual["regular_price"]):
+        return f"цена {actual['regular_price']} вместо {desired['regular_price']}"
+    return None
+
+
+def _apply_variation_batches(product_id, operations: list, row_to_variation_id: dict, lang: str | None = None) -> dict:
+    """Применяет операции пакетами по _VARIATION_BATCH_SIZE и проверяет результат; возвращает {row_index|variation_id: ошибка}."""
+    failed = {}
+    endpoint = f"products/{product_id}/variations/batch"
+    if lang:
+        endpoint += f"?lang={lang}"
+
+    for start in range(0, len(operations), _VARIATION_BATCH_SIZE):
+        chunk = operations[start:start + _VARIATION_BATCH_SIZE]
+        body = {"create": [], "update": [], "delete": []}
+        owners = {"create": [], "update": [], "delete": []}
+        for action, row_index, data in chunk:
+            body[action].append(data)
+            owners[action].append(row_index if action != "delete" else data)
+        body = {action: items for action, items in body.items() if items}
+
+        response = _wcapi_request_with_retry("POST", endpoint, body)
+        response.raise_for_status()
+        result = response.json() or {}
+
+        # WooCommerce возвращает результаты в том же порядке, что и запрос, поэтому ошибки сопоставляются со строками по позиции.
+        for action, sent_items in body.items():
+            items = result.get(action) or []
+            for position, owner in enumerate(owners[action]):
+                item = items[position] if position < len(items) else None
+                error = _batch_item_error(item)
+                if error:
+                    logging.error("❌ Вариация %s не применена: product=%s owner=%s: %s", action, product_id, owner, error)
+                    failed[owner] = error
+                    continue
+                if action == "delete":
+                    logging.info("🗑️ Вариация удалена: product=%s variation=%s", product_id, owner)
+                    continue
+                variation_id = _as_int(item.get("id"))
+                mismatch = "нет ID в ответе" if not variation_id else _verify_applied_variation(sent_items[position], item)
+                if mismatch:
+                    logging.error("❌ Проверка вариации не пройдена: product=%s owner=%s: %s", product_id, owner, mismatch)
+                    failed[owner] = mismatch
+                    continue
+                if owner is not None:
+                    row_to_variation_id[owner] = variation_id
+                if action == "create":
+                    logging.info("🆕 Вариация создана: product=%s variation=%s", product_id, variation_id)
+                else:
+                    logging.info("♻️ Вариация обновлена: product=%s variation=%s", product_id, variation_id)
+    return failed
@@ -0,0 +1,47 @@
+"""JSON Schema ответа ассистентов (Structured Outputs Responses API).
+
+Первый и второй ассистент возвращают один и тот же объект с текстами гонки на
+EN/PT. С `text.format = json_schema` (strict) модель не может вернуть
+невалидный или неполный по ключам JSON, поэтому повторы из-за
+json.JSONDecodeError остаются только для обрезанных ответов (status=incomplete).
+Пустой PT-перевод схема не ловит: его по-прежнему проверяет get_missing_pt_fields.
+"""
+
+_TEXT = {"type": "string"}
+_TEXT_LIST = {"type": "array", "items": {"type": "string"}}
+
+RACE_CONTENT_FIELDS = {
+    "summary": _TEXT,
+    "org_info": _TEXT,
+    "benefits": _TEXT_LIST,
+    "faq": _TEXT,
+    "summary_pt": _TEXT,
+    "org_info_pt": _TEXT,
+    "benefits_pt": _TEXT_LIST,
+    "faq_pt": _TEXT,
+    "image_prompt": _TEXT,
+    "cancellation": _TEXT,
+    "cancellation_pt": _TEXT,
+    "organizer_name": _TEXT,
+    "organizer_email": _TEXT,
+}
+
+RACE_CONTENT_SCHEMA = {
+    "type": "object",
+    "properties": RACE_CONTENT_FIELDS,
+    # strict-режим требует перечислить все поля и запретить лишние.
+    "required": list(RACE_CONTENT_FIELDS),
+    "additionalProperties": False,
+}
+
+
+def race_content_text_format(name: str) -> dict:
+    """Значение `text` для responses.create: ответ строго по RACE_CONTENT_SCHEMA."""
+    return {
+        "format": {
+            "type": "json_schema",
+            "name": name,
+            "schema": RACE_CONTENT_SCHEMA,
+            "strict": True,
+        }
+    }
@@ -0,0 +1,241 @@
+"""Асинхронный вариант обработки событий Revised (PIPELINE_MODE=async).
+
+Для каждого события независимые сетевые шаги выполняются одновременно через
+asyncio.gather: загрузка сайта и регламента (httpx), геокодинг OpenCage,
+перевод названия (AsyncOpenAI) и подготовка атрибутов/термов WooCommerce.
+Затем основной синхронный сценарий (_process_revised_event) запускается в
+потоке через asyncio.to_thread и получает уже готовые результаты.
+
+Генерация контента, создание продукта и вариаций остаются синхронными: они
+последовательны внутри события и зависят от результатов друг друга. События
+перемежаются между собой (не более max_concurrent_events одновременно), а
+лимиты сервисов общие с синхронным режимом — см. concurrency.async_backend_slot.
+"""
+
+import asyncio
+import logging
+import os
+import ssl
+
+import httpx
+from openai import AsyncOpenAI
+
+from _1_google_loader import load_config
+from _2_content_generation import (
+    OPENCAGE_URL,
+    SOURCE_STREAM_CHUNK_BYTES,
+    TITLE_TRANSLATION_MODEL,
+    TITLE_TRANSLATION_TEMPERATURE,
+    SourceBodyReader,
+    opencage_params,
+    pick_portugal_coordinates,
+    resolve_source_url,
+    source_fetch_attempts,
+    source_fetch_verify,
+    source_request_headers,
+)
+from _5_taxonomy_and_attributes import register_attribute_terms
+from concurrency import async_backend_slot
+from geocode_cache import lookup_coordinates
+from source_cache import lookup_source_text, store_source_text
+from translation_prompt import build_translation_messages
+
+SOURCE_FETCH_TIMEOUT_SEC = 20
+OPENCAGE_TIMEOUT_SEC = 15
+
+
+def _ssl_verify():
+    ca_bundle = os.getenv("REQUESTS_CA_BUNDLE") or os.getenv("SSL_CERT_FILE")
+    if ca_bundle:
+        return ssl.create_default_context(cafile=ca_bundle)
+    return True
+
+
+class _AsyncClients:
+    """HTTP/OpenAI клиенты одного запуска; живут внутри одного event loop."""
+
+    def __init__(self):
+        self.http = httpx.AsyncClient(follow_redirects=True, verify=_ssl_verify())
+        # Отдельный клиент для хостов из FETCH_INSECURE_HOSTS: verify задаётся на уровне клиента.
+        self.insecure_http = httpx.AsyncClient(follow_redirects=True, verify=False)
+        self.openai = AsyncOpenAI(api_key=load_config().get("openai_api_key"))
+
+    async def aclose(self):
+        await self.http.aclose()
+        await self.insecure_http.aclose()
+        await self.openai.close()
+
+
+async def _stream_source(client, url: str, direct_url: str):
+    async with client.stream(
+        "GET",
+        direct_url,
+        headers=source_request_headers(),
+        timeout=SOURCE_FETCH_TIMEOUT_SEC,
+    ) as response:
+        response.raise_for_status()
+        reader = SourceBodyReader(url, direct_url, response.headers, response.status_code)
+        try:
+            async for chunk in response.aiter_bytes(SOURCE_STREAM_CHUNK_BYTES):
+                if not reader.feed(chunk):
+                    break
+        except BaseException:
+            reader.discard()
+            raise
+    # Разбор HTML — CPU, не держим на этом event loop.
+    return await asyncio.to_thread(reader.finish)
+
+
+async def fetch_source_text(clients: _AsyncClients, url: str):
+    """Асинхронный аналог extract_text_from_url: (текст, путь к PDF или None)."""
+    direct_url = resolve_source_url(url)
+    if not direct_url:
+        return "", None
+
+    cached_text = lookup_source_text(direct_url)
+    if cached_text is not None:
+        logging.info("📦 Текст источника взят из кеша: %s", url)
+        return cached_text, None
+
+    client = clients.insecure_http if source_fetch_verify(direct_url) is False else clients.http
+    attempts = source_fetch_attempts()
+    last_err = None
+    for attempt_index, delay in enumerate(attempts, start=1):
+        if delay:
+            logging.info("⏳ Повторная попытка загрузки через %s сек...", delay)
+            await asyncio.sleep(delay)
+        try:
+            async with async_backend_slot("website"):
+                text, pdf_path = await _stream_source(client, url, direct_url)
+            if not pdf_path:
+                store_source_text(direct_url, text)
+            return text, pdf_path
+        except Exception as exc:
+            last_err = exc
+            logging.warning(
+                "⚠️ Ошибка загрузки из %s (попытка %s/%s): %s",
+                direct_url,
+                attempt_index,
+                len(attempts),
+                exc,
+            )
+    logging.error("❌ Ошибка загрузки из %s: %s", url, last_err)
+    return "", None
+
+
+async def geocode(clients: _AsyncClients, location: str):
+    if not location:
+        return None, None
+
+    cached = lookup_coordinates(location)
+    if cached is not None:
+        logging.debug("📍 Координаты для '%s' взяты из кеша: %s", location, cached)
+        return cached
+
+    try:
+        async with async_backend_slot("opencage"):
+            response = await clients.http.get(
+                OPENCAGE_URL,
+                params=opencage_params(location),
+                timeout=OPENCAGE_TIMEOUT_SEC,
+            )
+        response.raise_for_status()
+    except Exception as exc:
+        logging.error("❌ Ошибка запроса координат для '%s': %s", location, exc)
+        return None, None
+
+    return pick_portugal_coordinates(location, response.json())
+
+
+async def geocode_with_city_fallback(clients: _AsyncClients, location: str, location_city: str):
+    lat, lon = await geocode(clients, location)
+    if lat is not None and lon is not None:
+        return lat, lon
+
+    fallback_city = (location_city or "").strip()
+    if fallback_city:
+        logging.info("📍 Пробуем fallback геокодинга по LOCATION (CITY): %s", fallback_city)
+        lat, lon = await geocode(clients, fallback_city)
+        if lat is not None and lon is not None:
+            return lat, lon
+
+    return None, None
+
+
+async def translate_title(clients: _AsyncClients, title: str) -> str:
+    if not title:
+        return ""
+    try:
+        async with async_backend_slot("openai"):
+            response = await clients.openai.chat.completions.create(
+                model=TITLE_TRANSLATION_MODEL,
+                messages=build_translation_messages(title),
+                temperature=TITLE_TRANSLATION_TEMPERATURE,
+            )
+        en_title = response.choices[0].message.content.strip()
+        logging.info("🌍 Переведён заголовок (PT→EN): '%s' → '%s'", title, en_title)
+        return en_title
+    except Exception as exc:
+        logging.error("❌ Ошибка при переводе заголовка: %s", exc)
+        return ""
+
+
+async def _warm_attribute_terms(attributes: dict):
+    """Заранее создаёт атрибуты/термы для обоих языков; результат остаётся в реестре _5 на весь запуск."""
+    if not attributes:
+        return
+    for lang in ("pt", "en"):
+        try:
+            await asyncio.to_thread(register_attribute_terms, attributes, lang)
+        except Exception as exc:
+            # Не критично: assign_attributes_to_product повторит то же самое синхронно.
+            logging.warning("⚠️ Не удалось заранее подготовить термы атрибутов (%s): %s", lang, exc)
+
+
+async def prefetch_event(clients: _AsyncClients, plan: dict) -> dict:
+    """Выполняет независимые запросы события параллельно; ключи совпадают с prefetched в main."""
+    coordinates, translated_title, website, regulations, _ = await asyncio.gather(
+        geocode_with_city_fallback(clients, plan.get("location", ""), plan.get("location_city", "")),
+        translate_title(clients, plan.get("pt_title", "")),
+        fetch_source_text(clients, plan.get("website_url", "")),
+        fetch_source_text(clients, plan.get("regulations_url", "")),
+        _warm_attribute_terms(plan.get("attributes") or {}),
+    )
+    prefetched = {"coordinates": coordinates}
+    if plan.get("pt_title"):
+        prefetched["translated_title"] = translated_title
+    if plan.get("website_url"):
+        prefetched["website"] = website
+    if plan.get("regulations_url"):
+        prefetched["regulations"] = regulations
+    return prefetched
+
+
+async def run_events_async(positions: list, plan_event, process_event, max_concurrent_events: int = 1):
+    """Обрабатывает события: prefetch_event + process_event(position, prefetched) в потоке.
+
+    plan_event(position) -> dict со входами для prefetch_event; ошибка одного
+    события не останавливает остальные, первая из них пробрасывается в конце
+    (как future.result() в синхронном режиме).
+    """
+    events_slot = asyncio.Semaphore(max(1, max_concurrent_events))
+    clients = _AsyncClients()
+
+    async def run_one(position):
+        async with events_slot:
+            prefetched = await prefetch_event(clients, plan_event(position))
+            await asyncio.to_thread(process_event, position, prefetched)
+
+    logging.info(
+        "⚡ Асинхронная обработка %s событий, одновременно: %s",
+        len(positions),
+        max(1, max_concurrent_events),
+    )
+    try:
+        results = await asyncio.gather(*(run_one(position) for position in positions), return_exceptions=True)
+    finally:
+        await clients.aclose()
+
+    for result in results:
+        if isinstance(result, BaseException):
+            raise result
@@ -0,0 +1,138 @@
+"""Микро-бенчмарк нормализации HTML для WEBSITE SNAPSHOT HASH.
+
+Сравнивает исходную цепочку re.sub (`normalize_html_for_hash_legacy`) с
+однопроходным токенизатором (`_hash_html`) на корпусе сохранённых страниц и
+проверяет, что хеши совпадают: расхождение означало бы ложные «изменения
+сайта» у всех Published (incomplete) после обновления.
+
+Запуск:
+    python benchmark_html_normalizer.py /path/to/pages      # *.html / *.htm из папки
+    python benchmark_html_normalizer.py --synthetic 20      # без корпуса: 20 страниц ~2 МБ
+    python benchmark_html_normalizer.py /path/to/pages --repeat 5
+
+Страницы для корпуса удобно сохранить так:
+    curl -sL https://example.pt/race > pages/example.html
+"""
+
+import argparse
+import hashlib
+import os
+import random
+import re
+import sys
+import time
+
+from website_snapshot import _hash_html
+
+
+def normalize_html_for_hash_legacy(html: str) -> str:
+    """Исходная цепочка re.sub из website_snapshot — эталон совместимости хешей (бенчмарк и тесты)."""
+    if not html:
+        return ""
+
+    normalized = html
+    normalized = re.sub(r"<!--.*?-->", " ", normalized, flags=re.DOTALL)
+    normalized = re.sub(r"<script\b[^>]*>.*?</script>", " ", normalized, flags=re.IGNORECASE | re.DOTALL)
+    normalized = re.sub(r"<style\b[^>]*>.*?</style>", " ", normalized, flags=re.IGNORECASE | re.DOTALL)
+    normalized = re.sub(r"([?&])(utm_[a-z_]+|fbclid|gclid|_ga|_gl|v|ver|timestamp|ts)=[^&\"'\\s>]+", r"", normalized, flags=re.IGNORECASE)
+    normalized = re.sub(r"\b(nonce|csrf|token|timestamp|build|cache|hash)\s*[:=]\s*[\"']?[-_a-zA-Z0-9:.]{6,}[\"']?", r"\1=", normalized, flags=re.IGNORECASE)
+    normalized = re.sub(r"\s+", " ", normalized).strip().lower()
+    return normalized
+
+
+def _load_corpus(path: str) -> dict[str, str]:
+    pages = {}
+    for name in sorted(os.listdir(path)):
+        if not name.lower().endswith((".html", ".htm")):
+            continue
+        with open(os.path.join(path, name), "r", encoding="utf-8", errors="replace") as page:
+            pages[name] = page.read()
+    return pages
+
+
+def _synthetic_page(seed: int, size_bytes: int = 2_000_000) -> str:
+    # Похоже на типичный сайт гонки: много inline-скриптов, стили, трекинг в ссылках.
+    rnd = random.Random(seed)
+    blocks = []
+    size = 0
+    while size < size_bytes:
+        kind = rnd.random()
+        if kind < 0.35:
+            block = "<script>var nonce='%s';%s</script>" % (rnd.getrandbits(64), "x=1;" * rnd.randint(200, 2000))
+        elif kind < 0.45:
+            block = "<style>.c%s{color:red}%s</style>" % (rnd.randint(0, 999), ".a{b:c}" * rnd.randint(50, 500))
+        elif kind < 0.5:
+            block = "<!-- build %s -->" % rnd.getrandbits(32)
+        else:
+            block = '<p>Trail %s km <a href="/race?utm_source=fb&v=%s">Inscrições</a></p>\n' % (
+                rnd.randint(5, 100),
+                rnd.getrandbits(16),
+            )
+        blocks.append(block)
+        size += len(block)
+    return "<html><body>" + "".join(blocks) + "</body></html>"
+
+
+def _best_time(func, html: str, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func(html)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def _legacy_hash(html: str) -> str:
+    return hashlib.sha256(normalize_html_for_hash_legacy(html).encode("utf-8")).hexdigest()
+
+
+def run_benchmark(pages: dict[str, str], repeat: int) -> bool:
+    total_legacy = 0.0
+    total_new = 0.0
+    total_bytes = 0
+    compatible = True
+    print(f"{'page':40} {'KB':>8} {'legacy ms':>10} {'new ms':>10} {'speedup':>8}")
+    for name, html in pages.items():
+        legacy_hash = _legacy_hash(html)
+        new_hash = _hash_html(html)
+        if legacy_hash != new_hash:
+            compatible = False
+            print(f"❌ {name}: хеши различаются ({legacy_hash[:12]} != {new_hash[:12]})")
+        legacy_sec = _best_time(_legacy_hash, html, repeat)
+        new_sec = _best_time(_hash_html, html, repeat)
+        total_legacy += legacy_sec
+        total_new += new_sec
+        total_bytes += len(html.encode("utf-8"))
+        print(
+            f"{name[:40]:40} {len(html) / 1024:8.0f} {legacy_sec * 1000:10.1f} {new_sec * 1000:10.1f} "
+            f"{legacy_sec / new_sec if new_sec else float('inf'):7.1f}x"
+        )
+    if pages:
+        print(
+            f"\nИтого: {len(pages)} страниц, {total_bytes / 1024 / 1024:.1f} МБ — legacy {total_legacy:.2f} с, "
+            f"новый {total_new:.2f} с, ускорение {total_legacy / total_new if total_new else float('inf'):.1f}x; "
+            f"хеши {'совпадают' if compatible else 'РАЗЛИЧАЮТСЯ'}"
+        )
+    return compatible
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Бенчмарк нормализации HTML для хеша снимка сайта.")
+    parser.add_argument("corpus", nargs="?", help="Папка с сохранёнными страницами (*.html, *.htm)")
+    parser.add_argument("--synthetic", type=int, default=0, help="Сгенерировать N синтетических страниц ~2 МБ")
+    parser.add_argument("--repeat", type=int, default=3, help="Повторов на страницу (берётся лучшее время)")
+    args = parser.parse_args(argv)
+
+    pages = {}
+    if args.corpus:
+        pages.update(_load_corpus(args.corpus))
+    for seed in range(args.synthetic):
+        pages[f"synthetic-{seed}.html"] = _synthetic_page(seed)
+    if not pages:
+        parser.error("укажите папку с корпусом страниц или --synthetic N")
+
+    return 0 if run_benchmark(pages, max(1, args.repeat)) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
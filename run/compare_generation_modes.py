@@ -0,0 +1,180 @@
+"""Сравнение двухпроходной и однопроходной генерации (OPENAI_SINGLE_PASS).
+
+Для каждого сохранённого входа прогоняет оба режима так же, как main:
+- двухпроходный: первый ассистент → второй ассистент → clean_assistant_result;
+- однопроходный: первый ассистент с правилами single_pass_rules.txt → clean_assistant_result.
+Печатает unified diff по каждому различающемуся полю, пропущенные PT-поля и
+расход токенов/времени по режимам. Код возврата 1, если у однопроходного
+результата есть пропущенные PT-поля (в main такое событие ушло бы во второй ассистент).
+
+Вход — JSON-файл с полями prompt (промпт первого ассистента), regulations_url
+и необязательным pdf (путь к PDF регламента относительно файла). Сохранить вход
+по ссылкам события:
+    python compare_generation_modes.py /app/data/cases --add-case trail-x \\
+        --website https://example.pt/race --regulations https://example.pt/rules.pdf
+
+Запуск:
+    python compare_generation_modes.py /app/data/cases
+    python compare_generation_modes.py /app/data/cases --no-cache --out /app/data/compare
+"""
+
+import argparse
+import difflib
+import json
+import os
+import shutil
+import sys
+import time
+
+import run_metrics
+from _2_content_generation import (
+    build_first_assistant_prompt,
+    call_openai_assistant,
+    call_second_openai_assistant,
+    clean_assistant_result,
+    extract_text_from_url,
+    normalize_regulations_link_block,
+)
+from openai_file_cache import upload_pdf_cached
+from url_utils import unwrap_google_viewer_url
+from utils import get_missing_pt_fields
+
+_TOKEN_COUNTERS = ("openai_input_tokens", "openai_output_tokens")
+
+
+def _field_text(value) -> str:
+    if isinstance(value, list):
+        return "\n".join(str(item) for item in value)
+    return "" if value is None else str(value)
+
+
+def diff_results(two_pass: dict, single_pass: dict) -> dict[str, list[str]]:
+    """{поле: строки unified diff} для полей, которые различаются между режимами."""
+    diffs = {}
+    for field in sorted(set(two_pass or {}) | set(single_pass or {})):
+        before = _field_text((two_pass or {}).get(field)).splitlines()
+        after = _field_text((single_pass or {}).get(field)).splitlines()
+        if before == after:
+            continue
+        diffs[field] = list(
+            difflib.unified_diff(before, after, fromfile=f"two-pass/{field}", tofile=f"single-pass/{field}", lineterm="")
+        )
+    return diffs
+
+
+def _load_cases(path: str) -> dict[str, dict]:
+    cases = {}
+    for name in sorted(os.listdir(path)):
+        if not name.endswith(".json"):
+            continue
+        with open(os.path.join(path, name), "r", encoding="utf-8") as case_file:
+            case = json.load(case_file)
+        if case.get("pdf") and not os.path.isabs(case["pdf"]):
+            case["pdf"] = os.path.join(path, case["pdf"])
+        cases[name[:-5]] = case
+    return cases
+
+
+def add_case(path: str, name: str, website_url: str, regulations_url: str) -> str:
+    website_text, _ = extract_text_from_url(website_url) if website_url else ("", None)
+    regulations_url = unwrap_google_viewer_url(regulations_url or "")
+    regulations_text, pdf_path = extract_text_from_url(regulations_url) if regulations_url else ("", None)
+    case = {
+        "prompt": build_first_assistant_prompt(
+            regulations_url=regulations_url,
+            regulations_text=regulations_text,
+            website_text=website_text,
+        ),
+        "regulations_url": regulations_url,
+    }
+    os.makedirs(path, exist_ok=True)
+    if pdf_path:
+        case["pdf"] = f"{name}.pdf"
+        shutil.move(pdf_path, os.path.join(path, case["pdf"]))
+    case_path = os.path.join(path, f"{name}.json")
+    with open(case_path, "w", encoding="utf-8") as case_file:
+        json.dump(case, case_file, ensure_ascii=False, indent=2)
+    return case_path
+
+
+def _run_mode(case: dict, file_ids: list[str], single_pass: bool, use_cache: bool):
+    before = run_metrics.snapshot()
+    started = time.perf_counter()
+    regulations_url = case.get("regulations_url", "")
+    result = call_openai_assistant(case["prompt"], file_ids=file_ids, use_cache=use_cache, single_pass=single_pass)
+    if result is not None:
+        result = normalize_regulations_link_block(result, regulations_url)
+        if not single_pass:
+            regulations_hint = f"REGULATIONS LINK: {regulations_url if regulations_url else '(empty)'}"
+            result = call_second_openai_assistant(result, regulations_hint=regulations_hint, use_cache=use_cache)
+        if result is not None:
+            result = clean_assistant_result(result, regulations_url)
+    after = run_metrics.snapshot()
+    tokens = sum(after.get(name, 0) - before.get(name, 0) for name in _TOKEN_COUNTERS)
+    return result, tokens, time.perf_counter() - started
+
+
+def compare_cases(cases: dict[str, dict], use_cache: bool, out_dir: str | None = None) -> bool:
+    totals = {"two-pass": [0, 0.0], "single-pass": [0, 0.0]}
+    complete = True
+    for name, case in cases.items():
+        file_ids = [upload_pdf_cached(case["pdf"])] if case.get("pdf") else []
+        two_pass, two_tokens, two_sec = _run_mode(case, file_ids, single_pass=False, use_cache=use_cache)
+        single, single_tokens, single_sec = _run_mode(case, file_ids, single_pass=True, use_cache=use_cache)
+        totals["two-pass"][0] += two_tokens
+        totals["two-pass"][1] += two_sec
+        totals["single-pass"][0] += single_tokens
+        totals["single-pass"][1] += single_sec
+
+        print(f"\n=== {name}: two-pass {two_tokens} ток./{two_sec:.1f} с, single-pass {single_tokens} ток./{single_sec:.1f} с")
+        if two_pass is None or single is None:
+            print(f"❌ {name}: нет результата ({'two-pass' if two_pass is None else 'single-pass'})")
+            complete = False
+            continue
+        missing = get_missing_pt_fields(single)
+        if missing:
+            complete = False
+            print(f"⚠️ single-pass без PT-переводов: {', '.join(missing)}")
+        diffs = diff_results(two_pass, single)
+        if not diffs:
+            print("✅ Результаты совпадают")
+        for field, lines in diffs.items():
+            print("\n".join(lines))
+        if out_dir:
+            os.makedirs(out_dir, exist_ok=True)
+            for mode, result in (("two-pass", two_pass), ("single-pass", single)):
+                with open(os.path.join(out_dir, f"{name}.{mode}.json"), "w", encoding="utf-8") as out_file:
+                    json.dump(result, out_file, ensure_ascii=False, indent=2)
+
+    if cases:
+        print(
+            f"\nИтого: {len(cases)} входов — two-pass {totals['two-pass'][0]} ток., {totals['two-pass'][1]:.1f} с; "
+            f"single-pass {totals['single-pass'][0]} ток., {totals['single-pass'][1]:.1f} с"
+        )
+    return complete
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Сравнение двухпроходной и однопроходной генерации текстов.")
+    parser.add_argument("cases", help="Папка с сохранёнными входами (*.json)")
+    parser.add_argument("--add-case", metavar="NAME", help="Сохранить вход NAME по ссылкам --website/--regulations и выйти")
+    parser.add_argument("--website", default="", help="WEBSITE события (для --add-case)")
+    parser.add_argument("--regulations", default="", help="REGULATIONS события (для --add-case)")
+    parser.add_argument("--no-cache", action="store_true", help="Не использовать кеш ответов OpenAI")
+    parser.add_argument("--out", help="Папка для JSON-результатов обоих режимов")
+    args = parser.parse_args(argv)
+
+    if args.add_case:
+        if not args.website and not args.regulations:
+            parser.error("для --add-case нужен --website и/или --regulations")
+        print(f"💾 Вход сохранён: {add_case(args.cases, args.add_case, args.website, args.regulations)}")
+        return 0
+
+    cases = _load_cases(args.cases)
+    if not cases:
+        parser.error(f"в папке {args.cases} нет входов (*.json)")
+    return 0 if compare_cases(cases, use_cache=not args.no_cache, out_dir=args.out) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
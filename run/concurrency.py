@@ -0,0 +1,58 @@
+"""Ограничители параллелизма для внешних сервисов.
+
+При параллельной обработке событий (EVENT_WORKERS > 1) каждый поток ходит
+в OpenAI, OpenCage, WooCommerce, Google Sheets и на сайты организаторов.
+Чтобы не упереться в rate limit, каждый сервис получает свой семафор с
+отдельным лимитом из переменных окружения.
+
+Слот берётся только вокруг одного сетевого вызова и никогда не удерживается
+при вызове другого сервиса — так вложенные захваты невозможны.
+"""
+
+import asyncio
+import os
+import threading
+from contextlib import asynccontextmanager, contextmanager
+
+_BACKEND_LIMITS = {
+    "openai": int(os.getenv("OPENAI_MAX_CONCURRENCY", "4")),
+    "opencage": int(os.getenv("OPENCAGE_MAX_CONCURRENCY", "1")),
+    "woocommerce": int(os.getenv("WOOCOMMERCE_MAX_CONCURRENCY", "4")),
+    "sheets": int(os.getenv("GOOGLE_SHEETS_MAX_CONCURRENCY", "2")),
+    "website": int(os.getenv("WEBSITE_FETCH_MAX_CONCURRENCY", "8")),
+}
+
+_semaphores = {
+    name: threading.BoundedSemaphore(max(1, limit))
+    for name, limit in _BACKEND_LIMITS.items()
+}
+
+
+@contextmanager
+def backend_slot(name: str):
+    """Занимает слот сервиса name на время блока; для неизвестных сервисов ничего не ограничивает."""
+    semaphore = _semaphores.get(name)
+    if semaphore is None:
+        yield
+        return
+    with semaphore:
+        yield
+
+
+@asynccontextmanager
+async def async_backend_slot(name: str, poll_interval: float = 0.05):
+    """Тот же слот, что и backend_slot, но без блокировки event loop.
+
+    Семафор общий с потоками, поэтому корутины и потоки из asyncio.to_thread
+    вместе не превышают лимит сервиса.
+    """
+    semaphore = _semaphores.get(name)
+    if semaphore is None:
+        yield
+        return
+    while not semaphore.acquire(blocking=False):
+        await asyncio.sleep(poll_interval)
+    try:
+        yield
+    finally:
+        semaphore.release()
@@ -16,7 +16,8 @@
 - совпадение даты старта (обязательный подтверждающий сигнал: одинаковое имя
   при РАЗНОЙ дате — это, как правило, легитимные ежегодные издания, не дубль);
 - совпадение внешнего URL;
-- близость по координатам.
+- близость по координатам (пустые координаты продукта дополняются из кеша
+  геокодинга основного pipeline).
 
 Запуск (с загруженным окружением проекта):
     python find_duplicate_races.py                 # полный прогон + запись вкладки
@@ -29,15 +30,15 @@ import argparse
 import logging
 import re
 import sys
-import time
 import unicodedata
 from collections import defaultdict
 from difflib import SequenceMatcher
 
 import gspread
-import requests
 
 from _1_google_loader import load_config, _load_credentials, load_all_rows, SPREADSHEET_ID
+from geocode_cache import lookup_coordinates
+import http_client
 
 logger = logging.getLogger("DuplicateFinder")
 
@@ -189,20 +190,11 @@ def fetch_all_products(config: dict, lang: str = "pt", limit: int | None = None)
 
 
 def _get_with_retry(url, auth, params, timeout, config):
+    # Повторы (в т.ч. с Retry-After) и пул соединений — в общем http_client.
     attempts = int(config.get("wcapi_max_attempts", 4))
-    base_delay = float(config.get("wcapi_base_delay_sec", 1.5))
-    last_err = None
-    for attempt in range(1, attempts + 1):
-        try:
-            resp = requests.get(url, auth=auth, params=params, timeout=timeout)
-            resp.raise_for_status()
-            return resp
-        except Exception as exc:
-            last_err = exc
-            logger.warning("⚠️ WC API ошибка (попытка %d/%d): %s", attempt, attempts, exc)
-            if attempt < attempts:
-                time.sleep(base_delay * (2 ** (attempt - 1)))
-    raise last_err
+    resp = http_client.get(url, auth=auth, params=params, timeout=timeout, max_retries=attempts - 1)
+    resp.raise_for_status()
+    return resp
 
 
 def build_product_id_to_website(rows) -> dict:
@@ -250,6 +242,19 @@ def build_records(products: list[dict], id_to_website: dict) -> list[dict]:
     return records
 
 
+def fill_missing_coordinates_from_cache(records: list[dict]) -> int:
+    """Дополняет пустые lat/lon из общего кеша геокодинга (без запросов к OpenCage)."""
+    filled = 0
+    for record in records:
+        if str(record["lat"]).strip() and str(record["lon"]).strip():
+            continue
+        cached = lookup_coordinates(record["location"]) if record["location"] else None
+        if cached and cached[0] is not None:
+            record["lat"], record["lon"] = cached
+            filled += 1
+    return filled
+
+
 # --------------------------- Поиск дублей ---------------------------
 
 def candidate_pairs(records: list[dict]):
@@ -528,6 +533,8 @@ def main():
     logger.info("Сопоставлено WP PRODUCT ID -> WEBSITE: %d", len(id_to_website))
 
     records = build_records(products, id_to_website)
+    filled = fill_missing_coordinates_from_cache(records)
+    logger.info("📍 Координаты из кеша геокодинга: %d", filled)
     groups = find_duplicate_groups(records)
 
     logger.info("=== Найдено групп подозреваемых дублей: %d ===", len(groups))
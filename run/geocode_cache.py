@@ -0,0 +1,50 @@
+"""Постоянный кеш геокодинга OpenCage поверх state_store.
+
+Ключ — нормализованный запрос (регистр, пробелы и диакритика не важны),
+поэтому «Santa Comba Dão» и «santa comba dao » попадают в одну запись.
+Найденные координаты живут GEOCODE_CACHE_TTL_DAYS, а «ничего не найдено» —
+GEOCODE_NEGATIVE_TTL_DAYS, чтобы не спрашивать OpenCage об одном и том же
+неизвестном месте в каждом запуске, но и не запоминать промах навсегда.
+Сетевые ошибки в кеш не попадают.
+"""
+
+import os
+import re
+import time
+import unicodedata
+
+import run_metrics
+from state_store import get_geocode_entry, save_geocode_entry
+
+GEOCODE_CACHE_TTL_DAYS = float(os.getenv("GEOCODE_CACHE_TTL_DAYS", "180"))
+GEOCODE_NEGATIVE_TTL_DAYS = float(os.getenv("GEOCODE_NEGATIVE_TTL_DAYS", "7"))
+
+
+def normalize_geocode_query(query: str) -> str:
+    text = unicodedata.normalize("NFKD", str(query or ""))
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    return re.sub(r"\s+", " ", text).strip().casefold()
+
+
+def lookup_coordinates(query: str):
+    """(lat, lon) из кеша; (None, None) — закешированное «не найдено»; None — в кеше нет."""
+    key = normalize_geocode_query(query)
+    if not key:
+        return None
+    entry = get_geocode_entry(key)
+    if entry is None:
+        run_metrics.increment("geocode_cache_miss")
+        return None
+    lat, lon, updated_at = entry
+    ttl_days = GEOCODE_CACHE_TTL_DAYS if lat is not None else GEOCODE_NEGATIVE_TTL_DAYS
+    if time.time() - updated_at > ttl_days * 86400:
+        run_metrics.increment("geocode_cache_miss")
+        return None
+    run_metrics.increment("geocode_cache_hit")
+    return lat, lon
+
+
+def store_coordinates(query: str, lat, lon):
+    key = normalize_geocode_query(query)
+    if key:
+        save_geocode_entry(key, lat, lon)
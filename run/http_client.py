@@ -0,0 +1,212 @@
+"""Общий HTTP-клиент для запросов к WordPress/WooCommerce.
+
+Один `requests.Session` на процесс: keep-alive и пул соединений вместо нового
+TLS-рукопожатия на каждый запрос. Поверх сессии:
+- таймаут по умолчанию (HTTP_TIMEOUT_SEC), если вызывающий код его не указал;
+- повторы на 429/5xx и сетевые ошибки с учётом заголовка Retry-After
+  (POST/PATCH повторяются только на 429 и на ошибки установки соединения —
+  запрос не был обработан, дубля не будет; ReadTimeout и обрыв после отправки
+  не повторяются: сервер мог уже создать товар/вариации);
+- ограничение одновременных запросов на хост (HTTP_MAX_PER_HOST);
+- счётчики запросов/повторов/ошибок в run_metrics.
+
+`WooCommerceClient` повторяет интерфейс `woocommerce.API` (get/post/put/delete
+по endpoint'у wc/v3) поверх этого же клиента.
+"""
+
+import email.utils
+import json
+import logging
+import os
+import threading
+import time
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import MaxRetryError, NewConnectionError
+
+import run_metrics
+
+HTTP_TIMEOUT_SEC = float(os.getenv("HTTP_TIMEOUT_SEC", "30"))
+HTTP_MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", "3"))
+HTTP_RETRY_BASE_DELAY_SEC = float(os.getenv("HTTP_RETRY_BASE_DELAY_SEC", "1.5"))
+HTTP_RETRY_AFTER_MAX_SEC = float(os.getenv("HTTP_RETRY_AFTER_MAX_SEC", "60"))
+HTTP_MAX_PER_HOST = int(os.getenv("HTTP_MAX_PER_HOST", "4"))
+HTTP_POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", "16"))
+
+_RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+_NON_IDEMPOTENT_METHODS = {"POST", "PATCH"}
+
+_session = None
+_session_lock = threading.Lock()
+_host_semaphores = {}
+
+
+def get_session() -> requests.Session:
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=8, pool_maxsize=HTTP_POOL_MAXSIZE)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _session = session
+        return _session
+
+
+def _host_slot(url: str) -> threading.BoundedSemaphore:
+    host = (urlparse(url).hostname or "").lower()
+    with _session_lock:
+        semaphore = _host_semaphores.get(host)
+        if semaphore is None:
+            semaphore = threading.BoundedSemaphore(max(1, HTTP_MAX_PER_HOST))
+            _host_semaphores[host] = semaphore
+        return semaphore
+
+
+def _retry_after_seconds(response) -> float | None:
+    value = (response.headers.get("Retry-After") or "").strip()
+    if not value:
+        return None
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            seconds = email.utils.parsedate_to_datetime(value).timestamp() - time.time()
+        except (TypeError, ValueError):
+            return None
+    return min(max(seconds, 0.0), HTTP_RETRY_AFTER_MAX_SEC)
+
+
+def _is_retryable(method: str, status_code: int) -> bool:
+    if status_code == 429:
+        return True
+    return method not in _NON_IDEMPOTENT_METHODS and status_code in _RETRYABLE_STATUSES
+
+
+def _request_not_sent(exc: Exception) -> bool:
+    # Соединение не установлено (таймаут подключения, DNS, отказ) — сервер запрос не видел.
+    if isinstance(exc, requests.exceptions.ConnectTimeout):
+        return True
+    if not isinstance(exc, requests.exceptions.ConnectionError) or isinstance(exc, requests.exceptions.Timeout):
+        return False
+    reason = exc.args[0] if exc.args else None
+    if isinstance(reason, MaxRetryError):
+        reason = reason.reason
+    return isinstance(reason, NewConnectionError)
+
+
+def _is_retryable_error(method: str, exc: Exception) -> bool:
+    return method not in _NON_IDEMPOTENT_METHODS or _request_not_sent(exc)
+
+
+def request(
+    method: str,
+    url: str,
+    max_retries: int | None = None,
+    retry_base_delay: float | None = None,
+    **kwargs,
+) -> requests.Response:
+    method = method.upper()
+    kwargs.setdefault("timeout", HTTP_TIMEOUT_SEC)
+    retries = HTTP_MAX_RETRIES if max_retries is None else max_retries
+    base_delay = HTTP_RETRY_BASE_DELAY_SEC if retry_base_delay is None else retry_base_delay
+    session = get_session()
+
+    for attempt in range(retries + 1):
+        run_metrics.increment("http_requests")
+        try:
+            with _host_slot(url):
+                response = session.request(method, url, **kwargs)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as exc:
+            run_metrics.increment("http_errors")
+            if attempt >= retries or not _is_retryable_error(method, exc):
+                raise
+            delay = base_delay * (2 ** attempt)
+            logging.warning("⚠️ HTTP %s %s: %s — повтор через %.1f сек", method, url, exc, delay)
+        else:
+            if not _is_retryable(method, response.status_code) or attempt >= retries:
+                if response.status_code >= 400:
+                    run_metrics.increment("http_errors")
+                return response
+            retry_after = _retry_after_seconds(response)
+            delay = retry_after if retry_after is not None else base_delay * (2 ** attempt)
+            logging.warning(
+                "⚠️ HTTP %s %s вернул %s — повтор через %.1f сек",
+                method,
+                url,
+                response.status_code,
+                delay,
+            )
+        run_metrics.increment("http_retries")
+        time.sleep(delay)
+
+
+def get(url: str, **kwargs) -> requests.Response:
+    return request("GET", url, **kwargs)
+
+
+def post(url: str, **kwargs) -> requests.Response:
+    return request("POST", url, **kwargs)
+
+
+def put(url: str, **kwargs) -> requests.Response:
+    return request("PUT", url, **kwargs)
+
+
+def delete(url: str, **kwargs) -> requests.Response:
+    return request("DELETE", url, **kwargs)
+
+
+class WooCommerceClient:
+    """Совместимая с woocommerce.API обёртка (wc/v3) поверх общего пула соединений."""
+
+    def __init__(
+        self,
+        url: str,
+        consumer_key: str,
+        consumer_secret: str,
+        version: str = "wc/v3",
+        timeout: float | None = None,
+        max_retries: int | None = None,
+        retry_base_delay: float | None = None,
+    ):
+        self.url = url.rstrip("/")
+        self.auth = (consumer_key, consumer_secret)
+        self.version = version
+        self.timeout = timeout or HTTP_TIMEOUT_SEC
+        # Повторы — только здесь (http_client.request): вызывающий код не должен оборачивать их своим циклом.
+        self.max_retries = max_retries
+        self.retry_base_delay = retry_base_delay
+
+    def _request(self, method: str, endpoint: str, data=None, params=None, **kwargs):
+        headers = {"Accept": "application/json"}
+        body = None
+        if data is not None:
+            headers["Content-Type"] = "application/json;charset=utf-8"
+            body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        return request(
+            method,
+            f"{self.url}/wp-json/{self.version}/{endpoint}",
+            params=params,
+            data=body,
+            headers=headers,
+            auth=self.auth,
+            timeout=kwargs.pop("timeout", self.timeout),
+            max_retries=kwargs.pop("max_retries", self.max_retries),
+            retry_base_delay=kwargs.pop("retry_base_delay", self.retry_base_delay),
+            **kwargs,
+        )
+
+    def get(self, endpoint: str, **kwargs):
+        return self._request("GET", endpoint, **kwargs)
+
+    def post(self, endpoint: str, data, **kwargs):
+        return self._request("POST", endpoint, data=data, **kwargs)
+
+    def put(self, endpoint: str, data, **kwargs):
+        return self._request("PUT", endpoint, data=data, **kwargs)
+
+    def delete(self, endpoint: str, **kwargs):
+        return self._request("DELETE", endpoint, **kwargs)
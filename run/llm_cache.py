@@ -0,0 +1,63 @@
+"""Кеш ответов OpenAI (первый и второй ассистент) поверх state_store.
+
+Ключ — модель, уровень размышления, температура, хеши system- и user-промпта
+и file_id приложенных PDF: при неизменных входах (строка вернулась в
+Revised (complete) из-за правки цены и т.п.) сохранённый JSON возвращается
+сразу, без запроса к модели. Суммарный размер ответов ограничен
+LLM_CACHE_MAX_MB — при превышении вытесняются давно не использованные записи;
+0 отключает кеш. Для отдельной строки кеш обходит колонка AI CACHE BYPASS.
+"""
+
+import hashlib
+import json
+import os
+
+import run_metrics
+from state_store import get_llm_response, save_llm_response
+
+LLM_CACHE_MAX_MB = float(os.getenv("LLM_CACHE_MAX_MB", "100"))
+
+
+def _sha256(text: str) -> str:
+    return hashlib.sha256((text or "").encode("utf-8")).hexdigest()
+
+
+def response_cache_key(
+    model: str,
+    reasoning_effort,
+    temperature,
+    system_prompt: str,
+    user_prompt: str,
+    file_ids=None,
+) -> str:
+    payload = {
+        "model": model or "",
+        "reasoning_effort": reasoning_effort or "",
+        "temperature": str(temperature or ""),
+        "system_prompt": _sha256(system_prompt),
+        "user_prompt": _sha256(user_prompt),
+        "file_ids": list(file_ids or []),
+    }
+    return _sha256(json.dumps(payload, sort_keys=True, separators=(",", ":")))
+
+
+def lookup_response(cache_key: str):
+    """Разобранный JSON-ответ из кеша или None."""
+    if LLM_CACHE_MAX_MB <= 0:
+        return None
+    stored = get_llm_response(cache_key)
+    if stored is None:
+        run_metrics.increment("llm_cache_miss")
+        return None
+    run_metrics.increment("llm_cache_hit")
+    return json.loads(stored)
+
+
+def store_response(cache_key: str, result):
+    if LLM_CACHE_MAX_MB <= 0 or result is None:
+        return
+    save_llm_response(
+        cache_key,
+        json.dumps(result, ensure_ascii=False),
+        int(LLM_CACHE_MAX_MB * 1024 * 1024),
+    )
@@ -1,13 +1,15 @@
 # С этим файлом будем работать
 
+import asyncio
 import os
 import logging
 import time
 import json
 import re
+import signal
 import socket
-import openai
-import requests
+import sys
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 import pytz
 
@@ -40,6 +42,10 @@ SCHEDULED_HOUR = int(os.getenv('SCHEDULED_HOUR', '2'))
 SCHEDULED_MINUTE = int(os.getenv('SCHEDULED_MINUTE', '0'))
 TIMEZONE = os.getenv('TIMEZONE', 'Europe/Moscow')
 PT_RETRY_ATTEMPTS = int(os.getenv('PT_RETRY_ATTEMPTS', '2'))
+INCREMENTAL_MODE = os.getenv('INCREMENTAL_MODE', 'false').lower() == 'true'
+REUSE_AI_FOR_UNCHANGED_SOURCES = os.getenv('REUSE_AI_FOR_UNCHANGED_SOURCES', 'true').lower() == 'true'
+EVENT_WORKERS = max(1, int(os.getenv('EVENT_WORKERS', '1')))
+PIPELINE_MODE = os.getenv('PIPELINE_MODE', 'sync').strip().lower()
 TELEGRAM_NOTIFICATIONS_ENABLED = os.getenv("TELEGRAM_NOTIFICATIONS_ENABLED", "false").lower() == "true"
 TELEGRAM_API_ID = os.getenv("TELEGRAM_API_ID", "")
 TELEGRAM_API_HASH = os.getenv("TELEGRAM_API_HASH", "")
@@ -51,6 +57,12 @@ STATUS_REVISED_COMPLETE = "Revised (complete)"
 STATUS_PUBLISHED = "Published"
 STATUS_PUBLISHED_INCOMPLETE = "Published (incomplete)"
 
+# Колонки с результатом генерации: без них переиспользовать прошлую генерацию нельзя.
+_GENERATED_TEXT_COLUMNS = ("SUMMARY", "ORG INFO", "SUMMARY (PT)", "ORG INFO (PT)")
+# Флаг строки «сгенерировать заново»: обходит кеш ответов OpenAI и переиспользование по хешу источников.
+AI_CACHE_BYPASS_COLUMN = "AI CACHE BYPASS"
+_TRUTHY_CELL_VALUES = {"1", "true", "yes", "y", "x", "sim", "да"}
+
 _LOG_FORMAT = "%(asctime)s [%(levelname)s] %(message)s"
 logging.basicConfig(level=LOG_LEVEL, format=_LOG_FORMAT)
 if LOG_FILE:
@@ -66,7 +78,10 @@ if LOG_FILE:
 from _1_google_loader import (
     load_config,
     load_all_rows,
-    batch_update_cells
+    batch_update_cells,
+    batch_update_rows,
+    flush_pending_updates,
+    replay_write_journal,
 )
 
 from _2_content_generation import (
@@ -74,8 +89,11 @@ from _2_content_generation import (
     build_first_assistant_prompt,
     validate_source_texts,
     normalize_regulations_link_block,
+    clean_assistant_result,
     call_openai_assistant,
     call_second_openai_assistant,
+    first_assistant_batch_request,
+    second_assistant_batch_request,
     generate_image,
     get_coordinates_with_city_fallback,
     translate_title_to_en
@@ -88,20 +106,47 @@ from _3_create_product import (
     get_category_id_by_name,
     get_category_translation_id,
     ensure_category_translation,
+    reset_category_index,
 )
 from _4_create_translation import create_or_update_product_pt as create_product_pt
-from _5_taxonomy_and_attributes import assign_attributes_to_product
-from _6_create_variations import sync_variations_by_ids
+from _5_taxonomy_and_attributes import assign_attributes_to_product, reset_attribute_registry
+from _6_create_variations import VariationBatchError, sync_variations_by_ids
 from utils import (
     normalize_attribute_payload,
     normalize_category_pairs,
     parse_subcategory_values,
     get_missing_pt_fields,
     normalize_attribute_name,
+    compute_event_fingerprint,
+)
+from state_store import (
+    get_event_fingerprint,
+    get_generation_source_hash,
+    save_event_fingerprint,
+    save_generation_source_hash,
+)
+from concurrency import backend_slot
+import http_client
+import run_metrics
+from async_pipeline import run_events_async
+from openai_file_cache import cleanup_stale_openai_files, file_sha256, upload_pdf_cached
+from source_cache import compute_source_hash
+import llm_cache
+from llm_cache import lookup_response
+from openai_batch import (
+    BATCH_COLUMN,
+    BATCH_PENDING,
+    OPENAI_BATCH_MODE,
+    PHASE_FIRST,
+    PHASE_SECOND,
+    BatchCollector,
+    collect_batch_results,
+    parse_checkpoint,
+    phase_completed,
 )
 from website_snapshot import (
-    compute_website_hash,
-    has_website_changed,
+    check_websites_changed,
+    fetch_website_snapshot,
     send_telegram_notification,
 )
 
@@ -146,6 +191,51 @@ def _cell_value_as_str(value) -> str:
     return str(value).strip()
 
 
+def _collect_event_child_rows(rows: list, main_position: int) -> list:
+    # Строки-вариации события: идут сразу после основной строки и имеют пустой STATUS.
+    child_rows = []
+    for sub_row_index, sub_row in rows[main_position + 1:]:
+        if str(sub_row.get("STATUS", "") or "").strip():
+            break
+        child_rows.append((sub_row_index, sub_row))
+    return child_rows
+
+
+def _is_resync_only(row, status: str, event_key: str, fingerprint: str) -> bool:
+    # Revised (complete) без изменений входных данных с последней публикации: генерацию пропускаем,
+    # в WooCommerce синхронизируем то, что уже лежит в таблице.
+    if not INCREMENTAL_MODE or status != STATUS_REVISED_COMPLETE.lower() or not event_key:
+        return False
+    if not _cell_value_as_str(row.get("WP PRODUCT ID PT", "")) or not _cell_value_as_str(row.get("WP PRODUCT ID EN", "")):
+        return False
+    return get_event_fingerprint(event_key) == fingerprint
+
+
+def _ai_cache_bypassed(row) -> bool:
+    return _cell_value_as_str(row.get(AI_CACHE_BYPASS_COLUMN, "")).lower() in _TRUTHY_CELL_VALUES
+
+
+def _can_reuse_generation(row, event_key: str, source_hash: str) -> bool:
+    # Источники (текст промпта и PDF) те же, что при последней успешной генерации, и её результат
+    # лежит в таблице: повторный вызов OpenAI ничего нового не даст.
+    if not REUSE_AI_FOR_UNCHANGED_SOURCES or not event_key or _ai_cache_bypassed(row):
+        return False
+    if not all(_cell_value_as_str(row.get(column, "")) for column in _GENERATED_TEXT_COLUMNS):
+        return False
+    return get_generation_source_hash(event_key) == source_hash
+
+
+def _lookup_or_defer_to_batch(openai_batch, phase: str, row_index: int, row, batch_request):
+    """(ответ из кеша или None, отложен ли запрос в OpenAI Batch)."""
+    cache_key, request_body = batch_request
+    cached = lookup_response(cache_key)
+    if cached is not None or not openai_batch.can_defer(phase, row_index):
+        return cached, False
+    openai_batch.defer(phase, row_index, cache_key, request_body)
+    logging.info("📦 ID=%s: запрос ассистента (%s) отложен в OpenAI Batch", row.get("ID"), phase)
+    return None, True
+
+
 def _write_variation_ids_to_sheet(row_to_variation_id: dict, column_name: str, headers: dict):
     if column_name not in headers:
         logging.warning("⚠️ Колонка '%s' не найдена в Google Sheets, ID вариаций не будут сохранены.", column_name)
@@ -154,6 +244,17 @@ def _write_variation_ids_to_sheet(row_to_variation_id: dict, column_name: str, h
         batch_update_cells(target_row_index, {column_name: str(variation_id)}, headers)
 
 
+def _reconcile_variations(product_id, variation_entries: list, lang: str, column_name: str, headers: dict) -> dict:
+    # Финальная синхронизация: даже при частичной ошибке batch сохраняем ID успешно применённых строк.
+    try:
+        row_to_variation_id = sync_variations_by_ids(product_id, variation_entries, lang=lang)
+    except VariationBatchError as exc:
+        _write_variation_ids_to_sheet(exc.row_to_variation_id, column_name, headers)
+        raise
+    _write_variation_ids_to_sheet(row_to_variation_id, column_name, headers)
+    return row_to_variation_id
+
+
 # --- Cancellation & refund policy (Race Info) + organizer contacts (internal) ---
 CANCELLATION_FALLBACK_EN = "Cancellation and refund policies are defined by the Event Organizer."
 CANCELLATION_FALLBACK_PT = "As políticas de cancelamento e reembolso são definidas pela organização do evento."
@@ -322,442 +423,720 @@ def wait_until_next_run():
     
     time.sleep(wait_seconds)
 
-def run_automation():
-    """Основная функция автоматизации"""
-    logging.info("🚀 Запуск автоматизации обработки данных")
+_VARIATION_ATTRIBUTE_COLUMNS = [
+    ("Distance", "DISTANCE"),
+    ("Team", "TEAM"),
+    ("Type", "TYPE"),
+    ("License", "LICENSE"),
+    ("Race Start Date", "RACE START DATE"),
+    ("Race Start Time", "RACE START TIME"),
+]
+
+
+def _main_row_attributes(row) -> dict:
+    attributes = {}
+    if row.get("ATTRIBUTE") and row.get("VALUE"):
+        attributes[normalize_attribute_name(row["ATTRIBUTE"])] = row["VALUE"]
+    for attr_name, col in _VARIATION_ATTRIBUTE_COLUMNS:
+        if row.get(col):
+            attributes[attr_name] = row[col]
+    return attributes
+
+
+def _child_row_attributes(sub_row) -> list:
+    var_attrs = []
+    if sub_row.get("ATTRIBUTE") and sub_row.get("VALUE"):
+        var_attrs.append({"name": normalize_attribute_name(sub_row["ATTRIBUTE"]), "option": sub_row["VALUE"]})
+    for attr_name, col in _VARIATION_ATTRIBUTE_COLUMNS:
+        if sub_row.get(col):
+            var_attrs.append({"name": attr_name, "option": sub_row[col]})
+    return var_attrs
+
+
+def _merge_attribute_payload(main_attributes: dict, variation_entries: list) -> dict:
+    attr_payload = normalize_attribute_payload(main_attributes)
+    for var in variation_entries:
+        for attr in var["attributes"]:
+            attr_name = normalize_attribute_name(attr.get("name", ""))
+            attr_option = str(attr.get("option", "")).strip()
+            if not attr_name or not attr_option:
+                continue
+            if attr_name not in attr_payload:
+                attr_payload[attr_name] = []
+            elif not isinstance(attr_payload[attr_name], list):
+                attr_payload[attr_name] = [attr_payload[attr_name]]
+            if attr_option not in attr_payload[attr_name]:
+                attr_payload[attr_name].append(attr_option)
+    return attr_payload
+
+
+def _event_prefetch_plan(rows: list, position: int) -> dict:
+    """Независимые входы события для асинхронной предзагрузки (PIPELINE_MODE=async)."""
+    _row_index, row = rows[position]
+    status = row.get("STATUS", "").strip().lower()
+    child_rows = _collect_event_child_rows(rows, position)
+    event_key = str(row.get("ID", "") or "").strip()
+    fingerprint = compute_event_fingerprint(row, [sub_row for _sub_index, sub_row in child_rows])
+    resync_only = _is_resync_only(row, status, event_key, fingerprint)
+
+    main_attributes = _main_row_attributes(row)
+    variation_entries = [{"attributes": [{"name": k, "option": v} for k, v in main_attributes.items()]}]
+    variation_entries.extend({"attributes": _child_row_attributes(sub_row)} for _sub_index, sub_row in child_rows)
+    return {
+        "location": row.get("LOCATION", ""),
+        "location_city": row.get("LOCATION (CITY)", ""),
+        "pt_title": "" if resync_only else row.get("RACE NAME (PT)", "").strip(),
+        "website_url": "" if resync_only else row.get("WEBSITE", ""),
+        "regulations_url": "" if resync_only else unwrap_google_viewer_url(row.get("REGULATIONS", "")),
+        "attributes": _merge_attribute_payload(main_attributes, variation_entries),
+    }
+
+
+def _process_revised_event(
+    config,
+    rows: list,
+    headers,
+    position: int,
+    prefetched: dict | None = None,
+    openai_batch: BatchCollector | None = None,
+):
+    """Полный цикл публикации одного события (основная строка + строки-вариации).
+
+    prefetched — результаты независимых запросов, уже выполненных асинхронным
+    pipeline (координаты, перевод названия, тексты источников); если ключа нет,
+    значение получается здесь синхронно. С openai_batch (OPENAI_BATCH_MODE)
+    запрос ассистента без готового ответа откладывается в Batch, а событие
+    дожидается следующего запуска.
+    """
+    prefetched = prefetched or {}
+    row_index, row = rows[position]
+    status = row.get("STATUS", "").strip().lower()
+    is_incomplete = status == STATUS_REVISED_INCOMPLETE.lower()
+    logging.info(f"📌 Обработка {row.get('STATUS')} (ID={row.get('ID')})")
+
+    child_rows = _collect_event_child_rows(rows, position)
+    event_key = str(row.get("ID", "") or "").strip()
+    fingerprint = compute_event_fingerprint(row, [sub_row for _sub_index, sub_row in child_rows])
+    resync_only = _is_resync_only(row, status, event_key, fingerprint)
+    if resync_only:
+        logging.info(
+            "⚡ Входные данные ID=%s не менялись с последней публикации — только синхронизация WooCommerce",
+            row.get("ID"),
+        )
 
-    log_network_diagnostics()
+    pdf_path = None
+    source_hash = None
+    try:
+        # --- 1. Подготовка данных ---
+        if "coordinates" in prefetched:
+            lat, lon = prefetched["coordinates"]
+        else:
+            lat, lon = get_coordinates_with_city_fallback(
+                row.get("LOCATION", ""),
+                row.get("LOCATION (CITY)", "")
+            )
+        row["LAT"] = lat if lat is not None else ""
+        row["LON"] = lon if lon is not None else ""
+
+        if not resync_only:
+            # Для incomplete и complete публикуем EN-название: переводим PT -> EN перед созданием/обновлением WP.
+            pt_title = row.get("RACE NAME (PT)", "").strip()
+            if "translated_title" in prefetched:
+                translated_title = prefetched["translated_title"]
+            else:
+                translated_title = translate_title_to_en(pt_title)
+            if translated_title:
+                row["RACE NAME"] = translated_title
+                batch_update_cells(row_index, {"RACE NAME": row["RACE NAME"]}, headers)
+
+        # Структурная локация (PT): резолвим муниципалитет из «Location (City)».
+        # Имя пишем в мету товара; district+region+термы+EN достраивает
+        # mu-plugin rf-auto-location на стороне WP. Флаг — в колонку LOCATION NOTE.
+        municipality_name = resolve_municipality(row.get("LOCATION (CITY)", ""))
+        row["RF_MUNICIPALITY_NAME"] = municipality_name or ""
+        batch_update_cells(
+            row_index,
+            {"LOCATION NOTE": "" if municipality_name else "⚠ Location not matched"},
+            headers,
+        )
 
-    config = load_config()
+        if not resync_only:
+            if "website" in prefetched:
+                website_text, _ = prefetched["website"]
+            else:
+                website_text, _ = extract_text_from_url(row.get("WEBSITE", ""))
+
+            regulations_url = unwrap_google_viewer_url(row.get("REGULATIONS", ""))
+            regulations_text = ""
+            if regulations_url:
+                if "regulations" in prefetched:
+                    regulations_text, pdf_path = prefetched["regulations"]
+                else:
+                    regulations_text, pdf_path = extract_text_from_url(regulations_url)
+
+            errors = validate_source_texts(
+                website_url=row.get("WEBSITE", ""),
+                website_text=website_text,
+                regulations_url=regulations_url,
+                regulations_text=regulations_text,
+                regulations_pdf_path=pdf_path
+            )
+            if errors:
+                status_message = "Error: " + "; ".join(errors)
+                logging.error("❌ Не удалось получить источники: %s", status_message)
+                batch_update_cells(row_index, {"STATUS": status_message}, headers)
+                return
+
+            combined_text = build_first_assistant_prompt(
+                regulations_url=regulations_url,
+                regulations_text=regulations_text,
+                website_text=website_text
+            )
+            if not combined_text.strip():
+                raise Exception("Нет текста для GPT")
 
-    # Пытаемся загрузить строки с несколькими быстрыми повторами при сетевых сбоях
-    max_attempts = 3
-    delay_sec = 10
-    last_error = None
-    for attempt in range(1, max_attempts + 1):
-        try:
-            rows, headers = load_all_rows()
-            break
-        except Exception as e:
-            last_error = e
-            logging.warning(f"⚠️ Не удалось загрузить строки из Google Sheets (попытка {attempt}/{max_attempts}): {e}")
-            if attempt < max_attempts:
-                logging.info(f"⏳ Повторная попытка через {delay_sec} сек...")
-                time.sleep(delay_sec)
-    else:
-        # Если все попытки исчерпаны — пробрасываем исключение, чтобы обработать выше и запланировать быстрый повтор
-        raise last_error
+            source_hash = compute_source_hash(combined_text, [file_sha256(pdf_path)] if pdf_path else [])
+            if not SKIP_AI and _can_reuse_generation(row, event_key, source_hash):
+                logging.info(
+                    "♻️ Источники ID=%s не менялись с последней генерации — OpenAI не вызываем, тексты берём из таблицы",
+                    row.get("ID"),
+                )
+                run_metrics.increment("ai_generation_skipped")
+            else:
+                if SKIP_AI:
+                    logging.info("🤖 SKIP_AI=true, используем заглушки")
+                    result = {
+                        "summary": "Заглушка summary",
+                        "org_info": "Заглушка org_info",
+                        "benefits": "Заглушка benefits",
+                        "faq": "",
+                        "summary_pt": "Заглушка summary_pt",
+                        "org_info_pt": "Заглушка org_info_pt",
+                        "benefits_pt": "Заглушка benefits_pt",
+                        "faq_pt": "",
+                        "image_prompt": "Placeholder image"
+                    }
+                else:
+                    use_ai_cache = not _ai_cache_bypassed(row)
+                    if not use_ai_cache:
+                        logging.info("🔁 %s для ID=%s — кеш ответов OpenAI не используется", AI_CACHE_BYPASS_COLUMN, row.get("ID"))
+                    file_ids = [upload_pdf_cached(pdf_path)] if pdf_path else []
+                    use_batch = openai_batch is not None and use_ai_cache
+                    single_pass = bool(config.get("openai_single_pass"))
+                    first_result = None
+                    if use_batch:
+                        first_result, deferred = _lookup_or_defer_to_batch(
+                            openai_batch, PHASE_FIRST, row_index, row,
+                            first_assistant_batch_request(combined_text, file_ids, single_pass=single_pass),
+                        )
+                        if deferred:
+                            return
+                    if first_result is None:
+                        first_result = call_openai_assistant(
+                            combined_text, file_ids=file_ids, use_cache=use_ai_cache, single_pass=single_pass
+                        )
+                    if first_result is None:
+                        logging.error("❌ Первый ассистент не вернул результат")
+                        return
+
+                    first_result = normalize_regulations_link_block(first_result, regulations_url)
+                    result = None
+                    missing_pt_fields = []
+                    total_attempts = 1 + max(0, PT_RETRY_ATTEMPTS)
+                    if single_pass:
+                        result = clean_assistant_result(first_result, regulations_url)
+                        missing_pt_fields = get_missing_pt_fields(result)
+                        if missing_pt_fields:
+                            # Второй ассистент проверяет паритет перевода и перегенерирует PT.
+                            logging.warning(
+                                "⚠️ Однопроходный режим: нет PT-переводов для %s — передаём во второй ассистент",
+                                ", ".join(missing_pt_fields),
+                            )
+                            result = None
+                        else:
+                            logging.info("✅ Однопроходная генерация завершена, второй ассистент не нужен")
+                            run_metrics.increment("single_pass_generated")
+                            total_attempts = 0
+                    if total_attempts:
+                        logging.info("✅ Первый ассистент завершил работу, передаём результат во второй ассистент")
+                    regulations_hint = f"REGULATIONS LINK: {regulations_url if regulations_url else '(empty)'}"
+                    for attempt in range(total_attempts):
+                        result = None
+                        if use_batch and attempt == 0:
+                            result, deferred = _lookup_or_defer_to_batch(
+                                openai_batch, PHASE_SECOND, row_index, row,
+                                second_assistant_batch_request(first_result, regulations_hint),
+                            )
+                            if deferred:
+                                return
+                        if result is None:
+                            # Повтор из-за пропущенных PT-полей должен спросить модель заново, а не взять тот же ответ из кеша.
+                            result = call_second_openai_assistant(
+                                first_result,
+                                regulations_hint=regulations_hint,
+                                use_cache=use_ai_cache and attempt == 0,
+                                retry=attempt > 0,
+                            )
+                        if result is None:
+                            logging.error("❌ Второй ассистент не вернул результат")
+                            continue
+                        result = clean_assistant_result(result, regulations_url)
+                        missing_pt_fields = get_missing_pt_fields(result)
+                        if not missing_pt_fields:
+                            break
+                        logging.warning(
+                            f"⚠️ Во втором ассистенте нет PT-переводов для {', '.join(missing_pt_fields)} "
+                            f"(попытка {attempt + 1}/{total_attempts})"
+                        )
+
+                    if result is None:
+                        logging.error("❌ Второй ассистент не вернул результат после повторов")
+                        return
+                    if missing_pt_fields:
+                        status_message = f"Error: missing PT fields ({', '.join(missing_pt_fields)})"
+                        logging.error(f"❌ {status_message}")
+                        batch_update_cells(row_index, {"STATUS": status_message}, headers)
+                        return
 
-    changed_websites = []
+                if SKIP_IMAGE or SKIP_AI:
+                    image_info = {"url": "https://dev.racefinder.pt/wp-content/uploads/2025/07/img-placeholder.png", "id": None}
+                else:
+                    image_info = generate_image(result["image_prompt"])
 
-    for i, (row_index, row) in enumerate(rows):
-        status_raw = row.get("STATUS", "").strip()
-        status = status_raw.lower()
-        row_id = row.get("ID", "unknown")
+                # Race Info: добавляем блок политики отмены/возврата (с фолбэком,
+                # если в регламенте/на сайте её нет) в конец org_info EN и PT.
+                org_info_en = _append_cancellation_block(
+                    result.get("org_info", ""), result.get("cancellation", ""), "en"
+                )
+                org_info_pt = _append_cancellation_block(
+                    result.get("org_info_pt", ""), result.get("cancellation_pt", ""), "pt"
+                )
 
-        logging.debug(f"Строка {row_index}: ID={row_id}, STATUS='{row.get('STATUS', '')}' -> '{status}'")
+                row.update({
+                    "SUMMARY": result.get("summary", ""),
+                    "ORG INFO": org_info_en,
+                    "BENEFITS": "\n".join(result["benefits"]) if isinstance(result.get("benefits"), list) else result.get("benefits", ""),
+                    "FAQ": result.get("faq", ""),
+                    "IMAGE URL": image_info.get("url", ""),
+                    "IMAGE ID": image_info.get("id", ""),
+                    "SUMMARY (PT)": result.get("summary_pt", ""),
+                    "ORG INFO (PT)": org_info_pt,
+                    "BENEFITS (PT)": "\n".join(result["benefits_pt"]) if isinstance(result.get("benefits_pt"), list) else result.get("benefits_pt", ""),
+                    "FAQ (PT)": result.get("faq_pt", ""),
+                    # Организатор — только для таблицы (внутреннее), в WP не публикуется.
+                    "ORGANIZER NAME": (result.get("organizer_name", "") or "").strip(),
+                    "ORGANIZER EMAIL": _extract_valid_emails(result.get("organizer_email", "")),
+                    "LAT": row["LAT"],
+                    "LON": row["LON"],
+                    "RACE NAME (PT)": row.get("RACE NAME (PT)", ""),
+                    "image_id": image_info.get("id", None)
+                })
+
+                batch_update_cells(row_index, {
+                    "SUMMARY": row["SUMMARY"],
+                    "ORG INFO": row["ORG INFO"],
+                    "BENEFITS": row["BENEFITS"],
+                    "FAQ": row["FAQ"],
+                    "IMAGE URL": row["IMAGE URL"],
+                    "SUMMARY (PT)": row["SUMMARY (PT)"],
+                    "ORG INFO (PT)": row["ORG INFO (PT)"],
+                    "BENEFITS (PT)": row["BENEFITS (PT)"],
+                    "FAQ (PT)": row["FAQ (PT)"],
+                    "ORGANIZER NAME": row["ORGANIZER NAME"],
+                    "ORGANIZER EMAIL": row["ORGANIZER EMAIL"],
+                    "RACE NAME (PT)": row["RACE NAME (PT)"],
+                    "RACE NAME": row.get("RACE NAME", "")
+                }, headers)
+                if "IMAGE ID" in headers:
+                    batch_update_cells(row_index, {"IMAGE ID": row["IMAGE ID"]}, headers)
+
+        # --- 2. Собираем атрибуты и первую вариацию ---
+        last_main_row = row.copy()
+        last_main_attributes = {}
+        last_main_row["extra_categories"] = set()
+        main_category = row.get("CATEGORY")
+        main_subcategory = row.get("SUBCATEGORY")
+        if main_category:
+            subcategories = parse_subcategory_values(main_subcategory)
+            if subcategories:
+                for subcategory in subcategories:
+                    last_main_row["extra_categories"].add((main_category, subcategory))
+            else:
+                last_main_row["extra_categories"].add((main_category, None))
+        last_main_attributes.update(_main_row_attributes(row))
+
+        variation_attributes = [{"name": k, "option": v} for k, v in last_main_attributes.items()]
+        variation_entries_en = [{
+            "row_index": row_index,
+            "existing_variation_id": _cell_value_as_str(row.get("WP VARIATION ID EN", "")),
+            "regular_price": str(row.get("PRICE", "0")),
+            "attributes": variation_attributes,
+        }]
+        variation_entries_pt = [{
+            "row_index": row_index,
+            "existing_variation_id": _cell_value_as_str(row.get("WP VARIATION ID PT", "")),
+            "regular_price": str(row.get("PRICE", "0")),
+            "attributes": variation_attributes,
+        }]
+
+        # --- 3. Собираем подвариации ---
+        for sub_row_index, sub_row in child_rows:
+            # Подкатегории со строк-вариаций: каждая пара (CATEGORY,
+            # SUBCATEGORY) берётся КАК ЕСТЬ — дочерний элемент привязывается
+            # к СВОЕМУ родителю (MTB→Cycling, Walking→Running), т.к. одна
+            # гонка может относиться к разным родительским категориям.
+            # Защиту от дублей родителей даёт строгая root-карта
+            # (CATEGORY_ROOT_MAP_JSON): каждый родитель = один фиксированный
+            # ID. Именно она чинит мусорные категории; blanket-удаление в
+            # f1ba788 было перебором и ломало мультикатегорийные гонки.
+            var_category = sub_row.get("CATEGORY")
+            if var_category:
+                var_subcategories = parse_subcategory_values(sub_row.get("SUBCATEGORY"))
+                if var_subcategories:
+                    for subcategory in var_subcategories:
+                        last_main_row["extra_categories"].add((var_category, subcategory))
+                else:
+                    last_main_row["extra_categories"].add((var_category, None))
+            var_attrs = _child_row_attributes(sub_row)
+            if var_attrs:
+                variation_entries_en.append({
+                    "row_index": sub_row_index,
+                    "existing_variation_id": _cell_value_as_str(sub_row.get("WP VARIATION ID EN", "")),
+                    "regular_price": str(sub_row.get("PRICE", "0")),
+                    "attributes": var_attrs,
+                })
+                variation_entries_pt.append({
+                    "row_index": sub_row_index,
+                    "existing_variation_id": _cell_value_as_str(sub_row.get("WP VARIATION ID PT", "")),
+                    "regular_price": str(sub_row.get("PRICE", "0")),
+                    "attributes": var_attrs,
+                })
+
+        # --- 4. Публикация в WooCommerce ---
+        # EN category names from sheet are treated as source of truth; PT categories are resolved via WPML translations.
+        last_main_row["CATEGORY_IDS_PT"] = _build_pt_category_ids_from_en(last_main_row)
+        last_main_row["extra_categories"] = [
+            (cat, sub_cat)
+            for cat, sub_cat in last_main_row.get("extra_categories", set())
+            if cat
+        ]
+
+        existing_pt_product_id = _cell_value_as_str(row.get("WP PRODUCT ID PT", "")) if not is_incomplete else ""
+        pt_product_id = create_product_pt_primary(
+            last_main_row,
+            existing_product_id=existing_pt_product_id or None
+        )
+        last_main_row["pt_product_id"] = pt_product_id
 
-        if status in (
-            STATUS_REVISED_INCOMPLETE.lower(),
-            STATUS_REVISED_COMPLETE.lower(),
-        ):
-            is_incomplete = status == STATUS_REVISED_INCOMPLETE.lower()
-            logging.info(f"📌 Обработка {row.get('STATUS')} (ID={row.get('ID')})")
+        # Получаем slug
+        try:
+            with backend_slot("woocommerce"):
+                r = http_client.get(f"{config['wp_url']}/wp-json/wc/v3/products/{pt_product_id}",
+                                    auth=(config["consumer_key"], config["consumer_secret"]))
+            r.raise_for_status()
+            data = r.json()
+            slug = data.get("slug", "")
+            permalink = data.get("permalink", "")
+            if permalink:
+                last_main_row["LINK RACEFINDER"] = permalink
+            elif slug:
+                last_main_row["LINK RACEFINDER"] = f"https://dev.racefinder.pt/event/{slug}"
+            else:
+                last_main_row["LINK RACEFINDER"] = ""
+        except Exception as e:
+            logging.error(f"Slug error: {e}")
+            last_main_row["LINK RACEFINDER"] = ""
+
+        attr_payload = _merge_attribute_payload(last_main_attributes, variation_entries_en)
+
+        assign_attributes_to_product(pt_product_id, attr_payload, lang="pt")
+        # Один проход на язык: загрузка, пакетное применение diff и проверка результата внутри sync_variations_by_ids.
+        _reconcile_variations(pt_product_id, variation_entries_pt, "pt", "WP VARIATION ID PT", headers)
+
+        existing_en_product_id = _cell_value_as_str(row.get("WP PRODUCT ID EN", "")) if not is_incomplete else ""
+        en_product_id = create_product_pt(
+            last_main_row,
+            pt_product_id,
+            attributes=attr_payload,
+            config=config,
+            existing_pt_product_id=existing_en_product_id or None
+        )
+        last_main_row["en_product_id"] = en_product_id
+        _reconcile_variations(en_product_id, variation_entries_en, "en", "WP VARIATION ID EN", headers)
 
+        snapshot = {"hash": "", "etag": "", "last_modified": ""}
+        if is_incomplete:
             try:
-                # --- 1. Подготовка данных ---
-                lat, lon = get_coordinates_with_city_fallback(
-                    row.get("LOCATION", ""),
-                    row.get("LOCATION (CITY)", "")
-                )
-                row["LAT"] = lat if lat is not None else ""
-                row["LON"] = lon if lon is not None else ""
+                snapshot = fetch_website_snapshot(row.get("WEBSITE", ""))
+            except Exception as exc:
+                logging.warning("⚠️ Не удалось снять снимок WEBSITE (ID=%s): %s", row.get("ID"), exc)
+
+        # --- 5. Обновление статуса в таблице ---
+        batch_update_cells(row_index, {
+            "STATUS": STATUS_PUBLISHED_INCOMPLETE if is_incomplete else STATUS_PUBLISHED,
+            "LINK RACEFINDER": last_main_row.get("LINK RACEFINDER", ""),
+            "WP PRODUCT ID EN": en_product_id or "",
+            "WP PRODUCT ID PT": pt_product_id or "",
+            "WEBSITE SNAPSHOT HASH": snapshot["hash"],
+            **_snapshot_validator_updates(snapshot, headers),
+        }, headers)
+
+        if event_key:
+            save_event_fingerprint(event_key, fingerprint)
+            if source_hash and not SKIP_AI:
+                save_generation_source_hash(event_key, source_hash)
+
+        logging.info(
+            "✅ Published ID=%s EN=%s PT=%s MODE=%s",
+            row.get("ID"),
+            en_product_id,
+            pt_product_id,
+            "incomplete" if is_incomplete else "complete"
+        )
 
-                # Для incomplete и complete публикуем EN-название: переводим PT -> EN перед созданием/обновлением WP.
-                pt_title = row.get("RACE NAME (PT)", "").strip()
-                translated_title = translate_title_to_en(pt_title)
-                if translated_title:
-                    row["RACE NAME"] = translated_title
-                    batch_update_cells(row_index, {"RACE NAME": row["RACE NAME"]}, headers)
-
-                if status in (
-                    STATUS_REVISED_INCOMPLETE.lower(),
-                    STATUS_REVISED_COMPLETE.lower(),
-                ):
-                    # Структурная локация (PT): резолвим муниципалитет из «Location (City)».
-                    # Имя пишем в мету товара; district+region+термы+EN достраивает
-                    # mu-plugin rf-auto-location на стороне WP. Флаг — в колонку LOCATION NOTE.
-                    municipality_name = resolve_municipality(row.get("LOCATION (CITY)", ""))
-                    row["RF_MUNICIPALITY_NAME"] = municipality_name or ""
-                    batch_update_cells(
-                        row_index,
-                        {"LOCATION NOTE": "" if municipality_name else "⚠ Location not matched"},
-                        headers,
-                    )
+    except Exception:
+        logging.exception(f"❌ Ошибка при обработке Revised ID={row.get('ID')}")
+    finally:
+        if pdf_path and os.path.exists(pdf_path):
+            os.remove(pdf_path)
+        # Контрольная точка: все записи события уходят в таблицу одним запросом.
+        flush_pending_updates()
+
+
+def _run_revised_events(config, rows: list, headers, positions: list[int], openai_batch: BatchCollector | None = None):
+    # События независимы (разные строки, разные продукты), поэтому их можно обрабатывать параллельно.
+    # Нагрузку на каждый внешний сервис ограничивают семафоры из concurrency.py.
+    started = time.monotonic()
+    if PIPELINE_MODE == "async" and positions:
+        asyncio.run(
+            run_events_async(
+                positions,
+                plan_event=lambda position: _event_prefetch_plan(rows, position),
+                process_event=lambda position, prefetched: _process_revised_event(
+                    config, rows, headers, position, prefetched, openai_batch=openai_batch
+                ),
+                max_concurrent_events=EVENT_WORKERS,
+            )
+        )
+    elif EVENT_WORKERS <= 1 or len(positions) <= 1:
+        for position in positions:
+            _process_revised_event(config, rows, headers, position, openai_batch=openai_batch)
+    else:
+        logging.info("🧵 Параллельная обработка %s событий, потоков: %s", len(positions), EVENT_WORKERS)
+        with ThreadPoolExecutor(max_workers=EVENT_WORKERS, thread_name_prefix="event") as executor:
+            futures = [
+                executor.submit(_process_revised_event, config, rows, headers, position, openai_batch=openai_batch)
+                for position in positions
+            ]
+            for future in futures:
+                future.result()
+    if positions:
+        # Для A/B сравнения режимов PIPELINE_MODE=sync|async по времени.
+        logging.info(
+            "⏱️ События Revised: %s шт. за %.1f сек (PIPELINE_MODE=%s, EVENT_WORKERS=%s)",
+            len(positions),
+            time.monotonic() - started,
+            PIPELINE_MODE,
+            EVENT_WORKERS,
+        )
 
-                    website_text, _ = extract_text_from_url(row.get("WEBSITE", ""))
-
-                    regulations_url = unwrap_google_viewer_url(row.get("REGULATIONS", ""))
-                    regulations_text, pdf_path = "", None
-                    file_ids = []
-                    if regulations_url:
-                        regulations_text, pdf_path = extract_text_from_url(regulations_url)
-                        if pdf_path:
-                            with open(pdf_path, "rb") as f:
-                                upload_response = openai.files.create(file=f, purpose="assistants")
-                            file_ids.append(upload_response.id)
-
-                    errors = validate_source_texts(
-                        website_url=row.get("WEBSITE", ""),
-                        website_text=website_text,
-                        regulations_url=regulations_url,
-                        regulations_text=regulations_text,
-                        regulations_pdf_path=pdf_path
-                    )
-                    if errors:
-                        status_message = "Error: " + "; ".join(errors)
-                        logging.error("❌ Не удалось получить источники: %s", status_message)
-                        batch_update_cells(row_index, {"STATUS": status_message}, headers)
-                        continue
 
-                    combined_text = build_first_assistant_prompt(
-                        regulations_url=regulations_url,
-                        regulations_text=regulations_text,
-                        website_text=website_text
-                    )
-                    if not combined_text.strip():
-                        raise Exception("Нет текста для GPT")
-
-                    if SKIP_AI:
-                        logging.info("🤖 SKIP_AI=true, используем заглушки")
-                        result = {
-                            "summary": "Заглушка summary",
-                            "org_info": "Заглушка org_info",
-                            "benefits": "Заглушка benefits",
-                            "faq": "",
-                            "summary_pt": "Заглушка summary_pt",
-                            "org_info_pt": "Заглушка org_info_pt",
-                            "benefits_pt": "Заглушка benefits_pt",
-                            "faq_pt": "",
-                            "image_prompt": "Placeholder image"
-                        }
-                    else:
-                        first_result = call_openai_assistant(combined_text, file_ids=file_ids)
-                        if first_result is None:
-                            logging.error("❌ Первый ассистент не вернул результат")
-                            continue
+def _prepare_openai_batch(rows: list, headers, positions: list[int]):
+    """(BatchCollector или None, позиции событий для обработки) для OPENAI_BATCH_MODE.
+
+    Забирает результаты заданий из колонки OPENAI BATCH в кеш ответов; события,
+    чьё задание ещё выполняется, в этом запуске пропускаются.
+    """
+    if not OPENAI_BATCH_MODE or SKIP_AI:
+        return None, positions
+    if BATCH_COLUMN not in headers:
+        logging.warning("⚠️ OPENAI_BATCH_MODE: нет колонки '%s' для контрольных точек — генерация синхронная", BATCH_COLUMN)
+        return None, positions
+    if llm_cache.LLM_CACHE_MAX_MB <= 0:
+        logging.warning("⚠️ OPENAI_BATCH_MODE требует кеш ответов (LLM_CACHE_MAX_MB > 0) — генерация синхронная")
+        return None, positions
+
+    checkpoints = {position: parse_checkpoint(rows[position][1].get(BATCH_COLUMN)) for position in positions}
+    states = collect_batch_results(checkpoint[1] for checkpoint in checkpoints.values() if checkpoint)
+    completed_phases = {}
+    ready_positions = []
+    for position in positions:
+        row_index, row = rows[position]
+        checkpoint = checkpoints[position]
+        if checkpoint and states.get(checkpoint[1]) == BATCH_PENDING:
+            logging.info("⏳ ID=%s ждёт результатов OpenAI Batch %s", row.get("ID"), checkpoint[1])
+            continue
+        if checkpoint:
+            # Результаты задания уже в кеше ответов: контрольная точка больше не нужна.
+            completed_phases[row_index] = phase_completed(checkpoint, states)
+            row[BATCH_COLUMN] = ""
+            batch_update_cells(row_index, {BATCH_COLUMN: ""}, headers)
+        ready_positions.append(position)
+    return BatchCollector(completed_phases), ready_positions
 
-                        logging.info("✅ Первый ассистент завершил работу, передаём результат во второй ассистент")
-                        first_result = normalize_regulations_link_block(first_result, regulations_url)
-                        regulations_hint = f"REGULATIONS LINK: {regulations_url if regulations_url else '(empty)'}"
-                        result = None
-                        missing_pt_fields = []
-                        total_attempts = 1 + max(0, PT_RETRY_ATTEMPTS)
-                        for attempt in range(total_attempts):
-                            result = call_second_openai_assistant(first_result, regulations_hint=regulations_hint)
-                            if result is None:
-                                logging.error("❌ Второй ассистент не вернул результат")
-                                continue
-                            missing_pt_fields = get_missing_pt_fields(result)
-                            if not missing_pt_fields:
-                                break
-                            logging.warning(
-                                f"⚠️ Во втором ассистенте нет PT-переводов для {', '.join(missing_pt_fields)} "
-                                f"(попытка {attempt + 1}/{total_attempts})"
-                            )
 
-                        if result is None:
-                            logging.error("❌ Второй ассистент не вернул результат после повторов")
-                            continue
-                        if missing_pt_fields:
-                            status_message = f"Error: missing PT fields ({', '.join(missing_pt_fields)})"
-                            logging.error(f"❌ {status_message}")
-                            batch_update_cells(row_index, {"STATUS": status_message}, headers)
-                            continue
+def _submit_openai_batch(openai_batch: BatchCollector, headers):
+    for row_index, checkpoint in openai_batch.submit().items():
+        batch_update_cells(row_index, {BATCH_COLUMN: checkpoint}, headers)
 
-                    if SKIP_IMAGE or SKIP_AI:
-                        image_info = {"url": "https://dev.racefinder.pt/wp-content/uploads/2025/07/img-placeholder.png", "id": None}
-                    else:
-                        image_info = generate_image(result["image_prompt"])
 
-                    # Race Info: добавляем блок политики отмены/возврата (с фолбэком,
-                    # если в регламенте/на сайте её нет) в конец org_info EN и PT.
-                    org_info_en = _append_cancellation_block(
-                        result.get("org_info", ""), result.get("cancellation", ""), "en"
-                    )
-                    org_info_pt = _append_cancellation_block(
-                        result.get("org_info_pt", ""), result.get("cancellation_pt", ""), "pt"
-                    )
+def _snapshot_validator_updates(snapshot: dict, headers) -> dict:
+    # ETag/Last-Modified пишем рядом с WEBSITE SNAPSHOT HASH, только если такие колонки есть в таблице.
+    updates = {}
+    for column, key in (("WEBSITE ETAG", "etag"), ("WEBSITE LAST MODIFIED", "last_modified")):
+        if column in headers:
+            updates[column] = snapshot.get(key, "")
+    return updates
 
-                    row.update({
-                        "SUMMARY": result.get("summary", ""),
-                        "ORG INFO": org_info_en,
-                        "BENEFITS": "\n".join(result["benefits"]) if isinstance(result.get("benefits"), list) else result.get("benefits", ""),
-                        "FAQ": result.get("faq", ""),
-                        "IMAGE URL": image_info.get("url", ""),
-                        "IMAGE ID": image_info.get("id", ""),
-                        "SUMMARY (PT)": result.get("summary_pt", ""),
-                        "ORG INFO (PT)": org_info_pt,
-                        "BENEFITS (PT)": "\n".join(result["benefits_pt"]) if isinstance(result.get("benefits_pt"), list) else result.get("benefits_pt", ""),
-                        "FAQ (PT)": result.get("faq_pt", ""),
-                        # Организатор — только для таблицы (внутреннее), в WP не публикуется.
-                        "ORGANIZER NAME": (result.get("organizer_name", "") or "").strip(),
-                        "ORGANIZER EMAIL": _extract_valid_emails(result.get("organizer_email", "")),
-                        "LAT": row["LAT"],
-                        "LON": row["LON"],
-                        "RACE NAME (PT)": row.get("RACE NAME (PT)", ""),
-                        "image_id": image_info.get("id", None)
-                    })
-
-                    batch_update_cells(row_index, {
-                        "SUMMARY": row["SUMMARY"],
-                        "ORG INFO": row["ORG INFO"],
-                        "BENEFITS": row["BENEFITS"],
-                        "FAQ": row["FAQ"],
-                        "IMAGE URL": row["IMAGE URL"],
-                        "SUMMARY (PT)": row["SUMMARY (PT)"],
-                        "ORG INFO (PT)": row["ORG INFO (PT)"],
-                        "BENEFITS (PT)": row["BENEFITS (PT)"],
-                        "FAQ (PT)": row["FAQ (PT)"],
-                        "ORGANIZER NAME": row["ORGANIZER NAME"],
-                        "ORGANIZER EMAIL": row["ORGANIZER EMAIL"],
-                        "RACE NAME (PT)": row["RACE NAME (PT)"],
-                        "RACE NAME": row.get("RACE NAME", "")
-                    }, headers)
-                    if "IMAGE ID" in headers:
-                        batch_update_cells(row_index, {"IMAGE ID": row["IMAGE ID"]}, headers)
-
-                # --- 2. Собираем атрибуты и первую вариацию ---
-                last_main_row = row.copy()
-                last_main_attributes = {}
-                last_main_row["extra_categories"] = set()
-                main_category = row.get("CATEGORY")
-                main_subcategory = row.get("SUBCATEGORY")
-                if main_category:
-                    subcategories = parse_subcategory_values(main_subcategory)
-                    if subcategories:
-                        for subcategory in subcategories:
-                            last_main_row["extra_categories"].add((main_category, subcategory))
-                    else:
-                        last_main_row["extra_categories"].add((main_category, None))
-                if row.get("ATTRIBUTE") and row.get("VALUE"):
-                    last_main_attributes[normalize_attribute_name(row["ATTRIBUTE"])] = row["VALUE"]
-
-                for attr_name, col in [
-                    ("Distance", "DISTANCE"),
-                    ("Team", "TEAM"),
-                    ("Type", "TYPE"),
-                    ("License", "LICENSE"),
-                    ("Race Start Date", "RACE START DATE"),
-                    ("Race Start Time", "RACE START TIME")
-                ]:
-                    if row.get(col):
-                        last_main_attributes[attr_name] = row[col]
-
-                variation_attributes = [{"name": k, "option": v} for k, v in last_main_attributes.items()]
-                variation_entries_en = [{
-                    "row_index": row_index,
-                    "existing_variation_id": _cell_value_as_str(row.get("WP VARIATION ID EN", "")),
-                    "regular_price": str(row.get("PRICE", "0")),
-                    "attributes": variation_attributes,
-                }]
-                variation_entries_pt = [{
-                    "row_index": row_index,
-                    "existing_variation_id": _cell_value_as_str(row.get("WP VARIATION ID PT", "")),
-                    "regular_price": str(row.get("PRICE", "0")),
-                    "attributes": variation_attributes,
-                }]
-
-                # --- 3. Собираем подвариации ---
-                for j in range(i + 1, len(rows)):
-                    sub_row_index, sub_row = rows[j]
-                    sub_status = sub_row.get("STATUS", "").strip().lower()
-                    if sub_status in (
-                        STATUS_REVISED_INCOMPLETE.lower(),
-                        STATUS_REVISED_COMPLETE.lower(),
-                        STATUS_PUBLISHED.lower(),
-                        STATUS_PUBLISHED_INCOMPLETE.lower(),
-                    ):
-                        break
-                    if sub_status == "":
-                        # Подкатегории со строк-вариаций: каждая пара (CATEGORY,
-                        # SUBCATEGORY) берётся КАК ЕСТЬ — дочерний элемент привязывается
-                        # к СВОЕМУ родителю (MTB→Cycling, Walking→Running), т.к. одна
-                        # гонка может относиться к разным родительским категориям.
-                        # Защиту от дублей родителей даёт строгая root-карта
-                        # (CATEGORY_ROOT_MAP_JSON): каждый родитель = один фиксированный
-                        # ID. Именно она чинит мусорные категории; blanket-удаление в
-                        # f1ba788 было перебором и ломало мультикатегорийные гонки.
-                        var_category = sub_row.get("CATEGORY")
-                        if var_category:
-                            var_subcategories = parse_subcategory_values(sub_row.get("SUBCATEGORY"))
-                            if var_subcategories:
-                                for subcategory in var_subcategories:
-                                    last_main_row["extra_categories"].add((var_category, subcategory))
-                            else:
-                                last_main_row["extra_categories"].add((var_category, None))
-                        var_attrs = []
-                        if sub_row.get("ATTRIBUTE") and sub_row.get("VALUE"):
-                            var_attrs.append({"name": normalize_attribute_name(sub_row["ATTRIBUTE"]), "option": sub_row["VALUE"]})
-                        for attr_name, col in [
-                            ("Distance", "DISTANCE"),
-                            ("Team", "TEAM"),
-                            ("Type", "TYPE"),
-                            ("License", "LICENSE"),
-                            ("Race Start Date", "RACE START DATE"),
-                            ("Race Start Time", "RACE START TIME")
-                        ]:
-                            if sub_row.get(col):
-                                var_attrs.append({"name": attr_name, "option": sub_row[col]})
-                        if var_attrs:
-                            variation_entries_en.append({
-                                "row_index": sub_row_index,
-                                "existing_variation_id": _cell_value_as_str(sub_row.get("WP VARIATION ID EN", "")),
-                                "regular_price": str(sub_row.get("PRICE", "0")),
-                                "attributes": var_attrs,
-                            })
-                            variation_entries_pt.append({
-                                "row_index": sub_row_index,
-                                "existing_variation_id": _cell_value_as_str(sub_row.get("WP VARIATION ID PT", "")),
-                                "regular_price": str(sub_row.get("PRICE", "0")),
-                                "attributes": var_attrs,
-                            })
-                    else:
-                        break
-
-                # --- 4. Публикация в WooCommerce ---
-                # EN category names from sheet are treated as source of truth; PT categories are resolved via WPML translations.
-                last_main_row["CATEGORY_IDS_PT"] = _build_pt_category_ids_from_en(last_main_row)
-                lat, lon = get_coordinates_with_city_fallback(
-                    last_main_row.get("LOCATION", ""),
-                    last_main_row.get("LOCATION (CITY)", "")
-                )
-                last_main_row["LAT"] = lat if lat is not None else ""
-                last_main_row["LON"] = lon if lon is not None else ""
-                last_main_row["extra_categories"] = [
-                    (cat, sub_cat)
-                    for cat, sub_cat in last_main_row.get("extra_categories", set())
-                    if cat
-                ]
-
-                existing_pt_product_id = _cell_value_as_str(row.get("WP PRODUCT ID PT", "")) if not is_incomplete else ""
-                pt_product_id = create_product_pt_primary(
-                    last_main_row,
-                    existing_product_id=existing_pt_product_id or None
-                )
-                last_main_row["pt_product_id"] = pt_product_id
 
-                # Получаем slug
-                try:
-                    r = requests.get(f"{config['wp_url']}/wp-json/wc/v3/products/{pt_product_id}",
-                                     auth=(config["consumer_key"], config["consumer_secret"]))
-                    r.raise_for_status()
-                    data = r.json()
-                    slug = data.get("slug", "")
-                    permalink = data.get("permalink", "")
-                    if permalink:
-                        last_main_row["LINK RACEFINDER"] = permalink
-                    elif slug:
-                        last_main_row["LINK RACEFINDER"] = f"https://dev.racefinder.pt/event/{slug}"
-                    else:
-                        last_main_row["LINK RACEFINDER"] = ""
-                except Exception as e:
-                    logging.error(f"Slug error: {e}")
-                    last_main_row["LINK RACEFINDER"] = ""
-
-                attr_payload = normalize_attribute_payload(last_main_attributes)
-                for var in variation_entries_en:
-                    for attr in var["attributes"]:
-                        attr_name = normalize_attribute_name(attr.get("name", ""))
-                        attr_option = str(attr.get("option", "")).strip()
-                        if not attr_name or not attr_option:
-                            continue
-                        if attr_name not in attr_payload:
-                            attr_payload[attr_name] = []
-                        elif not isinstance(attr_payload[attr_name], list):
-                            attr_payload[attr_name] = [attr_payload[attr_name]]
-                        if attr_option not in attr_payload[attr_name]:
-                            attr_payload[attr_name].append(attr_option)
-
-                assign_attributes_to_product(pt_product_id, attr_payload, lang="pt")
-                pt_row_to_variation_id = sync_variations_by_ids(pt_product_id, variation_entries_pt, lang="pt")
-
-                existing_en_product_id = _cell_value_as_str(row.get("WP PRODUCT ID EN", "")) if not is_incomplete else ""
-                en_product_id = create_product_pt(
-                    last_main_row,
-                    pt_product_id,
-                    attributes=attr_payload,
-                    last_variations=variation_entries_en,
-                    config=config,
-                    existing_pt_product_id=existing_en_product_id or None
-                )
-                last_main_row["en_product_id"] = en_product_id
-                en_row_to_variation_id = sync_variations_by_ids(en_product_id, variation_entries_en, lang="en")
+def _log_conditional_get_report(results: dict):
+    snapshots = [result for result in results.values() if not isinstance(result, Exception)]
+    if not snapshots:
+        return
+    not_modified = sum(1 for snapshot in snapshots if snapshot["not_modified"])
+    bytes_saved = sum(snapshot.get("bytes_saved", 0) for snapshot in snapshots)
+    bytes_downloaded = sum(snapshot.get("bytes", 0) for snapshot in snapshots)
+    run_metrics.increment("website_not_modified", not_modified)
+    run_metrics.increment("website_bytes_saved", bytes_saved)
+    run_metrics.increment("website_bytes_downloaded", bytes_downloaded)
+    logging.info(
+        "🌐 Условные запросы сайтов: 304 — %s из %s (%.0f%%), сэкономлено %.1f КБ, скачано %.1f КБ",
+        not_modified,
+        len(snapshots),
+        100.0 * not_modified / len(snapshots),
+        bytes_saved / 1024,
+        bytes_downloaded / 1024,
+    )
+
+
+def _monitor_published_incomplete(rows: list, headers) -> list[dict]:
+    """Проверяет сайты Published (incomplete) параллельно; возвращает список изменившихся."""
+    monitored = {}
+    for row_index, row in rows:
+        status = row.get("STATUS", "").strip().lower()
+        if status == STATUS_PUBLISHED.lower():
+            logging.debug(f"⏭ Пропуск Published (ID={row.get('ID')})")
+            continue
+        if status != STATUS_PUBLISHED_INCOMPLETE.lower():
+            continue
+        website_url = (row.get("WEBSITE", "") or "").strip()
+        previous_hash = (row.get("WEBSITE SNAPSHOT HASH", "") or "").strip()
+        if not previous_hash or not website_url:
+            logging.debug("⏭ Пропуск мониторинга Published (incomplete): нет WEBSITE SNAPSHOT HASH или WEBSITE (ID=%s)", row.get("ID"))
+            continue
+        monitored[row_index] = (row, website_url, previous_hash)
+
+    if not monitored:
+        return []
+
+    started = time.monotonic()
+    results = check_websites_changed(
+        [
+            (
+                row_index,
+                website_url,
+                previous_hash,
+                (row.get("WEBSITE ETAG", "") or "").strip(),
+                (row.get("WEBSITE LAST MODIFIED", "") or "").strip(),
+            )
+            for row_index, (row, website_url, previous_hash) in monitored.items()
+        ]
+    )
+    logging.info(
+        "⏱️ Мониторинг сайтов: проверено %s из %s за %.1f сек",
+        len(results),
+        len(monitored),
+        time.monotonic() - started,
+    )
+    _log_conditional_get_report(results)
+
+    checked_at = datetime.now(pytz.timezone(TIMEZONE)).strftime("%Y-%m-%d %H:%M:%S")
+    changed_websites = []
+    check_updates = {}
+    for row_index, (row, website_url, _previous_hash) in monitored.items():
+        if row_index not in results:
+            continue
+        result = results[row_index]
+        if isinstance(result, Exception):
+            logging.warning("⚠️ Не удалось загрузить WEBSITE для мониторинга (ID=%s): %s", row.get("ID"), result)
+            continue
+        check_updates[row_index] = {"LAST DIFF CHECK AT": checked_at}
+        if not result["changed"]:
+            # Новые валидаторы сохраняем, только пока страница совпадает со снимком:
+            # иначе следующий запрос получит 304 и изменение перестанет обнаруживаться.
+            check_updates[row_index].update(_snapshot_validator_updates(result, headers))
+        else:
+            logging.info("🔔 Изменения WEBSITE обнаружены для ID=%s", row.get("ID"))
+            changed_websites.append(
+                {
+                    "id": str(row.get("ID", "")).strip(),
+                    "race": str(row.get("RACE NAME", "")).strip(),
+                    "url": website_url,
+                }
+            )
 
-                # Final hard reconcile pass for BOTH langs.
-                # Keep only variations represented by current sheet block, then persist definitive IDs.
-                en_row_to_variation_id = sync_variations_by_ids(en_product_id, variation_entries_en, lang="en")
-                _write_variation_ids_to_sheet(en_row_to_variation_id, "WP VARIATION ID EN", headers)
+    # LAST DIFF CHECK AT всех проверенных строк — одним запросом к таблице.
+    if check_updates and not batch_update_rows(check_updates, headers):
+        logging.warning("⚠️ Не удалось записать LAST DIFF CHECK AT для %s строк", len(check_updates))
+    return changed_websites
 
-                pt_row_to_variation_id = sync_variations_by_ids(pt_product_id, variation_entries_pt, lang="pt")
-                _write_variation_ids_to_sheet(pt_row_to_variation_id, "WP VARIATION ID PT", headers)
 
-                snapshot_hash = ""
-                if is_incomplete:
-                    snapshot_hash, _ = compute_website_hash(row.get("WEBSITE", ""))
+def run_automation():
+    """Основная функция автоматизации"""
+    logging.info("🚀 Запуск автоматизации обработки данных")
 
-                # --- 5. Обновление статуса в таблице ---
-                batch_update_cells(row_index, {
-                    "STATUS": STATUS_PUBLISHED_INCOMPLETE if is_incomplete else STATUS_PUBLISHED,
-                    "LINK RACEFINDER": last_main_row.get("LINK RACEFINDER", ""),
-                    "WP PRODUCT ID EN": en_product_id or "",
-                    "WP PRODUCT ID PT": pt_product_id or "",
-                    "WEBSITE SNAPSHOT HASH": snapshot_hash
-                }, headers)
+    log_network_diagnostics()
 
-                logging.info(
-                    "✅ Published ID=%s EN=%s PT=%s MODE=%s",
-                    row.get("ID"),
-                    en_product_id,
-                    pt_product_id,
-                    "incomplete" if is_incomplete else "complete"
-                )
+    config = load_config()
+    run_metrics.reset()
+    # Категории и атрибуты могли поменяться в WP между запусками — реестры перечитываются один раз за запуск.
+    reset_category_index()
+    reset_attribute_registry()
 
-            except Exception as e:
-                logging.exception(f"❌ Ошибка при обработке Revised ID={row.get('ID')}")
-                continue
+    # Дописываем обновления, которые не успели уйти в таблицу при прошлом аварийном завершении.
+    try:
+        replay_write_journal()
+    except Exception as exc:
+        logging.warning("⚠️ Не удалось повторить журнал отложенных обновлений: %s", exc)
 
-        elif status == STATUS_PUBLISHED_INCOMPLETE.lower():
-            website_url = (row.get("WEBSITE", "") or "").strip()
-            previous_hash = (row.get("WEBSITE SNAPSHOT HASH", "") or "").strip()
-            if not previous_hash or not website_url:
-                logging.debug("⏭ Пропуск мониторинга Published (incomplete): нет WEBSITE SNAPSHOT HASH или WEBSITE (ID=%s)", row.get("ID"))
-                continue
+    # Старые загрузки регламентов удаляем до обработки событий: их file_id этому запуску уже не нужны.
+    try:
+        cleanup_stale_openai_files()
+    except Exception as exc:
+        logging.warning("⚠️ Не удалось очистить устаревшие файлы OpenAI: %s", exc)
 
-            try:
-                changed, current_hash = has_website_changed(previous_hash, website_url)
-            except Exception as exc:
-                logging.warning("⚠️ Не удалось загрузить WEBSITE для мониторинга (ID=%s): %s", row.get("ID"), exc)
-                continue
+    # Пытаемся загрузить строки с несколькими быстрыми повторами при сетевых сбоях
+    max_attempts = 3
+    delay_sec = 10
+    last_error = None
+    for attempt in range(1, max_attempts + 1):
+        try:
+            rows, headers = load_all_rows()
+            break
+        except Exception as e:
+            last_error = e
+            logging.warning(f"⚠️ Не удалось загрузить строки из Google Sheets (попытка {attempt}/{max_attempts}): {e}")
+            if attempt < max_attempts:
+                logging.info(f"⏳ Повторная попытка через {delay_sec} сек...")
+                time.sleep(delay_sec)
+    else:
+        # Если все попытки исчерпаны — пробрасываем исключение, чтобы обработать выше и запланировать быстрый повтор
+        raise last_error
 
-            updates = {
-                "LAST DIFF CHECK AT": datetime.now(pytz.timezone(TIMEZONE)).strftime("%Y-%m-%d %H:%M:%S"),
-            }
-            if changed:
-                logging.info("🔔 Изменения WEBSITE обнаружены для ID=%s", row.get("ID"))
-                changed_websites.append(
-                    {
-                        "id": str(row.get("ID", "")).strip(),
-                        "race": str(row.get("RACE NAME", "")).strip(),
-                        "url": website_url,
-                    }
-                )
-            batch_update_cells(row_index, updates, headers)
-            continue
+    revised_statuses = (STATUS_REVISED_INCOMPLETE.lower(), STATUS_REVISED_COMPLETE.lower())
+    revised_positions = [
+        position
+        for position, (_row_index, row) in enumerate(rows)
+        if str(row.get("STATUS", "")).strip().lower() in revised_statuses
+    ]
+    openai_batch, revised_positions = _prepare_openai_batch(rows, headers, revised_positions)
+    _run_revised_events(config, rows, headers, revised_positions, openai_batch=openai_batch)
+    if openai_batch is not None:
+        _submit_openai_batch(openai_batch, headers)
 
-        elif status == STATUS_PUBLISHED.lower():
-            logging.debug(f"⏭ Пропуск Published (ID={row.get('ID')})")
-            continue
+    changed_websites = _monitor_published_incomplete(rows, headers)
+
+    flush_pending_updates()
 
     if TELEGRAM_NOTIFICATIONS_ENABLED and changed_websites:
         lines = ["Website changes detected", ""]
@@ -776,6 +1155,8 @@ def run_automation():
         if not sent:
             logging.warning("⚠️ Не удалось отправить агрегированное Telegram-уведомление (%s изменений).", len(changed_websites))
 
+    run_metrics.log_summary()
+
 def main():
     """Основная функция с расписанием"""
     moscow_tz = pytz.timezone(TIMEZONE)
@@ -783,6 +1164,9 @@ def main():
     
     logging.info(f"🕐 Текущее время: {now.strftime('%Y-%m-%d %H:%M:%S')} МСК")
     logging.info(f"⚙️ Настройки: RUN_ON_STARTUP={RUN_ON_STARTUP}, SCHEDULED_HOUR={SCHEDULED_HOUR}:{SCHEDULED_MINUTE:02d}")
+
+    # docker stop шлёт SIGTERM: завершаемся через SystemExit, чтобы atexit дописал буфер обновлений таблицы.
+    signal.signal(signal.SIGTERM, lambda _signum, _frame: sys.exit(0))
     
     # Тестовый запуск при старте контейнера (если включен)
     if RUN_ON_STARTUP:
@@ -0,0 +1,213 @@
+"""Двухфазная генерация через OpenAI Batch API (OPENAI_BATCH_MODE=true).
+
+Ночной запуск не чувствителен к задержке, поэтому запросы к ассистентам можно
+отправить пакетом (дешевле и без ожидания каждого события):
+
+1. При обработке события промпт первого ассистента не отправляется, а
+   откладывается в BatchCollector; в конце запуска все отложенные запросы
+   уходят одним Batch-заданием, а в колонку OPENAI BATCH строки пишется
+   «first:<batch_id>». Событие остаётся в статусе Revised.
+2. В следующем запуске collect_batch_results скачивает готовые ответы и кладёт
+   их в кеш ответов (llm_cache) под теми же ключами, что и синхронные вызовы.
+   Событие снова проходит pipeline: первый ответ берётся из кеша, а запрос
+   второго ассистента откладывается во второе Batch-задание («second:<batch_id>»).
+3. Когда готов и второй ответ, событие публикуется обычным путём.
+
+Колонка OPENAI BATCH — контрольная точка: после перезапуска контейнера
+незавершённые задания находятся по ней. Ответы, которых нет в результатах
+задания (ошибка строки, не-JSON), запрашиваются синхронно.
+"""
+
+import json
+import logging
+import os
+import tempfile
+import threading
+
+import openai
+
+import run_metrics
+from concurrency import backend_slot
+from llm_cache import store_response
+
+OPENAI_BATCH_MODE = os.getenv("OPENAI_BATCH_MODE", "false").lower() == "true"
+BATCH_COLUMN = "OPENAI BATCH"
+BATCH_ENDPOINT = "/v1/responses"
+BATCH_COMPLETION_WINDOW = "24h"
+
+PHASE_FIRST = "first"
+PHASE_SECOND = "second"
+_PHASE_ORDER = {PHASE_FIRST: 1, PHASE_SECOND: 2}
+
+BATCH_PENDING = "pending"
+BATCH_DONE = "done"
+BATCH_FAILED = "failed"
+_PENDING_STATUSES = {"validating", "in_progress", "finalizing", "cancelling"}
+
+
+def format_checkpoint(phase: str, batch_id: str) -> str:
+    return f"{phase}:{batch_id}"
+
+
+def parse_checkpoint(value) -> tuple[str, str] | None:
+    """(phase, batch_id) из ячейки OPENAI BATCH или None."""
+    phase, _, batch_id = str(value or "").strip().partition(":")
+    if phase not in _PHASE_ORDER or not batch_id:
+        return None
+    return phase, batch_id
+
+
+def phase_completed(checkpoint, batch_states: dict) -> int:
+    """Номер последней завершённой фазы строки (0 — ни одной): её запросы повторно в Batch не отправляются."""
+    if checkpoint is None:
+        return 0
+    phase, batch_id = checkpoint
+    if batch_states.get(batch_id) == BATCH_DONE:
+        return _PHASE_ORDER[phase]
+    return 0
+
+
+class BatchCollector:
+    """Отложенные запросы одного запуска; потокобезопасен (EVENT_WORKERS).
+
+    completed_phases — {row_index: номер завершённой фазы} из phase_completed:
+    если ответа нет и после завершённого задания, он запрашивается синхронно,
+    чтобы строка не уходила в Batch по кругу.
+    """
+
+    def __init__(self, completed_phases: dict | None = None):
+        self._lock = threading.Lock()
+        self._completed_phases = dict(completed_phases or {})
+        self._requests = {PHASE_FIRST: {}, PHASE_SECOND: {}}
+        self._rows = {PHASE_FIRST: [], PHASE_SECOND: []}
+
+    def can_defer(self, phase: str, row_index: int) -> bool:
+        return _PHASE_ORDER[phase] > self._completed_phases.get(row_index, 0)
+
+    def defer(self, phase: str, row_index: int, cache_key: str, request_body: dict):
+        with self._lock:
+            # Одинаковые промпты разных событий — один запрос: custom_id в задании должен быть уникален.
+            self._requests[phase].setdefault(cache_key, request_body)
+            self._rows[phase].append(row_index)
+
+    def submit(self) -> dict:
+        """Создаёт Batch-задания; {row_index: значение OPENAI BATCH} для строк, ушедших в задания."""
+        checkpoints = {}
+        for phase in (PHASE_FIRST, PHASE_SECOND):
+            with self._lock:
+                requests = dict(self._requests[phase])
+                row_indexes = list(self._rows[phase])
+            if not requests:
+                continue
+            try:
+                batch_id = _create_batch(requests)
+            except Exception as exc:
+                # Строки остаются без контрольной точки и попадут в задание следующего запуска.
+                logging.error("❌ Не удалось создать OpenAI Batch (%s, %s запросов): %s", phase, len(requests), exc)
+                continue
+            logging.info("📦 OpenAI Batch %s создан (%s): %s запросов, строк: %s", batch_id, phase, len(requests), len(row_indexes))
+            run_metrics.increment(f"openai_batch_{phase}_requests", len(requests))
+            for row_index in row_indexes:
+                checkpoints[row_index] = format_checkpoint(phase, batch_id)
+        return checkpoints
+
+
+def _create_batch(requests: dict) -> str:
+    with tempfile.NamedTemporaryFile("w", suffix=".jsonl", encoding="utf-8", delete=False) as batch_file:
+        for cache_key, body in requests.items():
+            line = {"custom_id": cache_key, "method": "POST", "url": BATCH_ENDPOINT, "body": body}
+            batch_file.write(json.dumps(line, ensure_ascii=False) + "\n")
+        input_path = batch_file.name
+    try:
+        with open(input_path, "rb") as input_file, backend_slot("openai"):
+            input_upload = openai.files.create(file=input_file, purpose="batch")
+    finally:
+        os.remove(input_path)
+    with backend_slot("openai"):
+        batch = openai.batches.create(
+            input_file_id=input_upload.id,
+            endpoint=BATCH_ENDPOINT,
+            completion_window=BATCH_COMPLETION_WINDOW,
+        )
+    return batch.id
+
+
+def _response_output_text(body: dict) -> str:
+    # Тело ответа Responses API в результатах Batch — «сырой» JSON без output_text.
+    parts = []
+    for item in body.get("output") or []:
+        if item.get("type") != "message":
+            continue
+        for content in item.get("content") or []:
+            if content.get("type") == "output_text":
+                parts.append(content.get("text", ""))
+    return "".join(parts)
+
+
+def _store_batch_output(output_text: str) -> int:
+    stored = 0
+    for line in output_text.splitlines():
+        if not line.strip():
+            continue
+        entry = json.loads(line)
+        custom_id = entry.get("custom_id")
+        response = entry.get("response") or {}
+        if entry.get("error") or response.get("status_code") != 200:
+            logging.warning("⚠️ OpenAI Batch: запрос %s завершился ошибкой: %s", custom_id, entry.get("error") or response.get("status_code"))
+            continue
+        reply = _response_output_text(response.get("body") or {})
+        try:
+            result = json.loads(reply)
+        except json.JSONDecodeError:
+            logging.warning("⚠️ OpenAI Batch: ответ %s не является JSON: %s", custom_id, reply[:500])
+            continue
+        store_response(custom_id, result)
+        stored += 1
+    return stored
+
+
+def _delete_file_quietly(file_id):
+    if not file_id:
+        return
+    try:
+        with backend_slot("openai"):
+            openai.files.delete(file_id)
+    except Exception as exc:
+        logging.warning("⚠️ Не удалось удалить файл OpenAI Batch %s: %s", file_id, exc)
+
+
+def collect_batch_results(batch_ids) -> dict:
+    """{batch_id: BATCH_PENDING | BATCH_DONE | BATCH_FAILED}; ответы готовых заданий кладутся в кеш ответов."""
+    states = {}
+    for batch_id in sorted(set(batch_ids)):
+        try:
+            with backend_slot("openai"):
+                batch = openai.batches.retrieve(batch_id)
+        except Exception as exc:
+            # Временная ошибка: строки подождут следующего запуска, задание не теряем.
+            logging.warning("⚠️ Не удалось получить статус OpenAI Batch %s: %s", batch_id, exc)
+            states[batch_id] = BATCH_PENDING
+            continue
+
+        if batch.status in _PENDING_STATUSES:
+            logging.info("⏳ OpenAI Batch %s ещё выполняется (%s)", batch_id, batch.status)
+            states[batch_id] = BATCH_PENDING
+            continue
+
+        stored = 0
+        # У expired/cancelled заданий тоже может быть частичный результат.
+        if batch.output_file_id:
+            try:
+                with backend_slot("openai"):
+                    output = openai.files.content(batch.output_file_id)
+                stored = _store_batch_output(output.text)
+            except Exception as exc:
+                logging.error("❌ Не удалось скачать результаты OpenAI Batch %s: %s", batch_id, exc)
+                states[batch_id] = BATCH_PENDING
+                continue
+        states[batch_id] = BATCH_DONE if batch.status == "completed" else BATCH_FAILED
+        logging.info("📦 OpenAI Batch %s: статус %s, сохранено ответов: %s", batch_id, batch.status, stored)
+        run_metrics.increment("openai_batch_responses", stored)
+        for file_id in (batch.input_file_id, batch.output_file_id, batch.error_file_id):
+            _delete_file_quietly(file_id)
+    return states
@@ -0,0 +1,109 @@
+"""Кеш загрузок PDF регламентов в OpenAI Files поверх state_store.
+
+Ключ — SHA-256 содержимого файла, поэтому один и тот же регламент федерации,
+приложенный к десяткам гонок, загружается в OpenAI один раз, а дальше
+переиспользуется его file_id. Запись живёт OPENAI_FILE_CACHE_TTL_DAYS с
+момента загрузки; после этого файл загружается заново, а старый удаляет
+cleanup_stale_openai_files (вызывается в начале каждого запуска, до обработки
+событий, чтобы не удалить file_id, который ещё нужен текущему запуску).
+OPENAI_FILE_CACHE_TTL_DAYS=0 отключает переиспользование: каждый запуск
+загружает PDF заново и удаляет загрузки прошлых запусков.
+"""
+
+import hashlib
+import logging
+import os
+import threading
+import time
+
+import openai
+
+import run_metrics
+from concurrency import backend_slot
+from state_store import (
+    delete_openai_file,
+    get_openai_file,
+    list_openai_files_uploaded_before,
+    save_openai_file,
+)
+
+OPENAI_FILE_CACHE_TTL_DAYS = float(os.getenv("OPENAI_FILE_CACHE_TTL_DAYS", "30"))
+OPENAI_FILE_PURPOSE = "assistants"
+_HASH_CHUNK_BYTES = 1024 * 1024
+
+# Одинаковый PDF может прийти одновременно из нескольких событий (EVENT_WORKERS):
+# загружаем его один раз, остальные ждут и берут file_id из кеша.
+_upload_locks = {}
+_upload_locks_guard = threading.Lock()
+
+
+def _upload_lock(sha256: str) -> threading.Lock:
+    with _upload_locks_guard:
+        return _upload_locks.setdefault(sha256, threading.Lock())
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as source:
+        for chunk in iter(lambda: source.read(_HASH_CHUNK_BYTES), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _is_expired(uploaded_at: float) -> bool:
+    return time.time() - uploaded_at >= OPENAI_FILE_CACHE_TTL_DAYS * 86400
+
+
+def _delete_remote_file(file_id: str) -> bool:
+    """Удаляет файл в OpenAI; уже удалённый (404) тоже считается успехом."""
+    try:
+        with backend_slot("openai"):
+            openai.files.delete(file_id)
+        return True
+    except Exception as exc:
+        if getattr(exc, "status_code", None) == 404:
+            return True
+        logging.warning("⚠️ Не удалось удалить файл OpenAI %s: %s", file_id, exc)
+        return False
+
+
+def upload_pdf_cached(pdf_path: str) -> str:
+    """file_id для PDF: из кеша по SHA-256 содержимого или после новой загрузки."""
+    sha256 = file_sha256(pdf_path)
+    with _upload_lock(sha256):
+        entry = get_openai_file(sha256)
+        stale_file_id = None
+        if entry is not None:
+            file_id, file_bytes, uploaded_at = entry
+            if not _is_expired(uploaded_at):
+                logging.info("📎 PDF уже загружен в OpenAI (%s), повторно не загружаем", file_id)
+                run_metrics.increment("openai_file_cache_hit")
+                run_metrics.increment("openai_file_bytes_saved", file_bytes)
+                return file_id
+            stale_file_id = file_id
+
+        file_bytes = os.path.getsize(pdf_path)
+        with open(pdf_path, "rb") as f, backend_slot("openai"):
+            upload_response = openai.files.create(file=f, purpose=OPENAI_FILE_PURPOSE)
+        save_openai_file(sha256, upload_response.id, file_bytes)
+        run_metrics.increment("openai_file_upload")
+        logging.info("📤 PDF загружен в OpenAI: %s (%s байт)", upload_response.id, file_bytes)
+
+    if stale_file_id and stale_file_id != upload_response.id:
+        _delete_remote_file(stale_file_id)
+    return upload_response.id
+
+
+def cleanup_stale_openai_files() -> int:
+    """Удаляет из OpenAI и из кеша загрузки старше OPENAI_FILE_CACHE_TTL_DAYS; возвращает число удалённых."""
+    deleted = 0
+    cutoff = time.time() - OPENAI_FILE_CACHE_TTL_DAYS * 86400
+    for sha256, file_id in list_openai_files_uploaded_before(cutoff):
+        if _delete_remote_file(file_id):
+            # Ошибка удаления оставляет запись: попробуем снова в следующем запуске.
+            delete_openai_file(sha256)
+            deleted += 1
+    if deleted:
+        logging.info("🧹 Удалено устаревших файлов OpenAI: %s", deleted)
+        run_metrics.increment("openai_file_deleted", deleted)
+    return deleted
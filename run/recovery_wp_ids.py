@@ -4,7 +4,6 @@ import argparse
 import csv
 import html
 import logging
-import time
 import os
 import json
 import re
@@ -15,6 +14,8 @@ from decimal import Decimal, InvalidOperation
 from typing import Any
 from urllib.parse import parse_qs, unquote, urlencode, urlparse
 
+import http_client
+
 
 PRODUCT_ID_COLUMNS = ("WP PRODUCT ID EN", "WP PRODUCT ID PT")
 VARIATION_ID_COLUMNS = ("WP VARIATION ID EN", "WP VARIATION ID PT")
@@ -29,6 +30,7 @@ VARIATION_DATA_COLUMNS = (
     "RACE START TIME",
     "PRICE",
 )
+_RETRYABLE_STATUSES = (429, 500, 502, 503, 504)
 MATCH_STATUS_COLUMN = "Match Status"
 OVERWRITE_STATUS_COLUMN = "Variation ID Rewrite Status"
 FILL_STATUS_COLUMN = "Variation ID Fill Status"
@@ -530,36 +532,22 @@ class WordPressRecoveryClient:
         self.timeout = timeout
 
     def _request_get(self, url: str, *, auth=None, params=None, headers=None):
-        import requests
-
+        # Повторы (429/5xx с учётом Retry-After, сетевые ошибки) — в http_client.
         max_attempts = int(os.getenv("RECOVERY_HTTP_MAX_ATTEMPTS", "4"))
         base_delay = float(os.getenv("RECOVERY_HTTP_BASE_DELAY_SEC", "1.0"))
-        for attempt in range(1, max_attempts + 1):
-            try:
-                response = requests.get(url, auth=auth, params=params, timeout=self.timeout, headers=headers)
-                if response.status_code in (429, 500, 502, 503, 504):
-                    raise requests.HTTPError(f"retryable_http_{response.status_code}", response=response)
-                return response
-            except Exception as exc:
-                message = str(exc).lower()
-                status_code = getattr(getattr(exc, "response", None), "status_code", None)
-                retryable = (
-                    is_network_error(exc)
-                    or status_code in (429, 500, 502, 503, 504)
-                    or any(marker in message for marker in ("retryable_http_429", "retryable_http_500", "retryable_http_502", "retryable_http_503", "retryable_http_504"))
-                )
-                if (not retryable) or attempt >= max_attempts:
-                    raise
-                sleep_for = base_delay * (2 ** (attempt - 1))
-                logging.warning(
-                    "Retryable request error (attempt %s/%s) url=%s error=%s; sleeping %.1fs",
-                    attempt,
-                    max_attempts,
-                    url,
-                    exc,
-                    sleep_for,
-                )
-                time.sleep(sleep_for)
+        response = http_client.get(
+            url,
+            auth=auth,
+            params=params,
+            timeout=self.timeout,
+            headers=headers,
+            max_retries=max(0, max_attempts - 1),
+            retry_base_delay=base_delay,
+        )
+        if response.status_code in _RETRYABLE_STATUSES:
+            # Повторы исчерпаны — для вызывающего кода это ошибка сети, а не ответ.
+            response.raise_for_status()
+        return response
 
     def get_html(self, url: str) -> str:
         response = self._request_get(url, headers={"User-Agent": "racefinder-recovery/1.0"})
@@ -1059,27 +1047,6 @@ def classify_result_status(result: RecoveryResult, previous_status: str = "") ->
     return "not_found"
 
 
-def is_network_error(exc: Exception) -> bool:
-    text = str(exc).lower()
-    network_markers = (
-        "name resolution",
-        "failed to resolve",
-        "temporary failure in name resolution",
-        "max retries exceeded",
-        "connection error",
-        "connecttimeout",
-        "readtimeout",
-        "timed out",
-        "ssl",
-        "remote disconnected",
-        "502",
-        "503",
-        "504",
-        "429",
-    )
-    return any(marker in text for marker in network_markers)
-
-
 def write_report(path: str, rows: list[RecoveryResult], mode: str) -> None:
     if not path:
         return
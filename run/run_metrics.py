@@ -0,0 +1,37 @@
+"""Счётчики одного запуска автоматизации.
+
+Модули pipeline увеличивают именованные счётчики (попадания в кеши,
+сэкономленные запросы и т.п.), а run_automation в конце запуска пишет
+сводку одной строкой лога. Счётчики потокобезопасны: события могут
+обрабатываться параллельно (EVENT_WORKERS).
+"""
+
+import logging
+import threading
+from collections import Counter
+
+_counters = Counter()
+_lock = threading.Lock()
+
+
+def increment(name: str, amount: int = 1):
+    with _lock:
+        _counters[name] += amount
+
+
+def snapshot() -> dict:
+    with _lock:
+        return dict(_counters)
+
+
+def reset():
+    with _lock:
+        _counters.clear()
+
+
+def log_summary():
+    counters = snapshot()
+    if not counters:
+        return
+    summary = ", ".join(f"{name}={counters[name]}" for name in sorted(counters))
+    logging.info("📈 Итоги запуска: %s", summary)
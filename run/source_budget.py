@@ -0,0 +1,181 @@
+"""Бюджет токенов для текстов источников в промпте первого ассистента.
+
+Раньше промпт обрезался срезом `[:40000]` символов: регламент мог оборваться на
+середине предложения, а WEBSITE INFO (идёт после REGULATIONS INFO) при длинном
+регламенте пропадал целиком. fit_sources_to_budget вместо этого:
+
+1. Режет тексты на строки и предложения (длинные фрагменты без пунктуации —
+   меню, списки — по границе слов), убирает баннеры cookies и подобный шум и
+   длинные (от DEDUPE_MIN_CHARS символов) фрагменты сайта, повторяющие регламент.
+   Короткие повторы — строки таблиц цен, дистанции, даты — не трогаются.
+2. Если после этого тексты не помещаются в SOURCE_TOKEN_BUDGET, убирает длинные
+   повторы внутри источника (меню в шапке и подвале), делит бюджет между
+   регламентом (REGULATIONS_BUDGET_SHARE) и сайтом — неиспользованная доля
+   одного источника достаётся другому — и в каждом оставляет самые полезные
+   фрагменты (даты, дистанции, цены, регистрация, отмена, время старта,
+   лимиты), сохраняя исходный порядок.
+
+Оставшиеся фрагменты собираются обратно с исходными переводами строк.
+
+Токены оцениваются как символы / 4 — этого достаточно для лимита входа.
+"""
+
+import logging
+import os
+import re
+
+import run_metrics
+
+SOURCE_TOKEN_BUDGET = int(os.getenv("SOURCE_TOKEN_BUDGET", "10000"))
+REGULATIONS_BUDGET_SHARE = 0.6
+_CHARS_PER_TOKEN = 4
+_MAX_CHUNK_CHARS = 600
+_BOILERPLATE_MAX_CHARS = 300
+DEDUPE_MIN_CHARS = 40
+
+_SENTENCE_SPLIT_RE = re.compile(r"(?<=[.!?;])\s+")
+_RELEVANT_PATTERNS = [
+    # Даты: 14/09/2025, 14.09, «14 de setembro», «September 14».
+    re.compile(
+        r"\b\d{1,2}[./-]\d{1,2}(?:[./-]\d{2,4})?\b"
+        r"|\b(?:janeiro|fevereiro|março|abril|maio|junho|julho|agosto|setembro|outubro|novembro|dezembro"
+        r"|january|february|march|april|may|june|july|august|september|october|november|december)\b",
+        re.IGNORECASE,
+    ),
+    re.compile(r"\b\d+(?:[.,]\d+)?\s?(?:km|m|mi)\b|\bdist[âa]ncia|\bdistance|\bpercurso|\bdesn[íi]vel|\belevation", re.IGNORECASE),
+    re.compile(r"€|\beur(?:os?)?\b|\bpre[çc]o|\bprice|\bvalor|\bfee\b|\btaxa", re.IGNORECASE),
+    re.compile(r"\binscri[çc]|\bregist|\bsign[- ]?up|\bdorsa|\bbib\b|\blimite|\blimit\b|\bvagas", re.IGNORECASE),
+    re.compile(r"\bcancel|\breembols|\brefund|\bdevolu|\bdesist|\btransfer", re.IGNORECASE),
+    re.compile(r"\b\d{1,2}[:h]\d{2}\b|\bpartida|\bstart|\bchegada|\bfinish|\bhor[áa]rio|\btempo limite|\bcut[- ]?off", re.IGNORECASE),
+    re.compile(r"\bescal[õo]|\bcategor|\bpr[ée]mio|\bprize|\babastec|\baid station|\bcronometr|\btiming", re.IGNORECASE),
+]
+_BOILERPLATE_RE = re.compile(
+    r"cookie|política de privacidade|privacy policy|todos os direitos reservados|all rights reserved"
+    r"|newsletter|subscrev|subscribe|aceitar e fechar|accept all|powered by|©",
+    re.IGNORECASE,
+)
+
+
+def estimate_tokens(text: str) -> int:
+    return (len(text or "") + _CHARS_PER_TOKEN - 1) // _CHARS_PER_TOKEN
+
+
+def _split_lines(text: str) -> list[tuple[int, str]]:
+    """[(номер строки, фрагмент)] — номер строки нужен, чтобы собрать текст с исходными переводами строк."""
+    chunks = []
+    for line_no, line in enumerate((text or "").splitlines()):
+        for sentence in _SENTENCE_SPLIT_RE.split(line):
+            sentence = sentence.strip()
+            while len(sentence) > _MAX_CHUNK_CHARS:
+                cut = sentence.rfind(" ", 0, _MAX_CHUNK_CHARS)
+                if cut <= 0:
+                    cut = _MAX_CHUNK_CHARS
+                chunks.append((line_no, sentence[:cut].strip()))
+                sentence = sentence[cut:].strip()
+            if sentence:
+                chunks.append((line_no, sentence))
+    return chunks
+
+
+def split_chunks(text: str) -> list[str]:
+    return [chunk for _, chunk in _split_lines(text)]
+
+
+def _join_lines(chunks: list[tuple[int, str]]) -> str:
+    lines = []
+    previous_line_no = None
+    for line_no, chunk in chunks:
+        if line_no == previous_line_no:
+            lines[-1] += " " + chunk
+        else:
+            lines.append(chunk)
+        previous_line_no = line_no
+    return "\n".join(lines)
+
+
+def relevance_score(chunk: str) -> int:
+    return sum(1 for pattern in _RELEVANT_PATTERNS if pattern.search(chunk))
+
+
+def _chunk_key(chunk: str) -> str:
+    return re.sub(r"\W+", " ", chunk.lower()).strip()
+
+
+def _is_boilerplate(chunk: str) -> bool:
+    return len(chunk) <= _BOILERPLATE_MAX_CHARS and bool(_BOILERPLATE_RE.search(chunk)) and not relevance_score(chunk)
+
+
+def _drop_repeats(chunks: list[tuple[int, str]], seen: set) -> list[tuple[int, str]]:
+    """Убирает длинные фрагменты, уже встреченные в seen; короткие повторы (цены, дистанции) остаются."""
+    kept = []
+    for line_no, chunk in chunks:
+        if len(chunk) >= DEDUPE_MIN_CHARS:
+            key = _chunk_key(chunk)
+            if key in seen:
+                continue
+            seen.add(key)
+        kept.append((line_no, chunk))
+    return kept
+
+
+def _chunks_tokens(chunks: list[tuple[int, str]]) -> int:
+    return sum(estimate_tokens(chunk) + 1 for _, chunk in chunks)
+
+
+def _select(chunks: list[tuple[int, str]], budget_tokens: int) -> list[tuple[int, str]]:
+    if _chunks_tokens(chunks) <= budget_tokens:
+        return chunks
+    # Сначала самые релевантные, при равенстве — более ранние; вывод — в исходном порядке.
+    ranked = sorted(range(len(chunks)), key=lambda index: (-relevance_score(chunks[index][1]), index))
+    selected = set()
+    used = 0
+    for index in ranked:
+        tokens = estimate_tokens(chunks[index][1]) + 1
+        if used + tokens > budget_tokens:
+            continue
+        selected.add(index)
+        used += tokens
+    return [chunk for index, chunk in enumerate(chunks) if index in selected]
+
+
+def fit_sources_to_budget(regulations_text: str, website_text: str, budget_tokens: int | None = None) -> tuple[str, str]:
+    """(regulations_text, website_text) без шума и повторов сайта, вместе — не больше budget_tokens (0 — без лимита)."""
+    budget_tokens = SOURCE_TOKEN_BUDGET if budget_tokens is None else budget_tokens
+    regulations_raw = _split_lines(regulations_text)
+    website_raw = _split_lines(website_text)
+    # Повторы ищем только между источниками: фрагменты сайта, повторяющие регламент, отбрасываются.
+    regulations_keys = {_chunk_key(chunk) for _, chunk in regulations_raw if len(chunk) >= DEDUPE_MIN_CHARS}
+    regulations_chunks = [item for item in regulations_raw if not _is_boilerplate(item[1])]
+    website_chunks = [
+        (line_no, chunk)
+        for line_no, chunk in website_raw
+        if not _is_boilerplate(chunk) and not (len(chunk) >= DEDUPE_MIN_CHARS and _chunk_key(chunk) in regulations_keys)
+    ]
+    over_budget = budget_tokens > 0 and _chunks_tokens(regulations_chunks) + _chunks_tokens(website_chunks) > budget_tokens
+
+    if over_budget:
+        # Не помещается — убираем и длинные повторы внутри источника (меню в шапке и подвале).
+        seen = set()
+        regulations_chunks = _drop_repeats(regulations_chunks, seen)
+        website_chunks = _drop_repeats(website_chunks, seen)
+        regulations_tokens = _chunks_tokens(regulations_chunks)
+        website_tokens = _chunks_tokens(website_chunks)
+        regulations_budget = int(budget_tokens * REGULATIONS_BUDGET_SHARE) if website_chunks else budget_tokens
+        regulations_budget = min(regulations_budget, regulations_tokens)
+        website_budget = budget_tokens - regulations_budget
+        if website_tokens < website_budget:
+            regulations_budget = budget_tokens - website_tokens
+        regulations_chunks = _select(regulations_chunks, regulations_budget)
+        website_chunks = _select(website_chunks, website_budget)
+
+    if len(regulations_chunks) == len(regulations_raw) and len(website_chunks) == len(website_raw):
+        # Ничего не выброшено — тексты не трогаем (промпт и хеш источников остаются прежними).
+        return regulations_text, website_text
+
+    before = estimate_tokens(regulations_text) + estimate_tokens(website_text)
+    regulations_result = _join_lines(regulations_chunks)
+    website_result = _join_lines(website_chunks)
+    after = estimate_tokens(regulations_result) + estimate_tokens(website_result)
+    logging.info("✂️ Тексты источников сокращены: ~%s → ~%s токенов (бюджет %s)", before, after, budget_tokens or "—")
+    run_metrics.increment("source_tokens_trimmed", max(0, before - after))
+    return regulations_result, website_result
@@ -0,0 +1,68 @@
+"""Кеш извлечённых текстов WEBSITE/REGULATIONS и хешей источников генерации.
+
+Текст страницы или HTML-регламента хранится в state_store по нормализованному
+URL (регистр схемы/хоста, фрагмент и завершающий «/» не важны) вместе с хешем
+содержимого и временем загрузки. В течение SOURCE_CACHE_TTL_HOURS повторная
+обработка события (в том числе возврат строки в Revised (complete)) берёт
+текст из кеша без сети. PDF не кешируются: их загрузку в OpenAI закрывает
+openai_file_cache.
+
+compute_source_hash описывает всё, что видит первый ассистент (текст промпта
+и содержимое PDF). Если хеш совпадает с сохранённым при последней успешной
+генерации события, main не вызывает OpenAI и переиспользует тексты из таблицы.
+"""
+
+import hashlib
+import os
+import time
+from urllib.parse import urlsplit, urlunsplit
+
+import run_metrics
+from state_store import get_source_text, save_source_text
+
+SOURCE_CACHE_TTL_HOURS = float(os.getenv("SOURCE_CACHE_TTL_HOURS", "24"))
+
+
+def normalize_source_url(url: str) -> str:
+    url = (url or "").strip()
+    if not url:
+        return ""
+    parts = urlsplit(url)
+    netloc = parts.netloc.lower()
+    if parts.scheme.lower() == "https" and netloc.endswith(":443"):
+        netloc = netloc[:-4]
+    elif parts.scheme.lower() == "http" and netloc.endswith(":80"):
+        netloc = netloc[:-3]
+    path = parts.path.rstrip("/") or "/"
+    return urlunsplit((parts.scheme.lower(), netloc, path, parts.query, ""))
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256((text or "").encode("utf-8")).hexdigest()
+
+
+def lookup_source_text(url: str) -> str | None:
+    """Текст источника из кеша, если он моложе SOURCE_CACHE_TTL_HOURS; иначе None."""
+    key = normalize_source_url(url)
+    if not key or SOURCE_CACHE_TTL_HOURS <= 0:
+        return None
+    entry = get_source_text(key)
+    if entry is None or time.time() - entry[2] > SOURCE_CACHE_TTL_HOURS * 3600:
+        run_metrics.increment("source_cache_miss")
+        return None
+    run_metrics.increment("source_cache_hit")
+    return entry[0]
+
+
+def store_source_text(url: str, text: str):
+    key = normalize_source_url(url)
+    # Пустой текст — это ошибка разбора, а не содержимое страницы: не кешируем.
+    if key and (text or "").strip() and SOURCE_CACHE_TTL_HOURS > 0:
+        save_source_text(key, text, text_hash(text))
+
+
+def compute_source_hash(prompt_text: str, pdf_sha256s: list[str]) -> str:
+    digest = hashlib.sha256(text_hash(prompt_text).encode("ascii"))
+    for pdf_sha256 in pdf_sha256s:
+        digest.update(b"\0" + pdf_sha256.encode("ascii"))
+    return digest.hexdigest()
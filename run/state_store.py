@@ -0,0 +1,269 @@
+"""Локальное хранилище состояния между запусками (SQLite).
+
+Здесь живёт всё, что должно переживать перезапуск контейнера, но не
+относится к данным Google-таблицы: отпечатки (fingerprints) последней
+успешной публикации событий, кеш геокодинга, размеры страниц
+для отчёта об условных запросах, file_id загруженных в OpenAI PDF, кеш
+текстов источников, ответы OpenAI и т.п. Файл базы лежит в примонтированной
+папке (`STATE_DB_PATH`, по умолчанию `/app/data/state.sqlite3`).
+
+Если база недоступна (нет прав, повреждён файл), модуль пишет warning и
+работает как пустое хранилище: чтение возвращает None, запись игнорируется,
+а основной pipeline продолжает работу без оптимизаций.
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+STATE_DB_PATH = os.getenv("STATE_DB_PATH", "/app/data/state.sqlite3")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS event_fingerprints (
+    event_key TEXT PRIMARY KEY,
+    fingerprint TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS geocode_cache (
+    query_key TEXT PRIMARY KEY,
+    lat REAL,
+    lon REAL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS website_body_sizes (
+    url TEXT PRIMARY KEY,
+    body_bytes INTEGER NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS openai_files (
+    sha256 TEXT PRIMARY KEY,
+    file_id TEXT NOT NULL,
+    file_bytes INTEGER NOT NULL,
+    uploaded_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS source_texts (
+    url_key TEXT PRIMARY KEY,
+    text TEXT NOT NULL,
+    content_hash TEXT NOT NULL,
+    fetched_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS generation_sources (
+    event_key TEXT PRIMARY KEY,
+    source_hash TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS llm_responses (
+    cache_key TEXT PRIMARY KEY,
+    response TEXT NOT NULL,
+    response_bytes INTEGER NOT NULL,
+    last_used_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS llm_responses_last_used ON llm_responses (last_used_at);
+"""
+
+_connection = None
+_connection_failed = False
+_lock = threading.Lock()
+
+
+def _get_connection():
+    global _connection, _connection_failed
+    if _connection is not None or _connection_failed:
+        return _connection
+    try:
+        db_dir = os.path.dirname(STATE_DB_PATH)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        connection = sqlite3.connect(STATE_DB_PATH, check_same_thread=False)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.executescript(_SCHEMA)
+        _connection = connection
+    except Exception as exc:
+        _connection_failed = True
+        logging.warning("⚠️ Хранилище состояния %s недоступно, работаем без него: %s", STATE_DB_PATH, exc)
+    return _connection
+
+
+def reset_connection(db_path: str | None = None):
+    """Закрывает соединение; при указании db_path переключает файл базы (для тестов/скриптов)."""
+    global _connection, _connection_failed, STATE_DB_PATH
+    with _lock:
+        if _connection is not None:
+            _connection.close()
+        _connection = None
+        _connection_failed = False
+        if db_path is not None:
+            STATE_DB_PATH = db_path
+
+
+def _fetch_one(query: str, params: tuple):
+    with _lock:
+        connection = _get_connection()
+        if connection is None:
+            return None
+        try:
+            return connection.execute(query, params).fetchone()
+        except sqlite3.Error as exc:
+            logging.warning("⚠️ Ошибка чтения хранилища состояния: %s", exc)
+            return None
+
+
+def _fetch_all(query: str, params: tuple) -> list:
+    with _lock:
+        connection = _get_connection()
+        if connection is None:
+            return []
+        try:
+            return connection.execute(query, params).fetchall()
+        except sqlite3.Error as exc:
+            logging.warning("⚠️ Ошибка чтения хранилища состояния: %s", exc)
+            return []
+
+
+def _execute(query: str, params: tuple):
+    with _lock:
+        connection = _get_connection()
+        if connection is None:
+            return
+        try:
+            with connection:
+                connection.execute(query, params)
+        except sqlite3.Error as exc:
+            logging.warning("⚠️ Ошибка записи в хранилище состояния: %s", exc)
+
+
+def get_event_fingerprint(event_key: str) -> str | None:
+    row = _fetch_one("SELECT fingerprint FROM event_fingerprints WHERE event_key = ?", (event_key,))
+    return row[0] if row else None
+
+
+def save_event_fingerprint(event_key: str, fingerprint: str):
+    _execute(
+        "INSERT INTO event_fingerprints (event_key, fingerprint, updated_at) VALUES (?, ?, ?) "
+        "ON CONFLICT(event_key) DO UPDATE SET fingerprint = excluded.fingerprint, updated_at = excluded.updated_at",
+        (event_key, fingerprint, time.time()),
+    )
+
+
+def get_geocode_entry(query_key: str):
+    """(lat, lon, updated_at) для запроса; lat/lon = None означает закешированное «не найдено»."""
+    return _fetch_one("SELECT lat, lon, updated_at FROM geocode_cache WHERE query_key = ?", (query_key,))
+
+
+def save_geocode_entry(query_key: str, lat, lon):
+    _execute(
+        "INSERT INTO geocode_cache (query_key, lat, lon, updated_at) VALUES (?, ?, ?, ?) "
+        "ON CONFLICT(query_key) DO UPDATE SET lat = excluded.lat, lon = excluded.lon, updated_at = excluded.updated_at",
+        (query_key, lat, lon, time.time()),
+    )
+
+
+def get_website_body_size(url: str) -> int | None:
+    """Размер тела последней полной загрузки сайта (для оценки экономии на 304)."""
+    row = _fetch_one("SELECT body_bytes FROM website_body_sizes WHERE url = ?", (url,))
+    return row[0] if row else None
+
+
+def save_website_body_size(url: str, body_bytes: int):
+    _execute(
+        "INSERT INTO website_body_sizes (url, body_bytes, updated_at) VALUES (?, ?, ?) "
+        "ON CONFLICT(url) DO UPDATE SET body_bytes = excluded.body_bytes, updated_at = excluded.updated_at",
+        (url, int(body_bytes), time.time()),
+    )
+
+
+def get_openai_file(sha256: str):
+    """(file_id, file_bytes, uploaded_at) для PDF с таким содержимым или None."""
+    return _fetch_one("SELECT file_id, file_bytes, uploaded_at FROM openai_files WHERE sha256 = ?", (sha256,))
+
+
+def save_openai_file(sha256: str, file_id: str, file_bytes: int):
+    _execute(
+        "INSERT INTO openai_files (sha256, file_id, file_bytes, uploaded_at) VALUES (?, ?, ?, ?) "
+        "ON CONFLICT(sha256) DO UPDATE SET file_id = excluded.file_id, file_bytes = excluded.file_bytes, "
+        "uploaded_at = excluded.uploaded_at",
+        (sha256, file_id, int(file_bytes), time.time()),
+    )
+
+
+def delete_openai_file(sha256: str):
+    _execute("DELETE FROM openai_files WHERE sha256 = ?", (sha256,))
+
+
+def list_openai_files_uploaded_before(uploaded_before: float) -> list:
+    """[(sha256, file_id)] записей, загруженных раньше uploaded_before (кандидаты на удаление)."""
+    return _fetch_all(
+        "SELECT sha256, file_id FROM openai_files WHERE uploaded_at < ? ORDER BY uploaded_at",
+        (uploaded_before,),
+    )
+
+
+def get_source_text(url_key: str):
+    """(text, content_hash, fetched_at) последнего извлечения текста по URL или None."""
+    return _fetch_one("SELECT text, content_hash, fetched_at FROM source_texts WHERE url_key = ?", (url_key,))
+
+
+def save_source_text(url_key: str, text: str, content_hash: str):
+    _execute(
+        "INSERT INTO source_texts (url_key, text, content_hash, fetched_at) VALUES (?, ?, ?, ?) "
+        "ON CONFLICT(url_key) DO UPDATE SET text = excluded.text, content_hash = excluded.content_hash, "
+        "fetched_at = excluded.fetched_at",
+        (url_key, text, content_hash, time.time()),
+    )
+
+
+def get_generation_source_hash(event_key: str) -> str | None:
+    """Хеш источников, по которым для события последний раз успешно сгенерирован контент."""
+    row = _fetch_one("SELECT source_hash FROM generation_sources WHERE event_key = ?", (event_key,))
+    return row[0] if row else None
+
+
+def save_generation_source_hash(event_key: str, source_hash: str):
+    _execute(
+        "INSERT INTO generation_sources (event_key, source_hash, updated_at) VALUES (?, ?, ?) "
+        "ON CONFLICT(event_key) DO UPDATE SET source_hash = excluded.source_hash, updated_at = excluded.updated_at",
+        (event_key, source_hash, time.time()),
+    )
+
+
+def get_llm_response(cache_key: str) -> str | None:
+    """Сохранённый ответ модели; попадание продлевает жизнь записи при вытеснении."""
+    row = _fetch_one("SELECT response FROM llm_responses WHERE cache_key = ?", (cache_key,))
+    if row is None:
+        return None
+    _execute("UPDATE llm_responses SET last_used_at = ? WHERE cache_key = ?", (time.time(), cache_key))
+    return row[0]
+
+
+def save_llm_response(cache_key: str, response: str, max_total_bytes: int):
+    """Сохраняет ответ и вытесняет давно не использованные, пока суммарный размер больше max_total_bytes."""
+    response_bytes = len(response.encode("utf-8"))
+    with _lock:
+        connection = _get_connection()
+        if connection is None:
+            return
+        try:
+            with connection:
+                connection.execute(
+                    "INSERT INTO llm_responses (cache_key, response, response_bytes, last_used_at) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT(cache_key) DO UPDATE SET response = excluded.response, "
+                    "response_bytes = excluded.response_bytes, last_used_at = excluded.last_used_at",
+                    (cache_key, response, response_bytes, time.time()),
+                )
+                total = connection.execute("SELECT COALESCE(SUM(response_bytes), 0) FROM llm_responses").fetchone()[0]
+                if total <= max_total_bytes:
+                    return
+                rows = connection.execute(
+                    "SELECT cache_key, response_bytes FROM llm_responses ORDER BY last_used_at"
+                ).fetchall()
+                evicted = []
+                for key, size in rows:
+                    if total <= max_total_bytes:
+                        break
+                    evicted.append((key,))
+                    total -= size
+                connection.executemany("DELETE FROM llm_responses WHERE cache_key = ?", evicted)
+        except sqlite3.Error as exc:
+            logging.warning("⚠️ Ошибка записи в хранилище состояния: %s", exc)
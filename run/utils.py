@@ -1,3 +1,7 @@
+import hashlib
+import json
+
+
 def normalize_attribute_name(name: str) -> str:
     return str(name or "").strip()
 
@@ -174,3 +178,47 @@ def parse_faq_items(raw_faq: str):
                 pending_question = None
 
     return items
+
+
+# Колонки, которые pipeline сам пишет в таблицу: они не влияют на входные данные события.
+FINGERPRINT_IGNORED_COLUMNS = frozenset({
+    "STATUS",
+    "RACE NAME",
+    "LOCATION NOTE",
+    "SUMMARY",
+    "ORG INFO",
+    "BENEFITS",
+    "FAQ",
+    "SUMMARY (PT)",
+    "ORG INFO (PT)",
+    "BENEFITS (PT)",
+    "FAQ (PT)",
+    "ORGANIZER NAME",
+    "ORGANIZER EMAIL",
+    "IMAGE URL",
+    "IMAGE ID",
+    "LINK RACEFINDER",
+    "WP PRODUCT ID EN",
+    "WP PRODUCT ID PT",
+    "WP VARIATION ID EN",
+    "WP VARIATION ID PT",
+    "WEBSITE SNAPSHOT HASH",
+    "WEBSITE ETAG",
+    "WEBSITE LAST MODIFIED",
+    "LAST DIFF CHECK AT",
+    "OPENAI BATCH",
+})
+
+
+def compute_event_fingerprint(main_row, child_rows) -> str:
+    # Хеш входных данных события: основная строка + строки-вариации без служебных колонок.
+    def _row_items(row):
+        return sorted(
+            (str(key), str(value if value is not None else "").strip())
+            for key, value in row.items()
+            if key not in FINGERPRINT_IGNORED_COLUMNS
+        )
+
+    payload = [_row_items(main_row)] + [_row_items(child) for child in child_rows]
+    encoded = json.dumps(payload, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
@@ -1,63 +1,272 @@
 import hashlib
+import os
 import re
+import threading
 import time
 import asyncio
 import logging
+from concurrent.futures import ThreadPoolExecutor, wait
 from urllib.error import URLError, HTTPError
+from urllib.parse import urlparse
 from urllib.request import Request, urlopen
 
+from state_store import get_website_body_size, save_website_body_size
 from url_utils import normalize_http_url
 
+WEBSITE_FETCH_TIMEOUT_SEC = 20
+# Мониторинг Published (incomplete): сколько сайтов проверять одновременно,
+# не больше N запросов на один хост и общий бюджет времени на весь этап.
+WEBSITE_MONITOR_WORKERS = int(os.getenv("WEBSITE_MONITOR_WORKERS", "16"))
+WEBSITE_MONITOR_MAX_PER_HOST = int(os.getenv("WEBSITE_MONITOR_MAX_PER_HOST", "2"))
+WEBSITE_MONITOR_BUDGET_SEC = float(os.getenv("WEBSITE_MONITOR_BUDGET_SEC", "300"))
 
-def _fetch_html_with_retries(url: str, retries: int = 2, delay_sec: float = 1.0) -> str:
+
+def _request_with_retries(
+    url: str,
+    extra_headers: dict | None = None,
+    retries: int = 2,
+    delay_sec: float = 1.0,
+    deadline: float | None = None,
+) -> tuple[int, bytes, dict]:
+    """GET с повторами: (status, тело, заголовки ответа). 304 — не ошибка, тело пустое."""
     headers = {
         "User-Agent": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0 Safari/537.36",
         "Accept": "text/html,application/xhtml+xml;q=0.9,*/*;q=0.8",
     }
+    headers.update(extra_headers or {})
     last_error = None
     for attempt in range(retries + 1):
+        timeout = WEBSITE_FETCH_TIMEOUT_SEC
+        if deadline is not None:
+            # deadline (time.monotonic) — общий бюджет этапа: не начинаем попытку и не ждём дольше него.
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise last_error or TimeoutError(f"бюджет времени мониторинга исчерпан: {url}")
+            timeout = min(timeout, remaining)
         try:
             request = Request(url=url, headers=headers)
-            with urlopen(request, timeout=20) as response:
-                return response.read().decode("utf-8", errors="replace")
-        except (URLError, HTTPError, TimeoutError) as exc:
+            with urlopen(request, timeout=timeout) as response:
+                return response.status, response.read(), dict(response.headers.items())
+        except HTTPError as exc:
+            # urllib поднимает 304 как HTTPError: для условного запроса это «страница не менялась».
+            if exc.code == 304:
+                return 304, b"", dict(exc.headers.items()) if exc.headers else {}
+            last_error = exc
+        except (URLError, TimeoutError) as exc:
             last_error = exc
-            if attempt < retries:
-                time.sleep(delay_sec * (2 ** attempt))
+        if attempt < retries:
+            time.sleep(delay_sec * (2 ** attempt))
     raise last_error
 
 
-def fetch_website_html(url: str) -> str:
+def _fetch_html_with_retries(url: str, retries: int = 2, delay_sec: float = 1.0, deadline: float | None = None) -> str:
+    _status, body, _headers = _request_with_retries(url, retries=retries, delay_sec=delay_sec, deadline=deadline)
+    return body.decode("utf-8", errors="replace")
+
+
+def fetch_website_html(url: str, deadline: float | None = None) -> str:
     normalized_url = normalize_http_url(url)
     if not normalized_url:
         return ""
-    return _fetch_html_with_retries(normalized_url)
+    return _fetch_html_with_retries(normalized_url, deadline=deadline)
+
+
+# Правила нормализации (порядок и смысл — как в исходной цепочке re.sub, от него зависят сохранённые хеши):
+# 1) комментарии <!-- --> → " "; 2) <script>…</script> → " "; 3) <style>…</style> → " ";
+# 4) cache-busting/маркетинговые query-параметры → ""; 5) volatile-токены → "name=";
+# 6) пробелы схлопываются, регистр понижается.
+_QUERY_PARAM_RE = re.compile(
+    r"([?&])(utm_[a-z_]+|fbclid|gclid|_ga|_gl|v|ver|timestamp|ts)=[^&\"'\\s>]+",
+    re.IGNORECASE,
+)
+_VOLATILE_TOKEN_RE = re.compile(
+    r"\b(nonce|csrf|token|timestamp|build|cache|hash)\s*[:=]\s*[\"']?[-_a-zA-Z0-9:.]{6,}[\"']?",
+    re.IGNORECASE,
+)
+
+# Токенизатор блоков: ищет ближайшее открытие и сразу находит конец блока с учётом вложенности,
+# которую давали последовательные проходы (комментарий внутри script, script внутри style).
+# Без именованных групп: иначе re теряет быстрый поиск по префиксу «<».
+_BLOCK_OPEN_RE = re.compile(r"<!--|<script\b|<style\b", re.IGNORECASE)
+_SCRIPT_TAG_END_RE = re.compile(r"<!--|>")
+_SCRIPT_CLOSE_RE = re.compile(r"<!--|</script>", re.IGNORECASE)
+_STYLE_TAG_END_RE = re.compile(r"<!--|<script\b|>", re.IGNORECASE)
+_STYLE_CLOSE_RE = re.compile(r"<!--|<script\b|</style>", re.IGNORECASE)
+
+
+def _token_kind(token: str) -> str:
+    if token == "<!--":
+        return "comment"
+    if len(token) == 7:
+        return "script"
+    if len(token) == 6:
+        return "style"
+    return "target"
+
+
+_DIGEST_TOKENS_PER_UPDATE = 4096
+
+
+class _BlockScanner:
+    """Один проход по документу: конец комментария/script/style или -1, если блок не закрыт.
+
+    Если блок какого-то вида не закрылся, не закроется и ни один следующий за ним
+    (искать дальше нечего), поэтому запоминаем позицию и не сканируем хвост повторно.
+    Концы уже найденных блоков кешируются: поиск конца style перешагивает вложенные
+    script/комментарии, и основной проход затем не ищет их заново.
+    """
+
+    def __init__(self, html: str):
+        self.html = html
+        self._unclosed_from = {}
+        self._ends = {}
+
+    def block_end(self, kind: str, start: int) -> int:
+        if start >= self._unclosed_from.get(kind, len(self.html) + 1):
+            return -1
+        end = self._ends.get(start)
+        if end is not None:
+            return end
+        if kind == "comment":
+            end = self.html.find("-->", start + 4)
+            end = end + 3 if end >= 0 else -1
+        elif kind == "script":
+            end = self._tag_block_end(start + len("<script"), _SCRIPT_TAG_END_RE, _SCRIPT_CLOSE_RE)
+        else:
+            end = self._tag_block_end(start + len("<style"), _STYLE_TAG_END_RE, _STYLE_CLOSE_RE)
+        if end < 0:
+            self._unclosed_from[kind] = min(start, self._unclosed_from.get(kind, start))
+        else:
+            self._ends[start] = end
+        return end
+
+    def _tag_block_end(self, pos: int, tag_end_re, close_re) -> int:
+        tag_end = self._find_target(tag_end_re, pos)
+        if tag_end < 0:
+            return -1
+        return self._find_target(close_re, tag_end)
+
+    def _find_target(self, pattern, pos: int) -> int:
+        # Ищем target, перешагивая целые блоки, которые предыдущие проходы удалили бы раньше.
+        while True:
+            match = pattern.search(self.html, pos)
+            if match is None:
+                return -1
+            kind = _token_kind(match.group())
+            if kind == "target":
+                return match.end()
+            end = self.block_end(kind, match.start())
+            pos = end if end >= 0 else match.end()
+
+
+def _strip_blocks(html: str) -> str:
+    scanner = _BlockScanner(html)
+    parts = []
+    copied_to = 0
+    pos = 0
+    while True:
+        match = _BLOCK_OPEN_RE.search(html, pos)
+        if match is None:
+            break
+        end = scanner.block_end(_token_kind(match.group()), match.start())
+        if end < 0:
+            pos = match.end()
+            continue
+        parts.append(html[copied_to:match.start()])
+        parts.append(" ")
+        copied_to = pos = end
+    parts.append(html[copied_to:])
+    return "".join(parts)
+
+
+def _normalized_tokens(html: str) -> list[str]:
+    text = _strip_blocks(html)
+    text = _QUERY_PARAM_RE.sub("", text)
+    text = _VOLATILE_TOKEN_RE.sub(r"\1=", text)
+    return text.lower().split()
 
 
 def normalize_html_for_hash(html: str) -> str:
     if not html:
         return ""
+    return " ".join(_normalized_tokens(html))
+
+
+def _hash_html(html: str) -> str:
+    # Тот же sha256(normalize_html_for_hash(html)), но без сборки итоговой строки целиком.
+    digest = hashlib.sha256()
+    tokens = _normalized_tokens(html) if html else []
+    for offset in range(0, len(tokens), _DIGEST_TOKENS_PER_UPDATE):
+        chunk = " ".join(tokens[offset:offset + _DIGEST_TOKENS_PER_UPDATE])
+        digest.update((" " + chunk if offset else chunk).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def _response_header(headers: dict, name: str) -> str:
+    for key, value in headers.items():
+        if key.lower() == name.lower():
+            return str(value or "").strip()
+    return ""
+
+
+def fetch_website_snapshot(website_url: str, etag: str = "", last_modified: str = "", deadline: float | None = None) -> dict:
+    """Снимок сайта с условным GET (If-None-Match / If-Modified-Since).
+
+    Возвращает {"hash", "etag", "last_modified", "not_modified", "bytes"}.
+    При 304 нормализация и хеширование не выполняются: hash пустой,
+    not_modified=True, валидаторы — из ответа или переданные.
+    """
+    snapshot = {"hash": "", "etag": "", "last_modified": "", "not_modified": False, "bytes": 0}
+    normalized_url = normalize_http_url(website_url)
+    if not normalized_url:
+        return snapshot
 
-    normalized = html
+    conditional_headers = {}
+    if etag:
+        conditional_headers["If-None-Match"] = etag
+    if last_modified:
+        conditional_headers["If-Modified-Since"] = last_modified
 
-    # Убираем блоки с динамикой, которые часто меняются между запросами.
-    normalized = re.sub(r"<!--.*?-->", " ", normalized, flags=re.DOTALL)
-    normalized = re.sub(r"<script\b[^>]*>.*?</script>", " ", normalized, flags=re.IGNORECASE | re.DOTALL)
-    normalized = re.sub(r"<style\b[^>]*>.*?</style>", " ", normalized, flags=re.IGNORECASE | re.DOTALL)
+    status, body, headers = _request_with_retries(normalized_url, conditional_headers, deadline=deadline)
+    snapshot["etag"] = _response_header(headers, "ETag")
+    snapshot["last_modified"] = _response_header(headers, "Last-Modified")
+    if status == 304:
+        snapshot["not_modified"] = True
+        snapshot["etag"] = snapshot["etag"] or etag
+        snapshot["last_modified"] = snapshot["last_modified"] or last_modified
+        return snapshot
 
-    # Стабилизируем query-параметры для cache-busting и маркетинговых меток.
-    normalized = re.sub(r"([?&])(utm_[a-z_]+|fbclid|gclid|_ga|_gl|v|ver|timestamp|ts)=[^&\"'\\s>]+", r"", normalized, flags=re.IGNORECASE)
+    snapshot["bytes"] = len(body)
+    html = body.decode("utf-8", errors="replace")
+    if html:
+        snapshot["hash"] = _hash_html(html)
+    return snapshot
 
-    # Убираем типичные volatile-токены (nonce, csrf, timestamp/id-like payloads).
-    normalized = re.sub(r"\b(nonce|csrf|token|timestamp|build|cache|hash)\s*[:=]\s*[\"']?[-_a-zA-Z0-9:.]{6,}[\"']?", r"\1=", normalized, flags=re.IGNORECASE)
 
-    # Нормализуем пробелы и регистр.
-    normalized = re.sub(r"\s+", " ", normalized).strip().lower()
-    return normalized
+def check_website_snapshot(
+    previous_hash: str,
+    website_url: str,
+    etag: str = "",
+    last_modified: str = "",
+    deadline: float | None = None,
+) -> dict:
+    """fetch_website_snapshot + сравнение с previous_hash: добавляет "changed" и "bytes_saved" (для 304)."""
+    snapshot = fetch_website_snapshot(website_url, etag=etag, last_modified=last_modified, deadline=deadline)
+    snapshot["bytes_saved"] = 0
+    if snapshot["not_modified"]:
+        snapshot["changed"] = False
+        snapshot["hash"] = previous_hash.strip()
+        # Размер тела, которое не пришлось скачивать, — из последней полной загрузки этого URL.
+        snapshot["bytes_saved"] = get_website_body_size(website_url) or 0
+        return snapshot
+    if snapshot["bytes"]:
+        save_website_body_size(website_url, snapshot["bytes"])
+    snapshot["changed"] = bool(snapshot["hash"]) and previous_hash.strip() != snapshot["hash"]
+    return snapshot
 
 
-def compute_website_hash(website_url: str) -> tuple[str, str]:
-    html = fetch_website_html(website_url)
+def compute_website_hash(website_url: str, deadline: float | None = None) -> tuple[str, str]:
+    html = fetch_website_html(website_url, deadline=deadline)
     if not html:
         return "", ""
     normalized = normalize_html_for_hash(html)
@@ -65,13 +274,68 @@ def compute_website_hash(website_url: str) -> tuple[str, str]:
     return digest, normalized
 
 
-def has_website_changed(previous_hash: str, website_url: str) -> tuple[bool, str]:
-    current_hash, _ = compute_website_hash(website_url)
+def has_website_changed(previous_hash: str, website_url: str, deadline: float | None = None) -> tuple[bool, str]:
+    current_hash, _ = compute_website_hash(website_url, deadline=deadline)
     if not current_hash:
         return False, ""
     return previous_hash.strip() != current_hash.strip(), current_hash
 
 
+def check_websites_changed(
+    targets: list,
+    max_workers: int | None = None,
+    max_per_host: int | None = None,
+    budget_sec: float | None = None,
+) -> dict:
+    """Параллельная проверка сайтов: targets — [(key, website_url, previous_hash, etag, last_modified), ...].
+
+    Возвращает {key: снимок check_website_snapshot} или {key: Exception} для ошибок
+    загрузки. Ключи, не успевшие проверить за budget_sec, в результат не попадают.
+    """
+    if not targets:
+        return {}
+    max_workers = max(1, WEBSITE_MONITOR_WORKERS if max_workers is None else max_workers)
+    max_per_host = max(1, WEBSITE_MONITOR_MAX_PER_HOST if max_per_host is None else max_per_host)
+    budget_sec = WEBSITE_MONITOR_BUDGET_SEC if budget_sec is None else budget_sec
+    deadline = time.monotonic() + budget_sec
+
+    host_slots = {}
+    for _key, website_url, *_validators in targets:
+        host = (urlparse(normalize_http_url(website_url)).hostname or "").lower()
+        host_slots.setdefault(host, threading.BoundedSemaphore(max_per_host))
+
+    def check(website_url: str, previous_hash: str, etag: str, last_modified: str):
+        host = (urlparse(normalize_http_url(website_url)).hostname or "").lower()
+        with host_slots[host]:
+            if time.monotonic() >= deadline:
+                raise TimeoutError(f"бюджет времени мониторинга исчерпан: {website_url}")
+            return check_website_snapshot(previous_hash, website_url, etag, last_modified, deadline=deadline)
+
+    executor = ThreadPoolExecutor(max_workers=min(max_workers, len(targets)), thread_name_prefix="monitor")
+    futures = {
+        executor.submit(check, website_url, previous_hash, etag, last_modified): key
+        for key, website_url, previous_hash, etag, last_modified in targets
+    }
+    done, not_done = wait(futures, timeout=max(0.0, budget_sec))
+    # Незавершённые проверки не ждём: очередь отменяется, запущенные упрутся в deadline сами.
+    executor.shutdown(wait=False, cancel_futures=True)
+
+    results = {}
+    for future in done:
+        try:
+            results[futures[future]] = future.result()
+        except Exception as exc:
+            results[futures[future]] = exc
+    if not_done:
+        logging.warning(
+            "⏱️ Бюджет мониторинга сайтов (%s сек) исчерпан: не проверено %s из %s",
+            budget_sec,
+            len(not_done),
+            len(targets),
+        )
+    return results
+
+
 async def _send_telethon_message(
     api_id: int,
     api_hash: str,
@@ -11,6 +11,7 @@
 """
 
 import os
+import tempfile
 
 # Серверные пути к сертификатам ломают инициализацию httpx/OpenAI локально.
 for _var in ("SSL_CERT_FILE", "REQUESTS_CA_BUNDLE"):
@@ -30,3 +31,40 @@ _ENV_DEFAULTS = {
 }
 for _key, _value in _ENV_DEFAULTS.items():
     os.environ.setdefault(_key, _value)
+
+# Локальные файлы состояния (SQLite, журнал записей в таблицу, лог) — во временную
+# папку, чтобы тесты не писали в /app/... контейнера.
+_STATE_DIR = tempfile.mkdtemp(prefix="sheets-to-wp-tests-")
+os.environ.setdefault("STATE_DB_PATH", os.path.join(_STATE_DIR, "state.sqlite3"))
+os.environ.setdefault("GOOGLE_SHEETS_WRITE_JOURNAL", os.path.join(_STATE_DIR, "sheet_write_journal.jsonl"))
+os.environ.setdefault("LOG_FILE", os.path.join(_STATE_DIR, "automation.log"))
+
+import sys
+
+import pytest
+
+_RUN_DIR = os.path.join(os.path.dirname(__file__), "..", "run")
+if _RUN_DIR not in sys.path:
+    sys.path.insert(0, _RUN_DIR)
+
+
+@pytest.fixture
+def isolated_state(request, tmp_path):
+    """Отдельная SQLite-база состояния и чистые счётчики run_metrics на каждый тест.
+
+    База в STATE_DB_PATH общая на весь прогон: без изоляции кеши (геокодинг,
+    тексты источников, ответы OpenAI) отдают одному тесту данные другого.
+    Для unittest-классов (`@pytest.mark.usefixtures("isolated_state")`) папка
+    теста доступна как `self.state_dir`.
+    """
+    import run_metrics
+    import state_store
+
+    previous_path = state_store.STATE_DB_PATH
+    state_store.reset_connection(str(tmp_path / "state.sqlite3"))
+    run_metrics.reset()
+    if request.instance is not None:
+        request.instance.state_dir = str(tmp_path)
+    yield str(tmp_path)
+    state_store.reset_connection(previous_path)
+    run_metrics.reset()
@@ -0,0 +1,185 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+import pytest
+
+RUN_DIR = os.path.join(os.path.dirname(__file__), "..", "run")
+if RUN_DIR not in sys.path:
+    sys.path.insert(0, RUN_DIR)
+
+import run_metrics  # noqa: E402
+
+try:
+    import httpx
+    import async_pipeline
+    _HAS_DEPS = True
+except ModuleNotFoundError:
+    _HAS_DEPS = False
+
+
+class _FakeClients:
+    def __init__(self, handler):
+        transport = httpx.MockTransport(handler)
+        self.http = httpx.AsyncClient(transport=transport)
+        self.insecure_http = self.http
+
+    async def aclose(self):
+        await self.http.aclose()
+
+
+@unittest.skipUnless(_HAS_DEPS, "runtime deps are not available in test env")
+@pytest.mark.usefixtures("isolated_state")
+class AsyncPipelineTests(unittest.TestCase):
+    def test_fetch_source_text_parses_html_page(self):
+        def handler(request):
+            return httpx.Response(
+                200,
+                headers={"content-type": "text/html"},
+                text="<html><body><p>Trail Serra 25 km</p></body></html>",
+            )
+
+        async def scenario():
+            clients = _FakeClients(handler)
+            try:
+                return await async_pipeline.fetch_source_text(clients, "https://race.example.pt")
+            finally:
+                await clients.aclose()
+
+        text, pdf_path = asyncio.run(scenario())
+        self.assertEqual(text, "Trail Serra 25 km")
+        self.assertIsNone(pdf_path)
+
+        # Повторная загрузка того же источника в пределах TTL идёт из кеша, без сети.
+        def offline(request):
+            raise AssertionError("network must not be used for cached source")
+
+        async def cached_scenario():
+            clients = _FakeClients(offline)
+            try:
+                return await async_pipeline.fetch_source_text(clients, "https://RACE.example.pt/")
+            finally:
+                await clients.aclose()
+
+        self.assertEqual(asyncio.run(cached_scenario()), ("Trail Serra 25 km", None))
+        self.assertEqual(run_metrics.snapshot().get("source_cache_hit"), 1)
+
+    def test_fetch_source_text_streams_pdf_to_temp_file(self):
+        payload = b"%PDF-1.4\n" + b"0" * 200_000
+
+        def handler(request):
+            return httpx.Response(200, headers={"content-type": "application/pdf"}, content=payload)
+
+        async def scenario():
+            clients = _FakeClients(handler)
+            try:
+                return await async_pipeline.fetch_source_text(clients, "https://race.example.pt/regulamento.pdf")
+            finally:
+                await clients.aclose()
+
+        text, pdf_path = asyncio.run(scenario())
+        try:
+            self.assertEqual(text, "")
+            with open(pdf_path, "rb") as pdf_file:
+                self.assertEqual(pdf_file.read(), payload)
+        finally:
+            os.remove(pdf_path)
+
+    def test_fetch_source_text_retries_and_gives_up(self):
+        calls = []
+
+        def handler(request):
+            calls.append(str(request.url))
+            return httpx.Response(503)
+
+        async def scenario():
+            clients = _FakeClients(handler)
+            try:
+                return await async_pipeline.fetch_source_text(clients, "https://race.example.pt")
+            finally:
+                await clients.aclose()
+
+        with patch.object(async_pipeline, "source_fetch_attempts", return_value=[0.0, 0.0]):
+            result = asyncio.run(scenario())
+        self.assertEqual(result, ("", None))
+        self.assertEqual(len(calls), 2)
+
+    def test_geocode_uses_cache_before_network(self):
+        def handler(request):
+            raise AssertionError("network must not be used for cached location")
+
+        async def scenario():
+            clients = _FakeClients(handler)
+            try:
+                return await async_pipeline.geocode(clients, "Lisboa")
+            finally:
+                await clients.aclose()
+
+        with patch.object(async_pipeline, "lookup_coordinates", return_value=(38.7, -9.1)):
+            self.assertEqual(asyncio.run(scenario()), (38.7, -9.1))
+
+    def test_events_overlap_and_receive_prefetched_results(self):
+        processed = {}
+        active = 0
+        peak = 0
+        lock = threading.Lock()
+
+        async def fake_prefetch(_clients, plan):
+            await asyncio.sleep(0.02)
+            return {"coordinates": (plan["n"], plan["n"])}
+
+        def process(position, prefetched):
+            nonlocal active, peak
+            with lock:
+                active += 1
+                peak = max(peak, active)
+            time.sleep(0.02)
+            with lock:
+                active -= 1
+                processed[position] = prefetched
+
+        with patch.object(async_pipeline, "_AsyncClients", lambda: _FakeClients(lambda request: httpx.Response(200))), \
+                patch.object(async_pipeline, "prefetch_event", fake_prefetch):
+            asyncio.run(
+                async_pipeline.run_events_async(
+                    [1, 2, 3, 4],
+                    plan_event=lambda position: {"n": position},
+                    process_event=process,
+                    max_concurrent_events=2,
+                )
+            )
+
+        self.assertEqual(processed, {n: {"coordinates": (n, n)} for n in (1, 2, 3, 4)})
+        self.assertLessEqual(peak, 2)
+
+    def test_failed_event_does_not_stop_others(self):
+        processed = []
+
+        async def fake_prefetch(_clients, _plan):
+            return {}
+
+        def process(position, _prefetched):
+            if position == 1:
+                raise RuntimeError("boom")
+            processed.append(position)
+
+        with patch.object(async_pipeline, "_AsyncClients", lambda: _FakeClients(lambda request: httpx.Response(200))), \
+                patch.object(async_pipeline, "prefetch_event", fake_prefetch):
+            with self.assertRaises(RuntimeError):
+                asyncio.run(
+                    async_pipeline.run_events_async(
+                        [1, 2, 3],
+                        plan_event=lambda position: {},
+                        process_event=process,
+                        max_concurrent_events=3,
+                    )
+                )
+        self.assertEqual(sorted(processed), [2, 3])
+
+
+if __name__ == "__main__":
+    unittest.main()
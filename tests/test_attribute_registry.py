@@ -0,0 +1,60 @@
+import os
+import sys
+import unittest
+from unittest.mock import Mock, patch
+
+RUN_DIR = os.path.join(os.path.dirname(__file__), "..", "run")
+if RUN_DIR not in sys.path:
+    sys.path.insert(0, RUN_DIR)
+
+import _5_taxonomy_and_attributes as ta
+import run_metrics
+
+
+def _response(payload, status_code=200):
+    response = Mock(status_code=status_code)
+    response.json.return_value = payload
+    return response
+
+
+class AttributeRegistryTests(unittest.TestCase):
+    def setUp(self):
+        ta.reset_attribute_registry()
+        run_metrics.reset()
+
+    def tearDown(self):
+        ta.reset_attribute_registry()
+        run_metrics.reset()
+
+    def test_attributes_and_terms_are_listed_once_per_run(self):
+        def fake_request(method, endpoint, **kwargs):
+            if endpoint == "products/attributes":
+                return _response([{"id": 1, "name": "Distance", "slug": "pa_distance"}])
+            if endpoint == "products/attributes/1/terms":
+                return _response([{"id": 7, "name": "10 km", "slug": "10-km"}])
+            raise AssertionError(f"unexpected request {method} {endpoint}")
+
+        with patch.object(ta, "_safe_wc_request", side_effect=fake_request) as mock_request:
+            for _ in range(3):
+                attr_id = ta.get_or_create_attribute("Distance")
+                self.assertEqual(ta.get_or_create_attribute_term(attr_id, "10 KM", lang="pt"), 7)
+
+        self.assertEqual(mock_request.call_count, 2)
+        self.assertEqual(run_metrics.snapshot()["wc_registry_calls_saved"], 4)
+
+    def test_created_term_is_indexed_and_conflict_invalidates(self):
+        responses = {
+            ("get", "products/attributes/1/terms"): _response([]),
+            ("post", "products/attributes/1/terms?lang=en"): _response({"id": 9}, 201),
+        }
+        with patch.object(ta, "_safe_wc_request", side_effect=lambda m, e, **kw: responses[(m, e)]) as mock_request:
+            self.assertEqual(ta.get_or_create_attribute_term(1, "Trail", lang="en"), 9)
+            self.assertEqual(ta.get_or_create_attribute_term(1, "trail", lang="en"), 9)
+        self.assertEqual(mock_request.call_count, 2)
+
+        ta._forget_terms(1, "en")
+        self.assertNotIn((1, "en"), ta._terms_cache)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,63 @@
+import os
+import sys
+import unittest
+from unittest.mock import Mock, patch
+
+RUN_DIR = os.path.join(os.path.dirname(__file__), "..", "run")
+if RUN_DIR not in sys.path:
+    sys.path.insert(0, RUN_DIR)
+
+import _3_create_product as cp
+
+
+def _response(payload, status_code=200):
+    response = Mock(status_code=status_code)
+    response.json.return_value = payload
+    response.text = ""
+    return response
+
+
+_TERMS = [
+    {"id": 10, "name": "Running", "parent": 0, "lang": "en", "translations": {"en": 10, "pt": 20}},
+    {"id": 11, "name": "Trail", "parent": 10, "lang": "en", "translations": {"en": 11}},
+    {"id": 20, "name": "Corrida", "parent": 0, "lang": "pt", "translations": {"en": 10, "pt": 20}},
+]
+
+
+class CategoryIndexTests(unittest.TestCase):
+    def setUp(self):
+        cp.reset_category_index()
+
+    def tearDown(self):
+        cp.reset_category_index()
+
+    def test_lookups_and_translations_use_single_preload(self):
+        with patch.object(cp.http_client, "get", return_value=_response(_TERMS)) as mock_get:
+            self.assertEqual(cp.get_category_id_by_name("running", lang="en"), 10)
+            self.assertEqual(cp.get_category_id_by_name("Trail", parent_id=10, lang="en"), 11)
+            self.assertEqual(cp.get_category_id_by_name("Corrida", lang="pt"), 20)
+            self.assertEqual(cp.get_category_translation_id(10, "pt"), 20)
+            self.assertIsNone(cp.get_category_translation_id(11, "pt"))
+        self.assertEqual(mock_get.call_count, 1)
+
+    def test_created_category_is_added_to_index(self):
+        with patch.object(cp.http_client, "get", return_value=_response(_TERMS)), \
+             patch.object(cp.http_client, "post", return_value=_response({"id": 30}, 201)) as mock_post:
+            self.assertEqual(cp.get_category_id_by_name("Road", parent_id=10, lang="en"), 30)
+            self.assertEqual(cp.get_category_id_by_name("road", parent_id=10, lang="en"), 30)
+        self.assertEqual(mock_post.call_count, 1)
+
+
+    def test_terms_without_lang_fall_back_to_search_before_create(self):
+        terms = [{key: value for key, value in term.items() if key != "lang"} for term in _TERMS]
+        with patch.object(cp.http_client, "get", return_value=_response(terms)) as mock_get, \
+             patch.object(cp.http_client, "post") as mock_post:
+            self.assertEqual(cp.get_category_id_by_name("Running", lang="en"), 10)
+            self.assertEqual(cp.get_category_id_by_name("running", lang="en"), 10)
+        mock_post.assert_not_called()
+        self.assertEqual(mock_get.call_count, 2)
+        self.assertEqual(mock_get.call_args.kwargs["params"]["search"], "Running")
+        self.assertEqual(mock_get.call_args.kwargs["params"]["lang"], "en")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,74 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+RUN_DIR = os.path.join(os.path.dirname(__file__), "..", "run")
+if RUN_DIR not in sys.path:
+    sys.path.insert(0, RUN_DIR)
+
+import concurrency  # noqa: E402
+
+
+class BackendSlotTests(unittest.TestCase):
+    def test_slot_caps_parallel_calls_per_backend(self):
+        original = concurrency._semaphores["opencage"]
+        concurrency._semaphores["opencage"] = threading.BoundedSemaphore(2)
+        active = 0
+        peak = 0
+        lock = threading.Lock()
+
+        def call():
+            nonlocal active, peak
+            with concurrency.backend_slot("opencage"):
+                with lock:
+                    active += 1
+                    peak = max(peak, active)
+                time.sleep(0.02)
+                with lock:
+                    active -= 1
+
+        try:
+            with ThreadPoolExecutor(max_workers=6) as executor:
+                for _ in range(6):
+                    executor.submit(call)
+        finally:
+            concurrency._semaphores["opencage"] = original
+
+        self.assertEqual(peak, 2)
+
+    def test_async_slot_shares_limit_with_threads(self):
+        original = concurrency._semaphores["openai"]
+        concurrency._semaphores["openai"] = threading.BoundedSemaphore(1)
+        order = []
+
+        async def scenario():
+            async def call(name):
+                async with concurrency.async_backend_slot("openai", poll_interval=0.001):
+                    order.append(f"{name}:in")
+                    await asyncio.sleep(0.01)
+                    order.append(f"{name}:out")
+
+            with concurrency.backend_slot("openai"):
+                task = asyncio.ensure_future(call("a"))
+                await asyncio.sleep(0.02)
+                self.assertEqual(order, [])
+            await asyncio.gather(task, call("b"))
+
+        try:
+            asyncio.run(scenario())
+        finally:
+            concurrency._semaphores["openai"] = original
+
+        self.assertEqual(order[0::2], [o.replace("out", "in") for o in order[1::2]])
+
+    def test_unknown_backend_is_not_limited(self):
+        with concurrency.backend_slot("unknown"):
+            pass
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,5 +1,5 @@
 import unittest
-from unittest.mock import patch
+from unittest.mock import Mock, patch
 import os
 import sys
 
@@ -27,5 +27,19 @@ class CoordinatesFallbackTests(unittest.TestCase):
             self.assertEqual(mocked.call_count, 2)
 
 
+    @unittest.skipUnless(_HAS_DEPS, "runtime deps are not available in test env")
+    def test_repeated_location_is_served_from_geocode_cache(self):
+        response = Mock()
+        response.json.return_value = {
+            "results": [{"components": {"country_code": "pt"}, "geometry": {"lat": 38.7, "lng": -9.1}}]
+        }
+        with patch("_2_content_generation.requests.get", return_value=response) as mocked:
+            first = content_generation.get_coordinates_from_location("Cache Test Lisboa")
+            second = content_generation.get_coordinates_from_location("cache test  lisboa")
+        self.assertEqual(first, (38.7, -9.1))
+        self.assertEqual(second, (38.7, -9.1))
+        self.assertEqual(mocked.call_count, 1)
+
+
 if __name__ == "__main__":
     unittest.main()
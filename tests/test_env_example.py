@@ -60,6 +60,7 @@ class EnvExampleTests(unittest.TestCase):
             "HTTP_FETCH_USER_AGENT",
             "HTTP_FETCH_RETRY_DELAYS_SEC",
             "HTTP_FETCH_INSECURE_HOSTS",
+            "HTTP_FETCH_MAX_BYTES",
             "RECOVERY_WP_IDS_MODE",
             "RECOVERY_WP_IDS_LIMIT",
             "RECOVERY_WP_IDS_PRODUCT_SCAN_PAGES",
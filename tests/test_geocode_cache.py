@@ -0,0 +1,45 @@
+import os
+import sys
+import unittest
+from unittest.mock import patch
+
+import pytest
+
+RUN_DIR = os.path.join(os.path.dirname(__file__), "..", "run")
+if RUN_DIR not in sys.path:
+    sys.path.insert(0, RUN_DIR)
+
+import geocode_cache  # noqa: E402
+import run_metrics  # noqa: E402
+
+
+@pytest.mark.usefixtures("isolated_state")
+class GeocodeCacheTests(unittest.TestCase):
+    def test_query_normalization_ignores_case_spaces_and_accents(self):
+        self.assertEqual(
+            geocode_cache.normalize_geocode_query("  Santa  Comba DÃO "),
+            geocode_cache.normalize_geocode_query("santa comba dao"),
+        )
+
+    def test_positive_and_negative_entries_with_metrics(self):
+        self.assertIsNone(geocode_cache.lookup_coordinates("Porto"))
+        geocode_cache.store_coordinates("Porto", 41.15, -8.61)
+        geocode_cache.store_coordinates("Nowhere", None, None)
+
+        self.assertEqual(geocode_cache.lookup_coordinates("porto"), (41.15, -8.61))
+        self.assertEqual(geocode_cache.lookup_coordinates("Nowhere"), (None, None))
+        self.assertEqual(run_metrics.snapshot(), {"geocode_cache_miss": 1, "geocode_cache_hit": 2})
+
+    def test_negative_entry_expires_before_positive_one(self):
+        geocode_cache.store_coordinates("Porto", 41.15, -8.61)
+        geocode_cache.store_coordinates("Nowhere", None, None)
+        later = geocode_cache.time.time() + 30 * 86400
+        with patch.object(geocode_cache, "GEOCODE_NEGATIVE_TTL_DAYS", 7), \
+             patch.object(geocode_cache, "GEOCODE_CACHE_TTL_DAYS", 180), \
+             patch.object(geocode_cache.time, "time", return_value=later):
+            self.assertIsNone(geocode_cache.lookup_coordinates("Nowhere"))
+            self.assertEqual(geocode_cache.lookup_coordinates("Porto"), (41.15, -8.61))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,239 @@
+import json
+import os
+import sys
+import tempfile
+import unittest
+from unittest.mock import patch
+
+RUN_DIR = os.path.join(os.path.dirname(__file__), "..", "run")
+if RUN_DIR not in sys.path:
+    sys.path.insert(0, RUN_DIR)
+
+# Другие тесты подменяют модуль заглушкой — импортируем настоящий.
+sys.modules.pop("_1_google_loader", None)
+
+import _1_google_loader as loader  # noqa: E402
+
+
+class _FakeSpreadsheet:
+    def __init__(self, fail_times=0):
+        self.bodies = []
+        self.fail_times = fail_times
+
+    def values_batch_update(self, body):
+        if self.fail_times:
+            self.fail_times -= 1
+            raise RuntimeError("quota")
+        self.bodies.append(body)
+        return {}
+
+
+class _FakeSheet:
+    title = "RACES"
+
+    def __init__(self, spreadsheet):
+        self.spreadsheet = spreadsheet
+
+
+class BatchUpdateTests(unittest.TestCase):
+    def setUp(self):
+        self.headers = ["ID", "STATUS", "SUMMARY", "FAQ", "LINK RACEFINDER"]
+
+    def test_batch_update_rows_sends_single_request_with_merged_ranges(self):
+        spreadsheet = _FakeSpreadsheet()
+        with patch.object(loader, "_get_sheet_with_retry", return_value=_FakeSheet(spreadsheet)):
+            ok = loader.batch_update_rows(
+                {
+                    3: {"STATUS": "Published", "SUMMARY": "S", "LINK RACEFINDER": "L"},
+                    2: {"ID": "7"},
+                },
+                self.headers,
+            )
+
+        self.assertTrue(ok)
+        self.assertEqual(len(spreadsheet.bodies), 1)
+        body = spreadsheet.bodies[0]
+        self.assertEqual(body["valueInputOption"], "USER_ENTERED")
+        self.assertEqual(
+            body["data"],
+            [
+                {"range": "'RACES'!A2", "values": [["7"]]},
+                {"range": "'RACES'!B3", "values": [["Published", "S"]]},
+                {"range": "'RACES'!E3", "values": [["L"]]},
+            ],
+        )
+
+    def test_batch_update_cells_skips_unknown_columns(self):
+        spreadsheet = _FakeSpreadsheet()
+        with patch.object(loader, "_get_sheet_with_retry", return_value=_FakeSheet(spreadsheet)), \
+             patch.object(loader, "_WRITE_BEHIND_ENABLED", False):
+            loader.batch_update_cells(5, {"UNKNOWN": "x", "FAQ": "q"}, self.headers)
+
+        self.assertEqual(spreadsheet.bodies[0]["data"], [{"range": "'RACES'!D5", "values": [["q"]]}])
+
+    def test_batch_update_rows_retries_with_backoff(self):
+        spreadsheet = _FakeSpreadsheet(fail_times=1)
+        with patch.object(loader, "_get_sheet_with_retry", return_value=_FakeSheet(spreadsheet)), \
+             patch.object(loader, "_update_retry_base_delay", 0), \
+             patch.object(loader, "_reset_sheet_cache") as mock_reset:
+            ok = loader.batch_update_rows({2: {"STATUS": "Published"}}, self.headers)
+
+        self.assertTrue(ok)
+        self.assertEqual(len(spreadsheet.bodies), 1)
+        mock_reset.assert_called_once()
+
+
+class _SnapshotSheet:
+    def __init__(self, values):
+        self.values = values
+        self.calls = 0
+
+    def get_values(self, **_kwargs):
+        self.calls += 1
+        return self.values
+
+
+class SheetSnapshotTests(unittest.TestCase):
+    def test_load_all_rows_uses_single_call_and_row_views(self):
+        sheet = _SnapshotSheet([
+            ["ID", "STATUS", "PRICE", "WP PRODUCT ID PT"],
+            ["1", "Revised (complete)", "10"],
+            ["", "", "12", "55"],
+        ])
+        with patch.object(loader, "_get_sheet_with_retry", return_value=sheet):
+            rows, headers = loader.load_all_rows()
+
+        self.assertEqual(sheet.calls, 1)
+        self.assertEqual([row_index for row_index, _row in rows], [2, 3])
+        first = rows[0][1]
+        self.assertEqual(first["STATUS"], "Revised (complete)")
+        # Обрезанные API хвостовые пустые ячейки читаются как пустые строки.
+        self.assertEqual(first.get("WP PRODUCT ID PT"), "")
+        self.assertIsNone(first.get("MISSING"))
+        self.assertEqual(rows[1][1]["WP PRODUCT ID PT"], "55")
+        self.assertEqual(headers.index("PRICE"), 2)
+        self.assertIn("STATUS", headers)
+        self.assertNotIn("NOPE", headers)
+
+    def test_row_view_supports_overrides_and_copy(self):
+        snapshot = loader.SheetSnapshot([["ID", "LAT"], ["7", ""]])
+        _row_index, row = next(snapshot.iter_rows())
+        row["LAT"] = 38.7
+        row.update({"extra": 1})
+
+        copied = row.copy()
+        self.assertEqual(copied, {"ID": "7", "LAT": 38.7, "extra": 1})
+        self.assertIsInstance(copied, dict)
+        # Исходный массив снимка не меняется.
+        self.assertEqual(snapshot.values[0], ["7", ""])
+
+    def test_memory_report_compares_layouts(self):
+        snapshot = loader.SheetSnapshot([["A", "B", "C"], ["1", "2", "3"], ["4"]])
+        report = snapshot.memory_report()
+        self.assertEqual(report["rows"], 2)
+        self.assertLess(report["array_layout_bytes"], report["dict_layout_bytes"])
+
+
+class WriteBehindTests(unittest.TestCase):
+    def setUp(self):
+        self.headers = ["ID", "STATUS", "SUMMARY"]
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.journal = os.path.join(self.tmp_dir.name, "journal.jsonl")
+        self.patches = [
+            patch.object(loader, "_WRITE_BEHIND_ENABLED", True),
+            patch.object(loader, "_WRITE_JOURNAL_FILE", self.journal),
+            patch.object(loader, "_WRITE_FLUSH_INTERVAL_SEC", 3600),
+            patch.object(loader, "_last_flush_ts", loader.time.time()),
+        ]
+        for item in self.patches:
+            item.start()
+        loader._pending_writes.clear()
+
+    def tearDown(self):
+        loader._pending_writes.clear()
+        for item in reversed(self.patches):
+            item.stop()
+        self.tmp_dir.cleanup()
+
+    def test_updates_are_merged_and_flushed_once(self):
+        spreadsheet = _FakeSpreadsheet()
+        with patch.object(loader, "_get_sheet_with_retry", return_value=_FakeSheet(spreadsheet)):
+            loader.batch_update_cells(2, {"STATUS": "Working", "SUMMARY": "S"}, self.headers)
+            loader.batch_update_cells(2, {"STATUS": "Published"}, self.headers)
+            self.assertEqual(spreadsheet.bodies, [])
+            self.assertTrue(loader.flush_pending_updates())
+
+        self.assertEqual(
+            spreadsheet.bodies[0]["data"],
+            [{"range": "'RACES'!B2", "values": [["Published", "S"]]}],
+        )
+        with open(self.journal, encoding="utf-8") as journal:
+            self.assertEqual(journal.read(), "")
+
+    def test_failed_flush_keeps_journal_and_replay_writes_it(self):
+        failing = _FakeSpreadsheet(fail_times=10)
+        with patch.object(loader, "_get_sheet_with_retry", return_value=_FakeSheet(failing)), \
+             patch.object(loader, "_update_retry_base_delay", 0):
+            loader.batch_update_cells(4, {"STATUS": "Published"}, self.headers)
+            self.assertFalse(loader.flush_pending_updates())
+
+        with open(self.journal, encoding="utf-8") as journal:
+            entries = [json.loads(line) for line in journal if line.strip()]
+        self.assertEqual(entries, [{"row": 4, "column": "STATUS", "value": "Published"}])
+
+        # Имитируем перезапуск процесса: буфер в памяти потерян, журнал остался.
+        loader._pending_writes.clear()
+        spreadsheet = _FakeSpreadsheet()
+        with patch.object(loader, "_get_sheet_with_retry", return_value=_FakeSheet(spreadsheet)):
+            self.assertEqual(loader.replay_write_journal(), 1)
+
+        self.assertEqual(spreadsheet.bodies[0]["data"], [{"range": "'RACES'!B4", "values": [["Published"]]}])
+
+
+    def test_writes_queued_during_flush_are_not_blocked_or_lost(self):
+        finished = []
+
+        def slow_send(batch, headers):
+            # Воркер пишет в буфер, пока идёт отправка: блокировки буфера быть не должно.
+            worker = loader.threading.Thread(
+                target=lambda: (loader.batch_update_cells(2, {"STATUS": "Published"}, self.headers), finished.append(True))
+            )
+            worker.start()
+            worker.join(timeout=2)
+            return True
+
+        loader.batch_update_cells(2, {"STATUS": "Working", "SUMMARY": "S"}, self.headers)
+        with patch.object(loader, "batch_update_rows", side_effect=slow_send):
+            self.assertTrue(loader.flush_pending_updates())
+
+        self.assertEqual(finished, [True])
+        self.assertEqual(loader._pending_writes, {2: {"STATUS": "Published"}})
+        with open(self.journal, encoding="utf-8") as journal:
+            entries = [json.loads(line) for line in journal if line.strip()]
+        self.assertEqual(entries, [{"row": 2, "column": "STATUS", "value": "Published"}])
+
+    def test_failed_flush_does_not_overwrite_newer_values(self):
+        def failing_send(batch, headers):
+            loader.batch_update_cells(3, {"STATUS": "Published"}, self.headers)
+            return False
+
+        loader.batch_update_cells(3, {"STATUS": "Working", "SUMMARY": "S"}, self.headers)
+        with patch.object(loader, "batch_update_rows", side_effect=failing_send):
+            self.assertFalse(loader.flush_pending_updates())
+
+        self.assertEqual(loader._pending_writes, {3: {"STATUS": "Published", "SUMMARY": "S"}})
+
+    def test_interval_flush_runs_without_new_writes(self):
+        spreadsheet = _FakeSpreadsheet()
+        with patch.object(loader, "_get_sheet_with_retry", return_value=_FakeSheet(spreadsheet)), \
+             patch.object(loader, "_WRITE_FLUSH_INTERVAL_SEC", 0.05):
+            loader.batch_update_cells(5, {"STATUS": "Published"}, self.headers)
+            for _ in range(100):
+                if spreadsheet.bodies:
+                    break
+                loader.threading.Event().wait(0.05)
+
+        self.assertEqual(spreadsheet.bodies[0]["data"], [{"range": "'RACES'!B5", "values": [["Published"]]}])
+
+if __name__ == "__main__":
+    unittest.main()
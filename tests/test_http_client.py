@@ -0,0 +1,101 @@
+import json
+import os
+import sys
+import unittest
+from unittest.mock import Mock, patch
+
+RUN_DIR = os.path.join(os.path.dirname(__file__), "..", "run")
+if RUN_DIR not in sys.path:
+    sys.path.insert(0, RUN_DIR)
+
+import http_client  # noqa: E402
+
+
+def _response(status_code, headers=None):
+    response = Mock(status_code=status_code)
+    response.headers = headers or {}
+    return response
+
+
+class HttpClientTests(unittest.TestCase):
+    def test_retry_honours_retry_after_header(self):
+        session = Mock()
+        session.request.side_effect = [_response(429, {"Retry-After": "7"}), _response(200)]
+        with patch.object(http_client, "get_session", return_value=session), \
+             patch.object(http_client.time, "sleep") as mock_sleep:
+            response = http_client.get("https://wp.test/wp-json/wc/v3/products")
+
+        self.assertEqual(response.status_code, 200)
+        mock_sleep.assert_called_once_with(7.0)
+        self.assertEqual(session.request.call_args.kwargs["timeout"], http_client.HTTP_TIMEOUT_SEC)
+
+    def test_post_is_not_retried_on_server_error(self):
+        session = Mock()
+        session.request.return_value = _response(503)
+        with patch.object(http_client, "get_session", return_value=session), \
+             patch.object(http_client.time, "sleep") as mock_sleep:
+            response = http_client.post("https://wp.test/wp-json/wc/v3/products", data="{}")
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(session.request.call_count, 1)
+        mock_sleep.assert_not_called()
+
+    def test_post_is_sent_once_on_read_timeout(self):
+        session = Mock()
+        session.request.side_effect = http_client.requests.exceptions.ReadTimeout("read timed out")
+        with patch.object(http_client, "get_session", return_value=session), \
+             patch.object(http_client.time, "sleep") as mock_sleep:
+            with self.assertRaises(http_client.requests.exceptions.ReadTimeout):
+                http_client.post("https://wp.test/wp-json/wc/v3/products", data="{}")
+
+        self.assertEqual(session.request.call_count, 1)
+        mock_sleep.assert_not_called()
+
+    def test_post_is_retried_when_connection_was_not_established(self):
+        session = Mock()
+        session.request.side_effect = [
+            http_client.requests.exceptions.ConnectTimeout("connect timed out"),
+            _response(201),
+        ]
+        with patch.object(http_client, "get_session", return_value=session), \
+             patch.object(http_client.time, "sleep"):
+            response = http_client.post("https://wp.test/wp-json/wc/v3/products", data="{}")
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(session.request.call_count, 2)
+
+    def test_get_is_retried_on_read_timeout(self):
+        session = Mock()
+        session.request.side_effect = [http_client.requests.exceptions.ReadTimeout("read timed out"), _response(200)]
+        with patch.object(http_client, "get_session", return_value=session), \
+             patch.object(http_client.time, "sleep"):
+            response = http_client.get("https://wp.test/wp-json/wc/v3/products")
+
+        self.assertEqual(response.status_code, 200)
+
+    def test_woocommerce_client_builds_wc_v3_requests(self):
+        client = http_client.WooCommerceClient("https://wp.test/", "ck", "cs", timeout=5)
+        with patch.object(http_client, "request", return_value=_response(201)) as mock_request:
+            client.post("products/1/variations/batch?lang=pt", {"create": [{"regular_price": "5"}]})
+
+        args, kwargs = mock_request.call_args
+        self.assertEqual(args, ("POST", "https://wp.test/wp-json/wc/v3/products/1/variations/batch?lang=pt"))
+        self.assertEqual(kwargs["auth"], ("ck", "cs"))
+        self.assertEqual(kwargs["timeout"], 5)
+        self.assertEqual(json.loads(kwargs["data"]), {"create": [{"regular_price": "5"}]})
+
+
+    def test_woocommerce_client_owns_the_only_retry_layer(self):
+        client = http_client.WooCommerceClient("https://wp.test", "ck", "cs", max_retries=3, retry_base_delay=15)
+        session = Mock()
+        session.request.return_value = _response(503)
+        with patch.object(http_client, "get_session", return_value=session), \
+             patch.object(http_client.time, "sleep") as mock_sleep:
+            response = client.get("products/1")
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(session.request.call_count, 4)
+        self.assertEqual([call.args[0] for call in mock_sleep.call_args_list], [15, 30, 60])
+
+if __name__ == "__main__":
+    unittest.main()
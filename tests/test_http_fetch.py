@@ -22,10 +22,83 @@ class HttpFetchTests(unittest.TestCase):
             mock_get.return_value.raise_for_status.return_value = None
             mock_get.return_value.text = ""
             mock_get.return_value.headers = {}
-            content_generation._fetch_with_retries("https://www.omdceventos.com/evento/test")
+            content_generation._fetch_with_retries("https://www.omdceventos.com/evento/test", lambda response: None)
             kwargs = mock_get.call_args.kwargs
             self.assertIn("verify", kwargs)
             self.assertFalse(kwargs["verify"])
+            self.assertTrue(kwargs["stream"])
+
+
+
+@unittest.skipUnless(_HAS_DEPS, "requests is not available in test env")
+class SourceBodyReaderTests(unittest.TestCase):
+    def _chunks(self, data: bytes, size: int = 4):
+        for offset in range(0, len(data), size):
+            yield data[offset:offset + size]
+
+    def test_non_pdf_body_is_parsed_as_html_even_for_pdf_url(self):
+        reader = content_generation.SourceBodyReader(
+            "https://race.pt/reg.pdf", "https://race.pt/reg.pdf", {"content-type": "application/octet-stream"}
+        )
+        for chunk in self._chunks(b"<html>not a pdf at all</html>"):
+            self.assertTrue(reader.feed(chunk))
+        self.assertIsNone(reader._pdf_file)
+        self.assertEqual(reader.finish(), ("not a pdf at all", None))
+
+    def test_pdf_from_url_without_pdf_suffix_is_detected_by_magic_bytes(self):
+        payload = b"%PDF-1.4\n" + b"z" * 40
+        reader = content_generation.SourceBodyReader(
+            "https://race.pt/download?id=7", "https://race.pt/download?id=7", {"content-type": "text/html"}
+        )
+        for chunk in self._chunks(payload, 3):
+            self.assertTrue(reader.feed(chunk))
+        text, pdf_path = reader.finish()
+        try:
+            self.assertEqual(text, "")
+            with open(pdf_path, "rb") as pdf_file:
+                self.assertEqual(pdf_file.read(), payload)
+        finally:
+            os.remove(pdf_path)
+
+    def test_google_drive_html_wrapper_is_rejected_without_reading(self):
+        drive_url = "https://drive.google.com/uc?export=download&id=abc"
+        reader = content_generation.SourceBodyReader(drive_url, drive_url, {"content-type": "text/html"})
+        self.assertFalse(reader.feed(b"<html>Google Drive</html>"))
+        self.assertEqual(reader.finish(), ("", None))
+
+    def test_pdf_is_spooled_to_unique_temp_file(self):
+        payload = b"%PDF-1.7\n" + b"x" * 100
+        reader = content_generation.SourceBodyReader(
+            "https://race.pt/reg.pdf", "https://race.pt/reg.pdf", {"content-type": "application/pdf"}
+        )
+        for chunk in self._chunks(payload, 7):
+            self.assertTrue(reader.feed(chunk))
+        text, pdf_path = reader.finish()
+        try:
+            self.assertEqual(text, "")
+            with open(pdf_path, "rb") as pdf_file:
+                self.assertEqual(pdf_file.read(), payload)
+        finally:
+            os.remove(pdf_path)
+
+    def test_pdf_over_byte_cap_is_discarded(self):
+        reader = content_generation.SourceBodyReader(
+            "https://race.pt/reg.pdf", "https://race.pt/reg.pdf", {"content-type": "application/pdf"}, max_bytes=16
+        )
+        self.assertTrue(reader.feed(b"%PDF-1.7\n"))
+        pdf_path = reader._pdf_file.name
+        self.assertFalse(reader.feed(b"y" * 32))
+        self.assertEqual(reader.finish(), ("", None))
+        self.assertFalse(os.path.exists(pdf_path))
+
+    def test_html_over_byte_cap_is_truncated(self):
+        reader = content_generation.SourceBodyReader(
+            "https://race.pt", "https://race.pt", {"content-type": "text/html; charset=utf-8"}, max_bytes=25
+        )
+        self.assertFalse(reader.feed("<p>Corrida São João</p><p>second paragraph</p>".encode("utf-8")))
+        text, pdf_path = reader.finish()
+        self.assertEqual(text, "Corrida São João")
+        self.assertIsNone(pdf_path)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,57 @@
+import base64
+import json
+import os
+import sys
+import time
+import unittest
+from unittest.mock import Mock, patch
+
+RUN_DIR = os.path.join(os.path.dirname(__file__), "..", "run")
+if RUN_DIR not in sys.path:
+    sys.path.insert(0, RUN_DIR)
+
+import _3_create_product as cp
+
+
+def _make_token(exp: float, marker: str = "a") -> str:
+    payload = base64.urlsafe_b64encode(json.dumps({"exp": exp, "m": marker}).encode()).decode().rstrip("=")
+    return f"header.{payload}.signature"
+
+
+class JwtTokenProviderTests(unittest.TestCase):
+    def setUp(self):
+        cp._jwt_token = None
+        cp._jwt_expires_at = 0.0
+
+    def tearDown(self):
+        cp._jwt_token = None
+        cp._jwt_expires_at = 0.0
+
+    def test_token_is_reused_until_close_to_exp(self):
+        fresh = _make_token(time.time() + 3600)
+        with patch.object(cp, "_fetch_jwt_token", return_value=fresh) as mock_fetch:
+            self.assertEqual(cp.get_jwt_token(), fresh)
+            self.assertEqual(cp.get_jwt_token(), fresh)
+        self.assertEqual(mock_fetch.call_count, 1)
+
+        expiring = _make_token(time.time() + 10)
+        cp._jwt_token, cp._jwt_expires_at = expiring, cp._jwt_expiry(expiring)
+        with patch.object(cp, "_fetch_jwt_token", return_value=fresh) as mock_fetch:
+            self.assertEqual(cp.get_jwt_token(), fresh)
+        self.assertEqual(mock_fetch.call_count, 1)
+
+    def test_send_acf_data_forces_refresh_on_401(self):
+        stale = _make_token(time.time() + 3600, "stale")
+        fresh = _make_token(time.time() + 3600, "fresh")
+        cp._jwt_token, cp._jwt_expires_at = stale, cp._jwt_expiry(stale)
+        responses = [Mock(status_code=401), Mock(status_code=200)]
+        with patch.object(cp, "_fetch_jwt_token", return_value=fresh), \
+             patch.object(cp.http_client, "post", side_effect=responses) as mock_post:
+            response = cp.send_acf_data(1, {"fields": {}}, stale)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(mock_post.call_args.kwargs["headers"]["Authorization"], f"Bearer {fresh}")
+        self.assertEqual(cp.get_jwt_token(), fresh)
+
+
+if __name__ == "__main__":
+    unittest.main()
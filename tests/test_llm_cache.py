@@ -0,0 +1,57 @@
+import os
+import sys
+import unittest
+from unittest.mock import patch
+
+import pytest
+
+RUN_DIR = os.path.join(os.path.dirname(__file__), "..", "run")
+if RUN_DIR not in sys.path:
+    sys.path.insert(0, RUN_DIR)
+
+import llm_cache  # noqa: E402
+import run_metrics  # noqa: E402
+import state_store  # noqa: E402
+
+
+@pytest.mark.usefixtures("isolated_state")
+class LlmCacheTests(unittest.TestCase):
+    def test_key_depends_on_every_input(self):
+        base = ("gpt-5", "high", None, "SYSTEM", "USER", ["file_1"])
+        key = llm_cache.response_cache_key(*base)
+        self.assertEqual(key, llm_cache.response_cache_key(*base))
+        for index, changed in enumerate(("gpt-4.1", "low", "0.7", "SYSTEM 2", "USER 2", ["file_2"])):
+            variant = list(base)
+            variant[index] = changed
+            self.assertNotEqual(key, llm_cache.response_cache_key(*variant), f"input #{index} must affect the key")
+
+    def test_roundtrip_with_metrics(self):
+        key = llm_cache.response_cache_key("gpt-5", "high", None, "SYSTEM", "USER")
+        self.assertIsNone(llm_cache.lookup_response(key))
+        llm_cache.store_response(key, {"summary": "Trail", "benefits": ["Medalha"]})
+
+        self.assertEqual(llm_cache.lookup_response(key), {"summary": "Trail", "benefits": ["Medalha"]})
+        self.assertEqual(run_metrics.snapshot(), {"llm_cache_miss": 1, "llm_cache_hit": 1})
+
+    def test_least_recently_used_entries_are_evicted_over_size_limit(self):
+        payload = {"summary": "x" * 400}
+        with patch.object(llm_cache, "LLM_CACHE_MAX_MB", 1200 / (1024 * 1024)), \
+             patch.object(state_store.time, "time", side_effect=range(1, 100)):
+            llm_cache.store_response("a", payload)
+            llm_cache.store_response("b", payload)
+            self.assertIsNotNone(llm_cache.lookup_response("a"))  # «a» становится самым свежим
+            llm_cache.store_response("c", payload)
+
+            self.assertIsNone(llm_cache.lookup_response("b"))
+            self.assertIsNotNone(llm_cache.lookup_response("a"))
+            self.assertIsNotNone(llm_cache.lookup_response("c"))
+
+    def test_zero_size_disables_cache(self):
+        with patch.object(llm_cache, "LLM_CACHE_MAX_MB", 0):
+            llm_cache.store_response("a", {"summary": "Trail"})
+            self.assertIsNone(llm_cache.lookup_response("a"))
+        self.assertIsNone(llm_cache.lookup_response("a"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,99 @@
+import json
+import os
+import sys
+import types
+import unittest
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+RUN_DIR = os.path.join(os.path.dirname(__file__), "..", "run")
+if RUN_DIR not in sys.path:
+    sys.path.insert(0, RUN_DIR)
+
+import llm_cache  # noqa: E402
+import openai_batch  # noqa: E402
+
+
+def _batch_output_line(custom_id, payload=None, status_code=200):
+    body = {
+        "output": [
+            {"type": "reasoning", "summary": []},
+            {"type": "message", "content": [{"type": "output_text", "text": json.dumps(payload)}]},
+        ]
+    }
+    return json.dumps({"custom_id": custom_id, "response": {"status_code": status_code, "body": body}, "error": None})
+
+
+@pytest.mark.usefixtures("isolated_state")
+class OpenAIBatchTests(unittest.TestCase):
+    def setUp(self):
+        self.files = MagicMock()
+        self.batches = MagicMock()
+        for name, mock in (("files", self.files), ("batches", self.batches)):
+            patcher = patch.object(openai_batch.openai, name, mock, create=True)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_checkpoint_roundtrip(self):
+        value = openai_batch.format_checkpoint(openai_batch.PHASE_SECOND, "batch_abc")
+        self.assertEqual(openai_batch.parse_checkpoint(value), ("second", "batch_abc"))
+        self.assertIsNone(openai_batch.parse_checkpoint(""))
+        self.assertIsNone(openai_batch.parse_checkpoint("third:batch_abc"))
+
+    def test_submit_groups_requests_by_phase_and_deduplicates_prompts(self):
+        uploaded = []
+
+        def create_file(file, purpose):
+            uploaded.append([json.loads(line) for line in file.read().decode("utf-8").splitlines()])
+            return types.SimpleNamespace(id=f"file_{len(uploaded)}")
+
+        self.files.create.side_effect = create_file
+        self.batches.create.side_effect = lambda **kwargs: types.SimpleNamespace(id=f"batch_{kwargs['input_file_id']}")
+
+        collector = openai_batch.BatchCollector()
+        collector.defer("first", 2, "key-a", {"model": "m", "input": "a"})
+        collector.defer("first", 5, "key-a", {"model": "m", "input": "a"})
+        collector.defer("second", 7, "key-b", {"model": "m", "input": "b"})
+
+        checkpoints = collector.submit()
+
+        self.assertEqual(checkpoints, {2: "first:batch_file_1", 5: "first:batch_file_1", 7: "second:batch_file_2"})
+        self.assertEqual([line["custom_id"] for line in uploaded[0]], ["key-a"])
+        self.assertEqual(uploaded[0][0]["url"], "/v1/responses")
+        self.assertEqual(uploaded[1][0]["body"], {"model": "m", "input": "b"})
+        self.assertEqual(self.batches.create.call_args.kwargs["endpoint"], "/v1/responses")
+
+    def test_completed_phase_is_not_deferred_again(self):
+        collector = openai_batch.BatchCollector({3: 1})
+        self.assertFalse(collector.can_defer("first", 3))
+        self.assertTrue(collector.can_defer("second", 3))
+        self.assertTrue(collector.can_defer("first", 4))
+
+    def test_collect_stores_completed_results_in_response_cache(self):
+        batches = {
+            "batch_done": types.SimpleNamespace(
+                status="completed", output_file_id="out_1", input_file_id="in_1", error_file_id=None
+            ),
+            "batch_running": types.SimpleNamespace(
+                status="in_progress", output_file_id=None, input_file_id="in_2", error_file_id=None
+            ),
+        }
+        self.batches.retrieve.side_effect = lambda batch_id: batches[batch_id]
+        output = "\n".join([
+            _batch_output_line("key-a", {"summary": "Trail"}),
+            _batch_output_line("key-b", {"summary": "ignored"}, status_code=500),
+        ])
+        self.files.content.return_value = types.SimpleNamespace(text=output)
+
+        states = openai_batch.collect_batch_results(["batch_done", "batch_running", "batch_done"])
+
+        self.assertEqual(states, {"batch_done": "done", "batch_running": "pending"})
+        self.assertEqual(llm_cache.lookup_response("key-a"), {"summary": "Trail"})
+        self.assertIsNone(llm_cache.lookup_response("key-b"))
+        deleted = [call.args[0] for call in self.files.delete.call_args_list]
+        self.assertEqual(sorted(deleted), ["in_1", "out_1"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,94 @@
+import os
+import sys
+import types
+import unittest
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+RUN_DIR = os.path.join(os.path.dirname(__file__), "..", "run")
+if RUN_DIR not in sys.path:
+    sys.path.insert(0, RUN_DIR)
+
+import openai_file_cache  # noqa: E402
+import run_metrics  # noqa: E402
+import state_store  # noqa: E402
+
+
+class _NotFound(Exception):
+    status_code = 404
+
+
+@pytest.mark.usefixtures("isolated_state")
+class OpenAIFileCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.uploaded = []
+        self.files = MagicMock()
+        self.files.create.side_effect = self._create
+        patcher = patch.object(openai_file_cache.openai, "files", self.files, create=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _create(self, file, purpose):
+        self.uploaded.append(file.read())
+        return types.SimpleNamespace(id=f"file_{len(self.uploaded)}")
+
+    def _pdf(self, name, payload):
+        path = os.path.join(self.state_dir, name)
+        with open(path, "wb") as pdf_file:
+            pdf_file.write(payload)
+        return path
+
+    def test_identical_pdfs_are_uploaded_once(self):
+        first = openai_file_cache.upload_pdf_cached(self._pdf("a.pdf", b"%PDF-1.4 federation"))
+        second = openai_file_cache.upload_pdf_cached(self._pdf("b.pdf", b"%PDF-1.4 federation"))
+        other = openai_file_cache.upload_pdf_cached(self._pdf("c.pdf", b"%PDF-1.4 other race"))
+
+        self.assertEqual(first, "file_1")
+        self.assertEqual(second, "file_1")
+        self.assertEqual(other, "file_2")
+        self.assertEqual(len(self.uploaded), 2)
+        self.assertEqual(
+            run_metrics.snapshot(),
+            {"openai_file_upload": 2, "openai_file_cache_hit": 1, "openai_file_bytes_saved": 19},
+        )
+
+    def test_expired_entry_is_reuploaded_and_old_file_deleted(self):
+        path = self._pdf("a.pdf", b"%PDF-1.4 federation")
+        openai_file_cache.upload_pdf_cached(path)
+        later = openai_file_cache.time.time() + 31 * 86400
+        with patch.object(openai_file_cache, "OPENAI_FILE_CACHE_TTL_DAYS", 30), \
+             patch.object(openai_file_cache.time, "time", return_value=later):
+            self.assertEqual(openai_file_cache.upload_pdf_cached(path), "file_2")
+        self.files.delete.assert_called_once_with("file_1")
+
+    def test_cleanup_deletes_only_expired_uploads(self):
+        openai_file_cache.upload_pdf_cached(self._pdf("a.pdf", b"%PDF-1.4 old"))
+        later = openai_file_cache.time.time() + 31 * 86400
+        # time — общий модуль, поэтому «свежая» загрузка тоже сохраняется с uploaded_at = later.
+        with patch.object(openai_file_cache.time, "time", return_value=later):
+            openai_file_cache.upload_pdf_cached(self._pdf("b.pdf", b"%PDF-1.4 fresh"))
+            with patch.object(openai_file_cache, "OPENAI_FILE_CACHE_TTL_DAYS", 30):
+                deleted = openai_file_cache.cleanup_stale_openai_files()
+
+        self.assertEqual(deleted, 1)
+        self.files.delete.assert_called_once_with("file_1")
+        self.assertIsNone(state_store.get_openai_file(openai_file_cache.file_sha256(self._pdf("c.pdf", b"%PDF-1.4 old"))))
+        self.assertIsNotNone(state_store.get_openai_file(openai_file_cache.file_sha256(self._pdf("d.pdf", b"%PDF-1.4 fresh"))))
+
+    def test_cleanup_keeps_entry_when_delete_fails(self):
+        path = self._pdf("a.pdf", b"%PDF-1.4 federation")
+        openai_file_cache.upload_pdf_cached(path)
+        self.files.delete.side_effect = RuntimeError("network down")
+        with patch.object(openai_file_cache, "OPENAI_FILE_CACHE_TTL_DAYS", 0):
+            self.assertEqual(openai_file_cache.cleanup_stale_openai_files(), 0)
+        self.assertIsNotNone(state_store.get_openai_file(openai_file_cache.file_sha256(path)))
+
+        self.files.delete.side_effect = _NotFound("already gone")
+        with patch.object(openai_file_cache, "OPENAI_FILE_CACHE_TTL_DAYS", 0):
+            self.assertEqual(openai_file_cache.cleanup_stale_openai_files(), 1)
+        self.assertIsNone(state_store.get_openai_file(openai_file_cache.file_sha256(path)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -3,8 +3,11 @@ import os
 import sys
 import types
 import unittest
+import unittest.mock
 from tempfile import NamedTemporaryFile
 
+import pytest
+
 RUN_DIR = os.path.join(os.path.dirname(__file__), "..", "run")
 if RUN_DIR not in sys.path:
     sys.path.insert(0, RUN_DIR)
@@ -35,6 +38,8 @@ class _DummyClient:
         self.responses = _DummyResponses()
 
 
+# Кеши ответов и текстов источников — в отдельной базе на тест (isolated_state).
+@pytest.mark.usefixtures("isolated_state")
 class OpenAIResponsesTests(unittest.TestCase):
     def setUp(self):
         _seed_env()
@@ -155,6 +160,171 @@ class OpenAIResponsesTests(unittest.TestCase):
         self.assertEqual(payload[1]["role"], "user")
         self.assertEqual(payload[1]["content"][0]["text"], "{\n  \"a\": 1\n}")
 
+    def test_call_second_openai_assistant_reuses_cached_response(self):
+        self.content.config["openai_second_model"] = "second-model"
+        self.content.config["openai_second_system_prompt_file"] = ""
+        dummy_client = _DummyClient()
+        self.content._OPENAI_CLIENT = dummy_client
+
+        self.assertEqual(self.content.call_second_openai_assistant({"a": 1}), {"summary": "ok"})
+        dummy_client.responses.last_kwargs = None
+        self.assertEqual(self.content.call_second_openai_assistant({"a": 1}), {"summary": "ok"})
+        self.assertIsNone(dummy_client.responses.last_kwargs)
+
+        self.content.call_second_openai_assistant({"a": 1}, use_cache=False)
+        self.assertIsNotNone(dummy_client.responses.last_kwargs)
+
+        dummy_client.responses.last_kwargs = None
+        self.content.config["openai_second_model"] = "other-model"
+        self.content.call_second_openai_assistant({"a": 1})
+        self.assertEqual(dummy_client.responses.last_kwargs["model"], "other-model")
+
+    def test_structured_output_declares_schema_and_counts_retries(self):
+        import run_metrics
+
+        self.content.config["openai_text_model"] = "test-model"
+        self.content.config["openai_system_prompt_file"] = ""
+        self.content.config["openai_structured_output"] = True
+        replies = iter(['{"summary": "cut', json.dumps({"summary": "ok"})])
+        calls = []
+
+        def create(**kwargs):
+            calls.append(kwargs)
+            usage = types.SimpleNamespace(input_tokens=100, output_tokens=20)
+            return types.SimpleNamespace(output_text=next(replies), usage=usage)
+
+        dummy_client = _DummyClient()
+        dummy_client.responses.create = create
+        self.content._OPENAI_CLIENT = dummy_client
+        run_metrics.reset()
+        self.addCleanup(run_metrics.reset)
+
+        self.assertEqual(self.content.call_openai_assistant("hello", use_cache=False), {"summary": "ok"})
+
+        text_format = calls[0]["text"]["format"]
+        self.assertEqual(text_format["type"], "json_schema")
+        self.assertTrue(text_format["strict"])
+        self.assertIn("benefits_pt", text_format["schema"]["required"])
+        self.assertFalse(text_format["schema"]["additionalProperties"])
+        snapshot = run_metrics.snapshot()
+        self.assertEqual(snapshot["openai_retries"], 1)
+        self.assertEqual(snapshot["openai_retry_tokens"], 120)
+        self.assertEqual(snapshot["openai_input_tokens"], 200)
+
+        self.content.config["openai_structured_output"] = False
+        calls.clear()
+        replies = iter([json.dumps({"summary": "ok"})])
+        self.content.call_openai_assistant("hello", use_cache=False)
+        self.assertNotIn("text", calls[0])
+
+    def test_single_pass_appends_rules_to_first_system_prompt(self):
+        with NamedTemporaryFile("w", delete=False) as system_file:
+            system_file.write("SYSTEM")
+        with NamedTemporaryFile("w", delete=False) as rules_file:
+            rules_file.write("SINGLE PASS RULES")
+        self.content.config["openai_text_model"] = "test-model"
+        self.content.config["openai_system_prompt_file"] = system_file.name
+        self.content.config["openai_single_pass_prompt_file"] = rules_file.name
+        dummy_client = _DummyClient()
+        self.content._OPENAI_CLIENT = dummy_client
+
+        self.content.call_openai_assistant("hello", single_pass=True)
+        self.assertEqual(dummy_client.responses.last_kwargs["input"][0]["content"][0]["text"], "SYSTEM\n\nSINGLE PASS RULES")
+
+        # Ответ двухпроходного режима не берётся из кеша однопроходного.
+        dummy_client.responses.last_kwargs = None
+        self.content.call_openai_assistant("hello")
+        self.assertEqual(dummy_client.responses.last_kwargs["input"][0]["content"][0]["text"], "SYSTEM")
+
+    def test_clean_assistant_result_applies_second_assistant_rules(self):
+        payload = {
+            "org_info": (
+                "<strong>Regulation link ↗</strong>\n\n"
+                "<strong>Timing method:</strong> Chip timing\n\n"
+                "<strong>Prizes:</strong>\n\n"
+                "<strong>Parking and shuttle details:</strong> Not provided\n\n"
+                "<strong>Elevation profile:</strong> 1200 m\n\n"
+                "<strong>Cut-off times:</strong>\n• Long: 6h\n• Short: Not specified\n[]"
+            ),
+            "org_info_pt": "<strong>Método de cronometragem:</strong> Chip\n\n<strong>Prémios:</strong> Não especificado",
+            "benefits": ["🏅 Medal", "📸 Not specified", "[]"],
+            "benefits_pt": ["🏅 Medalha"],
+            "faq": "• Q: Parking?\n  A: Not specified",
+        }
+
+        result = self.content.clean_assistant_result(dict(payload), "")
+
+        self.assertEqual(
+            result["org_info"],
+            "<strong>Timing method:</strong> Chip timing\n\n<strong>Cut-off times:</strong>\n• Long: 6h",
+        )
+        self.assertEqual(result["org_info_pt"], "<strong>Método de cronometragem:</strong> Chip")
+        self.assertEqual(result["benefits"], ["🏅 Medal"])
+        self.assertEqual(result["faq"], payload["faq"])
+
+        with_link = self.content.clean_assistant_result(
+            {"org_info": "<strong>Timing method:</strong> Chip\n\n<strong>Regulation link ↗</strong>"},
+            "https://example.com/rules.pdf",
+        )
+        self.assertTrue(with_link["org_info"].startswith('<strong><a class="" href="https://example.com/rules.pdf"'))
+        self.assertTrue(with_link["org_info"].endswith("<strong>Timing method:</strong> Chip"))
+
+    def test_load_prompt_file_reloads_only_after_change(self):
+        with NamedTemporaryFile("w", delete=False) as prompt_file:
+            prompt_file.write("v1")
+        self.assertEqual(self.content._load_prompt_file(prompt_file.name), "v1")
+
+        real_open = open
+        reads = []
+
+        def counting_open(*args, **kwargs):
+            reads.append(args[0])
+            return real_open(*args, **kwargs)
+
+        with unittest.mock.patch("builtins.open", counting_open):
+            self.assertEqual(self.content._load_prompt_file(prompt_file.name), "v1")
+        self.assertEqual(reads, [])
+
+        with open(prompt_file.name, "w") as handle:
+            handle.write("version 2")
+        stat = os.stat(prompt_file.name)
+        os.utime(prompt_file.name, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+        self.assertEqual(self.content._load_prompt_file(prompt_file.name), "version 2")
+
+    def test_retry_keeps_system_prefix_identical_and_counts_cached_tokens(self):
+        import run_metrics
+
+        with NamedTemporaryFile("w", delete=False) as system_file:
+            system_file.write("SYSTEM")
+        self.content.config["openai_text_model"] = "test-model"
+        self.content.config["openai_system_prompt_file"] = system_file.name
+        replies = iter(["not json", json.dumps({"summary": "ok"})])
+        calls = []
+
+        def create(**kwargs):
+            calls.append(kwargs)
+            usage = types.SimpleNamespace(
+                input_tokens=1000,
+                output_tokens=10,
+                input_tokens_details=types.SimpleNamespace(cached_tokens=800),
+            )
+            return types.SimpleNamespace(output_text=next(replies), usage=usage)
+
+        dummy_client = _DummyClient()
+        dummy_client.responses.create = create
+        self.content._OPENAI_CLIENT = dummy_client
+        run_metrics.reset()
+        self.addCleanup(run_metrics.reset)
+
+        self.assertEqual(self.content.call_openai_assistant("hello", file_ids=["file_1"], use_cache=False), {"summary": "ok"})
+
+        self.assertEqual(calls[0]["input"][0], calls[1]["input"][0])
+        retry_user_content = calls[1]["input"][1]["content"]
+        self.assertEqual(retry_user_content[1]["file_id"], "file_1")
+        self.assertIn("СТРОГО", retry_user_content[-1]["text"])
+        self.assertEqual(len(calls[0]["input"][1]["content"]), 2)
+        self.assertEqual(run_metrics.snapshot()["openai_cached_input_tokens"], 1600)
+
     def test_second_prompt_has_cleanup_rules(self):
         prompt_path = os.path.join(RUN_DIR, "prompts", "second_system.txt")
         with open(prompt_path, "r", encoding="utf-8") as handle:
@@ -229,11 +399,17 @@ class OpenAIResponsesTests(unittest.TestCase):
             def __init__(self, text):
                 self.text = text
                 self.status_code = 200
-                self.headers = {"content-type": "text/html"}
+                self.headers = {"content-type": "text/html; charset=utf-8"}
 
             def raise_for_status(self):
                 return None
 
+            def iter_content(self, chunk_size=None):
+                yield self.text.encode("utf-8")
+
+            def close(self):
+                return None
+
         class DummyRequests:
             def __init__(self):
                 self.calls = []
@@ -264,5 +440,20 @@ class OpenAIResponsesTests(unittest.TestCase):
         self.assertEqual(dummy_requests.calls[-1]["headers"]["Accept-Language"], "en-US,en;q=0.9,pt-PT;q=0.8,pt;q=0.7")
 
 
+    def test_check_wp_upload_uses_shared_http_client(self):
+        created = types.SimpleNamespace(status_code=201, json=lambda: {"id": 42})
+        deleted = types.SimpleNamespace(status_code=200)
+        with unittest.mock.patch.object(self.content.http_client, "post", return_value=created) as post, \
+                unittest.mock.patch.object(self.content.http_client, "delete", return_value=deleted) as delete:
+            self.assertTrue(self.content.check_wp_upload("jwt"))
+
+        media_url = self.content.config["wp_url"].rstrip("/") + "/wp-json/wp/v2/media"
+        self.assertEqual(post.call_args.args[0], media_url)
+        self.assertIn("file", post.call_args.kwargs["files"])
+        delete.assert_called_once_with(
+            f"{media_url}/42?force=true",
+            headers={"Authorization": "Bearer jwt"},
+        )
+
 if __name__ == "__main__":
     unittest.main()
@@ -8,7 +8,9 @@ RUN_DIR = os.path.join(os.path.dirname(__file__), "..", "run")
 if RUN_DIR not in sys.path:
     sys.path.insert(0, RUN_DIR)
 
-if "requests" not in sys.modules:
+try:
+    import requests  # noqa: F401
+except ModuleNotFoundError:
     requests_stub = types.ModuleType("requests")
     requests_stub.get = Mock()
     sys.modules["requests"] = requests_stub
@@ -314,7 +316,7 @@ class RecoveryIntegrationLikeTests(unittest.TestCase):
                 }
             ]
         }
-        with patch("requests.get", return_value=response):
+        with patch("http_client.get", return_value=response):
             variations = client.get_store_api_variations(100)
         self.assertEqual(variations, [{"id": 77, "attributes": [{"name": "Type", "option": "Walking"}, {"name": "Distance", "option": "5 km"}]}])
 
@@ -327,11 +329,26 @@ class RecoveryIntegrationLikeTests(unittest.TestCase):
         rest_response.raise_for_status.return_value = None
         rest_response.json.return_value = [{"id": 88, "attributes": [{"name": "Type", "option": "Walking"}]}]
 
-        with patch("requests.get", side_effect=[store_response, rest_response]):
+        with patch("http_client.get", side_effect=[store_response, rest_response]):
             variations = client.get_variations(100)
 
         self.assertEqual(variations, [{"id": 88, "attributes": [{"name": "Type", "option": "Walking"}]}])
 
+    def test_request_get_relies_on_http_client_retries(self):
+        client = WordPressRecoveryClient("https://site.test", "ck", "cs")
+        response = Mock()
+        response.status_code = 503
+        response.raise_for_status.side_effect = RuntimeError("503 Service Unavailable")
+
+        with patch.dict(os.environ, {"RECOVERY_HTTP_MAX_ATTEMPTS": "3", "RECOVERY_HTTP_BASE_DELAY_SEC": "0.5"}), \
+                patch("http_client.get", return_value=response) as get:
+            product, status = client.get_product_with_status(100)
+
+        get.assert_called_once()
+        self.assertEqual(get.call_args.kwargs["max_retries"], 2)
+        self.assertEqual(get.call_args.kwargs["retry_base_delay"], 0.5)
+        self.assertEqual((product, status), (None, "network_error"))
+
     def test_recovery_continues_when_direct_product_request_fails(self):
         wp = Mock()
         wp.get_product.return_value = None
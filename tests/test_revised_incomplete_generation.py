@@ -33,6 +33,20 @@ if "requests" not in sys.modules:
     requests_stub.get = lambda *args, **kwargs: None
     sys.modules["requests"] = requests_stub
 
+if "http_client" not in sys.modules:
+    hc_stub = types.ModuleType("http_client")
+    hc_stub.get = lambda *args, **kwargs: None
+    sys.modules["http_client"] = hc_stub
+
+if "async_pipeline" not in sys.modules:
+    ap_stub = types.ModuleType("async_pipeline")
+
+    async def _run_events_async_stub(*args, **kwargs):
+        return None
+
+    ap_stub.run_events_async = _run_events_async_stub
+    sys.modules["async_pipeline"] = ap_stub
+
 if "pytz" not in sys.modules:
     pytz_stub = types.ModuleType("pytz")
     pytz_stub.timezone = lambda _name: None
@@ -45,6 +59,9 @@ if "_1_google_loader" not in sys.modules:
     gl_stub.load_all_rows = lambda: ([], {})
     gl_stub.update_status_to_published = lambda *args, **kwargs: None
     gl_stub.batch_update_cells = lambda *args, **kwargs: None
+    gl_stub.batch_update_rows = lambda *args, **kwargs: True
+    gl_stub.flush_pending_updates = lambda: True
+    gl_stub.replay_write_journal = lambda: 0
     sys.modules["_1_google_loader"] = gl_stub
 
 if "_2_content_generation" not in sys.modules:
@@ -53,8 +70,11 @@ if "_2_content_generation" not in sys.modules:
     cg_stub.build_first_assistant_prompt = lambda *args, **kwargs: ""
     cg_stub.validate_source_texts = lambda *args, **kwargs: []
     cg_stub.normalize_regulations_link_block = lambda payload, _url: payload
+    cg_stub.clean_assistant_result = lambda payload, _url: payload
     cg_stub.call_openai_assistant = lambda *args, **kwargs: None
     cg_stub.call_second_openai_assistant = lambda *args, **kwargs: None
+    cg_stub.first_assistant_batch_request = lambda *args, **kwargs: ("", {})
+    cg_stub.second_assistant_batch_request = lambda *args, **kwargs: ("", {})
     cg_stub.generate_image = lambda *args, **kwargs: {"url": "", "id": None}
     cg_stub.get_coordinates_with_city_fallback = lambda *args, **kwargs: ("", "")
     cg_stub.translate_title_to_en = lambda text: text
@@ -66,6 +86,7 @@ if "_3_create_product" not in sys.modules:
     cp_stub.get_category_id_by_name = lambda *args, **kwargs: 0
     cp_stub.get_category_translation_id = lambda *args, **kwargs: 0
     cp_stub.ensure_category_translation = lambda *args, **kwargs: 0
+    cp_stub.reset_category_index = lambda: None
     sys.modules["_3_create_product"] = cp_stub
 
 if "_4_create_translation" not in sys.modules:
@@ -76,11 +97,13 @@ if "_4_create_translation" not in sys.modules:
 if "_5_taxonomy_and_attributes" not in sys.modules:
     ta_stub = types.ModuleType("_5_taxonomy_and_attributes")
     ta_stub.assign_attributes_to_product = lambda *args, **kwargs: None
+    ta_stub.reset_attribute_registry = lambda: None
     sys.modules["_5_taxonomy_and_attributes"] = ta_stub
 
 if "_6_create_variations" not in sys.modules:
     v_stub = types.ModuleType("_6_create_variations")
     v_stub.sync_variations_by_ids = lambda *args, **kwargs: {}
+    v_stub.VariationBatchError = type("VariationBatchError", (RuntimeError,), {})
     sys.modules["_6_create_variations"] = v_stub
 
 if "utils" not in sys.modules:
@@ -92,12 +115,14 @@ if "utils" not in sys.modules:
         (c, (s or None)) for c, s in pairs if c
     ]
     utils_stub.normalize_attribute_name = lambda name: name
+    utils_stub.compute_event_fingerprint = lambda *_args, **_kwargs: "fingerprint"
     sys.modules["utils"] = utils_stub
 
 if "website_snapshot" not in sys.modules:
     ws_stub = types.ModuleType("website_snapshot")
-    ws_stub.compute_website_hash = lambda *_args, **_kwargs: ("", "")
+    ws_stub.fetch_website_snapshot = lambda *_args, **_kwargs: {"hash": "", "etag": "", "last_modified": ""}
     ws_stub.has_website_changed = lambda *_args, **_kwargs: (False, "")
+    ws_stub.check_websites_changed = lambda *_args, **_kwargs: {}
     ws_stub.send_telegram_notification = lambda *_args, **_kwargs: True
     sys.modules["website_snapshot"] = ws_stub
 
@@ -121,7 +146,7 @@ class RevisedIncompleteGenerationTests(unittest.TestCase):
     @patch.object(main, "assign_attributes_to_product")
     @patch.object(main, "create_product_pt", return_value=202)
     @patch.object(main, "create_product_en", return_value=101)
-    @patch.object(main, "compute_website_hash", return_value=("snapshot-hash", "normalized"))
+    @patch.object(main, "fetch_website_snapshot", return_value={"hash": "snapshot-hash", "etag": "", "last_modified": ""})
     @patch.object(main, "translate_title_to_en", return_value="Race Name EN")
     @patch.object(main, "extract_text_from_url", return_value=("source text", None))
     @patch.object(main, "build_first_assistant_prompt", return_value="combined source text")
@@ -147,7 +172,7 @@ class RevisedIncompleteGenerationTests(unittest.TestCase):
     @patch.object(main, "get_coordinates_with_city_fallback", return_value=(1.0, 2.0))
     @patch.object(main, "load_config", return_value={"wp_url": "https://example.test", "consumer_key": "ck", "consumer_secret": "cs"})
     @patch.object(main, "log_network_diagnostics")
-    @patch.object(main.requests, "get", return_value=_FakeResponse({"slug": "race-slug", "permalink": "https://example.test/event/race-slug"}))
+    @patch.object(main.http_client, "get", return_value=_FakeResponse({"slug": "race-slug", "permalink": "https://example.test/event/race-slug"}))
     def test_revised_incomplete_generates_ai_fields(
         self,
         _mock_requests_get,
@@ -234,7 +259,7 @@ class RevisedIncompleteGenerationTests(unittest.TestCase):
     @patch.object(main, "assign_attributes_to_product")
     @patch.object(main, "create_product_pt", return_value=101)
     @patch.object(main, "create_product_en", return_value=101)
-    @patch.object(main, "compute_website_hash", return_value=("snapshot-hash", "normalized"))
+    @patch.object(main, "fetch_website_snapshot", return_value={"hash": "snapshot-hash", "etag": "", "last_modified": ""})
     @patch.object(main, "translate_title_to_en", return_value="Race Name EN")
     @patch.object(main, "extract_text_from_url", return_value=("source text", None))
     @patch.object(main, "build_first_assistant_prompt", return_value="combined source text")
@@ -246,7 +271,7 @@ class RevisedIncompleteGenerationTests(unittest.TestCase):
     @patch.object(main, "get_coordinates_with_city_fallback", return_value=(1.0, 2.0))
     @patch.object(main, "load_config", return_value={"wp_url": "https://example.test", "consumer_key": "ck", "consumer_secret": "cs"})
     @patch.object(main, "log_network_diagnostics")
-    @patch.object(main.requests, "get", return_value=_FakeResponse({"slug": "race-slug", "permalink": "https://example.test/event/race-slug"}))
+    @patch.object(main.http_client, "get", return_value=_FakeResponse({"slug": "race-slug", "permalink": "https://example.test/event/race-slug"}))
     def test_subcategories_collected_from_variation_rows(self, *_mocks):
         """Подкатегории со строк-вариаций собираются как есть — каждый дочерний
         элемент под СВОИМ родителем. Одна гонка может быть в разных родительских
@@ -289,6 +314,135 @@ class RevisedIncompleteGenerationTests(unittest.TestCase):
         # Walking НЕ должен оказаться под Cycling (родитель — из своей строки)
         self.assertNotIn(("Cycling", "Walking"), extra)
 
+    @patch.object(main, "create_product_pt_primary", return_value=202)
+    @patch.object(main, "sync_variations_by_ids", return_value={})
+    @patch.object(main, "assign_attributes_to_product")
+    @patch.object(main, "create_product_pt", return_value=101)
+    @patch.object(main, "fetch_website_snapshot", return_value={"hash": "", "etag": "", "last_modified": ""})
+    @patch.object(main, "translate_title_to_en")
+    @patch.object(main, "extract_text_from_url")
+    @patch.object(main, "call_openai_assistant")
+    @patch.object(main, "get_coordinates_with_city_fallback", return_value=(1.0, 2.0))
+    @patch.object(main, "load_config", return_value={"wp_url": "https://example.test", "consumer_key": "ck", "consumer_secret": "cs"})
+    @patch.object(main, "log_network_diagnostics")
+    @patch.object(main.http_client, "get", return_value=_FakeResponse({"slug": "race-slug", "permalink": ""}))
+    def test_unchanged_complete_event_skips_generation(
+        self,
+        _mock_requests_get,
+        _mock_log_network,
+        _mock_load_config,
+        _mock_geo,
+        mock_first,
+        mock_extract,
+        mock_translate,
+        _mock_hash,
+        _mock_create_pt,
+        _mock_assign_attrs,
+        _mock_sync_vars,
+        mock_create_primary,
+    ):
+        row = {
+            "ID": "9", "STATUS": "Revised (complete)", "RACE NAME (PT)": "Corrida", "RACE NAME": "Race",
+            "WEBSITE": "https://example.com", "REGULATIONS": "", "CATEGORY": "Road", "SUBCATEGORY": "",
+            "PRICE": "10", "LOCATION": "Lisbon", "LOCATION (CITY)": "Lisbon", "SUMMARY": "Saved summary",
+            "WP PRODUCT ID EN": "101", "WP PRODUCT ID PT": "202",
+            "WP VARIATION ID EN": "", "WP VARIATION ID PT": "",
+        }
+        saved = {}
+        category_root_map = '{"road": {"en_parent_id": 10, "pt_parent_id": 11}}'
+        with patch.dict("os.environ", {"CATEGORY_ROOT_MAP_JSON": category_root_map}), \
+             patch.object(main, "INCREMENTAL_MODE", True), \
+             patch.object(main, "compute_event_fingerprint", return_value="same"), \
+             patch.object(main, "get_event_fingerprint", return_value="same"), \
+             patch.object(main, "save_event_fingerprint", side_effect=lambda key, fp: saved.update({key: fp})), \
+             patch.object(main, "load_all_rows", return_value=([(2, row)], {"STATUS": 1})), \
+             patch.object(main, "batch_update_cells"), \
+             patch.object(main, "SKIP_AI", False):
+            main.run_automation()
+
+        mock_first.assert_not_called()
+        mock_extract.assert_not_called()
+        mock_translate.assert_not_called()
+        published_row = mock_create_primary.call_args.args[0]
+        self.assertEqual(published_row["SUMMARY"], "Saved summary")
+        self.assertEqual(saved, {"9": "same"})
+
+
+    def test_generation_reused_only_for_same_sources_and_saved_texts(self):
+        row = {
+            "SUMMARY": "Saved summary", "ORG INFO": "Saved org",
+            "SUMMARY (PT)": "Resumo", "ORG INFO (PT)": "Org PT",
+        }
+        with patch.object(main, "get_generation_source_hash", return_value="sources-v1"):
+            self.assertTrue(main._can_reuse_generation(row, "9", "sources-v1"))
+            self.assertFalse(main._can_reuse_generation(row, "9", "sources-v2"))
+            self.assertFalse(main._can_reuse_generation(dict(row, **{"SUMMARY (PT)": ""}), "9", "sources-v1"))
+            self.assertFalse(main._can_reuse_generation(row, "", "sources-v1"))
+            with patch.object(main, "REUSE_AI_FOR_UNCHANGED_SOURCES", False):
+                self.assertFalse(main._can_reuse_generation(row, "9", "sources-v1"))
+            self.assertFalse(main._can_reuse_generation(dict(row, **{"AI CACHE BYPASS": "Yes"}), "9", "sources-v1"))
+
+    def test_openai_batch_skips_pending_rows_and_clears_finished_checkpoints(self):
+        rows = [
+            (2, {"ID": "1", "OPENAI BATCH": "first:batch_running"}),
+            (3, {"ID": "2", "OPENAI BATCH": "first:batch_done"}),
+            (4, {"ID": "3", "OPENAI BATCH": ""}),
+        ]
+        headers = {"OPENAI BATCH": 5}
+        states = {"batch_running": "pending", "batch_done": "done"}
+        with patch.object(main, "OPENAI_BATCH_MODE", True), \
+             patch.object(main, "SKIP_AI", False), \
+             patch.object(main.llm_cache, "LLM_CACHE_MAX_MB", 100), \
+             patch.object(main, "collect_batch_results", return_value=states) as mock_collect, \
+             patch.object(main, "batch_update_cells") as mock_update:
+            collector, positions = main._prepare_openai_batch(rows, headers, [0, 1, 2])
+
+        self.assertEqual(sorted(mock_collect.call_args.args[0]), ["batch_done", "batch_running"])
+        self.assertEqual(positions, [1, 2])
+        mock_update.assert_called_once_with(3, {"OPENAI BATCH": ""}, headers)
+        self.assertFalse(collector.can_defer("first", 3))
+        self.assertTrue(collector.can_defer("second", 3))
+
+        with patch.object(main, "OPENAI_BATCH_MODE", True), patch.object(main, "SKIP_AI", False):
+            collector, positions = main._prepare_openai_batch(rows, {}, [0, 1, 2])
+        self.assertIsNone(collector)
+        self.assertEqual(positions, [0, 1, 2])
+
+    def test_revised_events_are_dispatched_to_worker_pool(self):
+        processed = []
+        rows = [(2, {}), (3, {}), (4, {})]
+        with patch.object(main, "EVENT_WORKERS", 3), \
+             patch.object(main, "_process_revised_event", side_effect=lambda _c, _r, _h, position, **_kwargs: processed.append(position)):
+            main._run_revised_events({}, rows, ["STATUS"], [0, 2])
+        self.assertEqual(sorted(processed), [0, 2])
+
+    def test_monitor_writes_last_diff_check_in_one_batch(self):
+        rows = [
+            (2, {"ID": "1", "STATUS": "Published (incomplete)", "WEBSITE": "https://a.pt", "WEBSITE SNAPSHOT HASH": "h1"}),
+            (3, {"ID": "2", "STATUS": "Published (incomplete)", "WEBSITE": "https://b.pt", "WEBSITE SNAPSHOT HASH": "h2"}),
+            (4, {"ID": "3", "STATUS": "Published (incomplete)", "WEBSITE": "https://c.pt", "WEBSITE SNAPSHOT HASH": "h3"}),
+            (5, {"ID": "4", "STATUS": "Published", "WEBSITE": "https://d.pt", "WEBSITE SNAPSHOT HASH": "h4"}),
+        ]
+        results = {
+            2: {"changed": True, "hash": "new", "etag": '"v2"', "last_modified": "", "not_modified": False, "bytes": 900, "bytes_saved": 0},
+            3: {"changed": False, "hash": "h2", "etag": '"v1"', "last_modified": "", "not_modified": True, "bytes": 0, "bytes_saved": 1200},
+            4: OSError("timeout"),
+        }
+        with patch.object(main, "check_websites_changed", return_value=results) as mock_check, \
+             patch.object(main, "batch_update_rows", return_value=True) as mock_write, \
+             patch.object(main, "pytz", types.SimpleNamespace(timezone=lambda _name: None)):
+            changed = main._monitor_published_incomplete(rows, ["STATUS", "LAST DIFF CHECK AT", "WEBSITE ETAG"])
+
+        self.assertEqual([target[0] for target in mock_check.call_args.args[0]], [2, 3, 4])
+        self.assertEqual([item["id"] for item in changed], ["1"])
+        mock_write.assert_called_once()
+        updates = mock_write.call_args.args[0]
+        self.assertEqual(sorted(updates), [2, 3])
+        # У изменившегося сайта валидаторы не обновляются, иначе следующая проверка получит 304.
+        self.assertNotIn("WEBSITE ETAG", updates[2])
+        self.assertEqual(updates[3]["WEBSITE ETAG"], '"v1"')
+        self.assertNotIn("WEBSITE LAST MODIFIED", updates[3])
+
 
 if __name__ == "__main__":
     unittest.main()
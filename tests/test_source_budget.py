@@ -0,0 +1,87 @@
+import os
+import sys
+import unittest
+
+RUN_DIR = os.path.join(os.path.dirname(__file__), "..", "run")
+if RUN_DIR not in sys.path:
+    sys.path.insert(0, RUN_DIR)
+
+import run_metrics  # noqa: E402
+import source_budget  # noqa: E402
+
+
+class SourceBudgetTests(unittest.TestCase):
+    def setUp(self):
+        run_metrics.reset()
+
+    def tearDown(self):
+        run_metrics.reset()
+
+    def test_texts_within_budget_without_noise_are_unchanged(self):
+        regulations = "Artigo 1. A prova realiza-se a 14 de setembro."
+        website = "Trail da Serra.\nInscrições abertas até 10/09."
+        self.assertEqual(source_budget.fit_sources_to_budget(regulations, website, 1000), (regulations, website))
+        self.assertEqual(run_metrics.snapshot(), {})
+
+    def test_drops_boilerplate_and_text_repeated_from_regulations(self):
+        regulations = "A partida é às 09:00 na Praça Central de Vila Real."
+        website = (
+            "Utilizamos cookies para melhorar a sua experiência. "
+            "A partida é às 09:00 na Praça Central de Vila Real. "
+            "Prova de 21 km com 800 m de desnível. "
+            "© 2025 Todos os direitos reservados."
+        )
+
+        result_regulations, result_website = source_budget.fit_sources_to_budget(regulations, website, 1000)
+
+        self.assertEqual(result_regulations, regulations)
+        self.assertEqual(result_website, "Prova de 21 km com 800 m de desnível.")
+
+    def test_short_repeated_facts_and_line_breaks_are_kept(self):
+        regulations = "Preços\n10 km\n15€\n21 km\n20€\n5 km\n15€\nInscrições até 10/09."
+        website = "Trail da Serra\n5 km\n15€\nUtilizamos cookies para melhorar a sua experiência."
+
+        result_regulations, result_website = source_budget.fit_sources_to_budget(regulations, website, 1000)
+
+        self.assertEqual(result_regulations, regulations)
+        self.assertEqual(result_website, "Trail da Serra\n5 km\n15€")
+
+    def test_over_budget_keeps_relevant_sentences_from_both_sources_in_order(self):
+        filler = " ".join(f"O nosso clube tem uma longa história número {i}." for i in range(200))
+        regulations = (
+            f"{filler} A inscrição custa 15 € até 1 de setembro. "
+            f"{filler} O cancelamento dá direito a reembolso de 50%."
+        )
+        website = f"{filler} A partida dos 10 km é às 09:30."
+
+        result_regulations, result_website = source_budget.fit_sources_to_budget(regulations, website, 200)
+
+        self.assertIn("A inscrição custa 15 € até 1 de setembro.", result_regulations)
+        self.assertIn("O cancelamento dá direito a reembolso de 50%.", result_regulations)
+        self.assertLess(
+            result_regulations.index("A inscrição custa"),
+            result_regulations.index("O cancelamento"),
+        )
+        self.assertIn("A partida dos 10 km é às 09:30.", result_website)
+        total = source_budget.estimate_tokens(result_regulations) + source_budget.estimate_tokens(result_website)
+        self.assertLessEqual(total, 200)
+        self.assertGreater(run_metrics.snapshot()["source_tokens_trimmed"], 0)
+
+    def test_unused_website_share_goes_to_regulations(self):
+        regulations = " ".join(f"Artigo {i}: partida às 09:{i % 60:02d}." for i in range(100))
+        website = "Trail 21 km."
+
+        result_regulations, result_website = source_budget.fit_sources_to_budget(regulations, website, 400)
+
+        self.assertEqual(result_website, website)
+        self.assertGreater(source_budget.estimate_tokens(result_regulations), 300)
+
+    def test_long_run_without_punctuation_is_split_on_words(self):
+        menu = " ".join(["Início"] * 400)
+        chunks = source_budget.split_chunks(menu)
+        self.assertTrue(all(len(chunk) <= 600 for chunk in chunks))
+        self.assertEqual(" ".join(chunks), menu)
+
+
+if __name__ == "__main__":
+    unittest.main()
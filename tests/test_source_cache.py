@@ -0,0 +1,54 @@
+import os
+import sys
+import unittest
+from unittest.mock import patch
+
+import pytest
+
+RUN_DIR = os.path.join(os.path.dirname(__file__), "..", "run")
+if RUN_DIR not in sys.path:
+    sys.path.insert(0, RUN_DIR)
+
+import run_metrics  # noqa: E402
+import source_cache  # noqa: E402
+
+
+@pytest.mark.usefixtures("isolated_state")
+class SourceCacheTests(unittest.TestCase):
+    def test_url_normalization_ignores_case_fragment_and_trailing_slash(self):
+        self.assertEqual(
+            source_cache.normalize_source_url("HTTPS://Race.Example.pt:443/inscricoes/#precos"),
+            source_cache.normalize_source_url("https://race.example.pt/inscricoes"),
+        )
+        self.assertNotEqual(
+            source_cache.normalize_source_url("https://race.example.pt/?lang=en"),
+            source_cache.normalize_source_url("https://race.example.pt/?lang=pt"),
+        )
+
+    def test_text_roundtrip_with_metrics_and_empty_text_not_stored(self):
+        self.assertIsNone(source_cache.lookup_source_text("https://race.example.pt"))
+        source_cache.store_source_text("https://race.example.pt", "Trail 25 km")
+        source_cache.store_source_text("https://broken.example.pt", "   ")
+
+        self.assertEqual(source_cache.lookup_source_text("https://race.example.pt/"), "Trail 25 km")
+        self.assertIsNone(source_cache.lookup_source_text("https://broken.example.pt"))
+        self.assertEqual(run_metrics.snapshot(), {"source_cache_miss": 2, "source_cache_hit": 1})
+
+    def test_entry_expires_after_ttl(self):
+        source_cache.store_source_text("https://race.example.pt", "Trail 25 km")
+        later = source_cache.time.time() + 25 * 3600
+        with patch.object(source_cache, "SOURCE_CACHE_TTL_HOURS", 24), \
+             patch.object(source_cache.time, "time", return_value=later):
+            self.assertIsNone(source_cache.lookup_source_text("https://race.example.pt"))
+        with patch.object(source_cache, "SOURCE_CACHE_TTL_HOURS", 0):
+            self.assertIsNone(source_cache.lookup_source_text("https://race.example.pt"))
+
+    def test_source_hash_depends_on_prompt_and_pdf_contents(self):
+        base = source_cache.compute_source_hash("WEBSITE INFO:\nTrail", [])
+        self.assertEqual(base, source_cache.compute_source_hash("WEBSITE INFO:\nTrail", []))
+        self.assertNotEqual(base, source_cache.compute_source_hash("WEBSITE INFO:\nTrail 2", []))
+        self.assertNotEqual(base, source_cache.compute_source_hash("WEBSITE INFO:\nTrail", ["a" * 64]))
+
+
+if __name__ == "__main__":
+    unittest.main()
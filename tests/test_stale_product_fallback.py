@@ -28,8 +28,8 @@ class StaleProductFallbackTests(unittest.TestCase):
     def test_recreates_when_existing_id_is_invalid(self, mock_create):
         put_resp = _FakeResp(False, 400)
         get_resp = _FakeResp(False, 404, '{"code":"woocommerce_rest_product_invalid_id"}')
-        with patch.object(cp.requests, "put", return_value=put_resp), \
-             patch.object(cp.requests, "get", return_value=get_resp):
+        with patch.object(cp.http_client, "put", return_value=put_resp), \
+             patch.object(cp.http_client, "get", return_value=get_resp):
             result = cp.create_or_update_product({"RACE NAME (PT)": "Race X"}, existing_product_id=123)
         self.assertEqual(result, 999)
         mock_create.assert_called_once()
@@ -38,8 +38,8 @@ class StaleProductFallbackTests(unittest.TestCase):
     def test_raises_when_product_exists_but_update_fails(self, mock_create):
         put_resp = _FakeResp(False, 400, "bad request")
         get_resp = _FakeResp(True, 200, "{}")
-        with patch.object(cp.requests, "put", return_value=put_resp), \
-             patch.object(cp.requests, "get", return_value=get_resp):
+        with patch.object(cp.http_client, "put", return_value=put_resp), \
+             patch.object(cp.http_client, "get", return_value=get_resp):
             with self.assertRaises(requests.HTTPError):
                 cp.create_or_update_product({"RACE NAME (PT)": "Race X"}, existing_product_id=123)
         mock_create.assert_not_called()
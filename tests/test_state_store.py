@@ -0,0 +1,32 @@
+import os
+import sys
+import unittest
+
+import pytest
+
+RUN_DIR = os.path.join(os.path.dirname(__file__), "..", "run")
+if RUN_DIR not in sys.path:
+    sys.path.insert(0, RUN_DIR)
+
+import state_store  # noqa: E402
+
+
+@pytest.mark.usefixtures("isolated_state")
+class StateStoreTests(unittest.TestCase):
+    def test_event_fingerprint_roundtrip_and_overwrite(self):
+        self.assertIsNone(state_store.get_event_fingerprint("42"))
+        state_store.save_event_fingerprint("42", "abc")
+        state_store.save_event_fingerprint("42", "def")
+        self.assertEqual(state_store.get_event_fingerprint("42"), "def")
+
+    def test_unavailable_database_degrades_to_empty_store(self):
+        blocker = os.path.join(self.state_dir, "file")
+        with open(blocker, "w", encoding="utf-8"):
+            pass
+        state_store.reset_connection(os.path.join(blocker, "state.sqlite3"))
+        state_store.save_event_fingerprint("1", "x")
+        self.assertIsNone(state_store.get_event_fingerprint("1"))
+
+
+if __name__ == "__main__":
+    unittest.main()
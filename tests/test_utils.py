@@ -16,6 +16,7 @@ from utils import (
     parse_subcategory_values,
     get_missing_pt_fields,
     parse_faq_items,
+    compute_event_fingerprint,
 )
 
 
@@ -135,6 +136,19 @@ class UtilsTests(unittest.TestCase):
         with self.assertRaises(RuntimeError):
             select_attribute_id(attrs, "Running")
 
+    def test_compute_event_fingerprint_ignores_pipeline_output_columns(self):
+        main_row = {"ID": "1", "STATUS": "Revised (complete)", "PRICE": "10", "SUMMARY": "old"}
+        child = {"STATUS": "", "DISTANCE": "10 km", "WP VARIATION ID EN": ""}
+        base = compute_event_fingerprint(main_row, [child])
+
+        published = dict(main_row, STATUS="Published", SUMMARY="new")
+        child_published = dict(child, **{"WP VARIATION ID EN": "55"})
+        self.assertEqual(compute_event_fingerprint(published, [child_published]), base)
+
+        self.assertNotEqual(compute_event_fingerprint(dict(main_row, PRICE="12"), [child]), base)
+        self.assertNotEqual(compute_event_fingerprint(main_row, [dict(child, DISTANCE="21 km")]), base)
+        self.assertNotEqual(compute_event_fingerprint(main_row, []), base)
+
 
 if __name__ == "__main__":
     unittest.main()
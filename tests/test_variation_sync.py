@@ -34,7 +34,7 @@ sys.modules["_1_google_loader"] = google_loader_stub
 
 sys.modules.pop("_6_create_variations", None)
 
-from _6_create_variations import sync_variations_by_ids
+from _6_create_variations import VariationBatchError, sync_variations_by_ids
 
 
 class _FakeResponse:
@@ -70,12 +70,14 @@ class VariationSyncTests(unittest.TestCase):
                 )
             if method == "GET" and endpoint == "products/100/variations?per_page=100&page=2":
                 return _FakeResponse(json_data=[])
-            if method == "PUT" and endpoint == "products/100/variations/11":
-                return _FakeResponse(json_data={"id": 11})
-            if method == "POST" and endpoint == "products/100/variations":
-                return _FakeResponse(json_data={"id": 33})
-            if method == "DELETE" and endpoint == "products/100/variations/22":
-                return _FakeResponse(json_data={"id": 22, "deleted": True})
+            if method == "POST" and endpoint == "products/100/variations/batch":
+                return _FakeResponse(
+                    json_data={
+                        "create": [{"id": 33, **payload["create"][0]}],
+                        "update": [payload["update"][0]],
+                        "delete": [{"id": 22}],
+                    }
+                )
             raise AssertionError(f"Unexpected call: {method} {endpoint} {payload}")
 
         mock_wcapi.side_effect = side_effect
@@ -100,8 +102,16 @@ class VariationSyncTests(unittest.TestCase):
 
         self.assertEqual(mapping[5001], 11)
         self.assertEqual(mapping[5002], 33)
-        self.assertIn(("PUT", "products/100/variations/11", {"regular_price": "15", "attributes": [{"id": 9, "option": "5 km"}]}), calls)
-        self.assertIn(("DELETE", "products/100/variations/22", {"force": True}), calls)
+        batch_calls = [call for call in calls if call[0] == "POST"]
+        self.assertEqual(len(batch_calls), 1)
+        self.assertEqual(
+            batch_calls[0][2],
+            {
+                "create": [{"regular_price": "25", "attributes": [{"id": 9, "option": "21 km"}]}],
+                "update": [{"id": 11, "regular_price": "15", "attributes": [{"id": 9, "option": "5 km"}]}],
+                "delete": [22],
+            },
+        )
 
     @patch("_6_create_variations._wcapi_request_with_retry")
     def test_sync_variations_ignores_mismatched_existing_id_and_matches_by_payload(self, mock_wcapi):
@@ -133,9 +143,7 @@ class VariationSyncTests(unittest.TestCase):
                 )
             if method == "GET" and endpoint == "products/100/variations?per_page=100&page=2":
                 return DummyResponse([])
-            if method == "DELETE":
-                return DummyResponse({})
-            if method in {"PUT", "POST"}:
+            if method in {"PUT", "POST", "DELETE"}:
                 self.fail(f"Unexpected mutation call {method} {endpoint} {payload}")
             raise AssertionError(f"Unexpected call: {method} {endpoint}")
 
@@ -183,8 +191,8 @@ class VariationSyncTests(unittest.TestCase):
                 return DummyResponse({"attributes": [{"id": 1, "name": "Running"}]})
             if method == "GET" and endpoint == "products/100/variations?per_page=100&page=1":
                 return DummyResponse([])
-            if method == "POST" and endpoint == "products/100/variations":
-                return DummyResponse({"id": 777})
+            if method == "POST" and endpoint == "products/100/variations/batch":
+                return DummyResponse({"create": [{"id": 777, **payload["create"][0]}]})
             raise AssertionError(f"Unexpected call: {method} {endpoint} {payload}")
 
         mock_wcapi.side_effect = side_effect
@@ -203,10 +211,148 @@ class VariationSyncTests(unittest.TestCase):
 
         self.assertEqual(mapping, {10: 777})
         self.assertIn(
-            ("POST", "products/100/variations", {"regular_price": "15", "attributes": [{"id": 1, "option": "Walk"}]}),
+            ("POST", "products/100/variations/batch", {"create": [{"regular_price": "15", "attributes": [{"id": 1, "option": "Walk"}]}]}),
             calls,
         )
 
 
+    @patch("_6_create_variations._wcapi_request_with_retry")
+    def test_sync_variations_batches_by_100_and_maps_item_errors_to_rows(self, mock_wcapi):
+        batch_bodies = []
+
+        def side_effect(method, endpoint, payload=None):
+            if method == "GET" and endpoint == "products/100":
+                return _FakeResponse(json_data={"attributes": [{"id": 9, "name": "Distance"}]})
+            if method == "GET" and endpoint.startswith("products/100/variations?"):
+                return _FakeResponse(json_data=[])
+            if method == "POST" and endpoint == "products/100/variations/batch?lang=pt":
+                batch_bodies.append(payload)
+                offset = sum(len(body["create"]) for body in batch_bodies[:-1])
+                created = []
+                for position, _item in enumerate(payload["create"]):
+                    if offset + position == 101:
+                        created.append({"id": 0, "error": {"code": "invalid", "message": "bad option"}})
+                    else:
+                        created.append({"id": 1000 + offset + position, **_item})
+                return _FakeResponse(json_data={"create": created})
+            raise AssertionError(f"Unexpected call: {method} {endpoint}")
+
+        mock_wcapi.side_effect = side_effect
+        entries = [
+            {
+                "row_index": 10 + i,
+                "existing_variation_id": "",
+                "regular_price": "5",
+                "attributes": [{"name": "Distance", "option": f"{i} km"}],
+            }
+            for i in range(150)
+        ]
+
+        with self.assertRaises(VariationBatchError) as ctx:
+            sync_variations_by_ids(100, entries, lang="pt")
+
+        self.assertEqual([len(body["create"]) for body in batch_bodies], [100, 50])
+        self.assertEqual(list(ctx.exception.failed_rows), [111])
+        self.assertEqual(ctx.exception.row_to_variation_id[10], 1000)
+        self.assertEqual(ctx.exception.row_to_variation_id[159], 1149)
+        self.assertNotIn(111, ctx.exception.row_to_variation_id)
+
+
+    @patch("_6_create_variations._wcapi_request_with_retry")
+    def test_sync_variations_verifies_batch_result_without_reloading(self, mock_wcapi):
+        calls = []
+
+        def side_effect(method, endpoint, payload=None):
+            calls.append((method, endpoint))
+            if method == "GET" and endpoint == "products/100":
+                return _FakeResponse(json_data={"attributes": [{"id": 9, "name": "Distance"}]})
+            if method == "GET" and endpoint.startswith("products/100/variations?"):
+                return _FakeResponse(json_data=[])
+            if method == "POST" and endpoint == "products/100/variations/batch":
+                # WooCommerce принял вариацию, но без опции атрибута.
+                return _FakeResponse(json_data={"create": [{"id": 55, "regular_price": "5.00", "attributes": []}]})
+            raise AssertionError(f"Unexpected call: {method} {endpoint}")
+
+        mock_wcapi.side_effect = side_effect
+
+        with self.assertRaises(VariationBatchError) as ctx:
+            sync_variations_by_ids(
+                100,
+                [{"row_index": 7, "existing_variation_id": "", "regular_price": "5", "attributes": [{"name": "Distance", "option": "5 km"}]}],
+            )
+
+        self.assertIn(7, ctx.exception.failed_rows)
+        self.assertEqual(ctx.exception.row_to_variation_id, {})
+        self.assertEqual(sum(1 for call in calls if call[1].startswith("products/100/variations?")), 1)
+
+
+    @patch("_6_create_variations._wcapi_request_with_retry")
+    def test_verification_accepts_canonical_term_names(self, mock_wcapi):
+        def side_effect(method, endpoint, payload=None):
+            if method == "GET" and endpoint == "products/100":
+                return _FakeResponse(json_data={"attributes": [{"id": 9, "name": "Distance"}, {"id": 4, "name": "Type"}]})
+            if method == "GET" and endpoint.startswith("products/100/variations?"):
+                return _FakeResponse(json_data=[])
+            if method == "POST" and endpoint == "products/100/variations/batch":
+                # Глобальные атрибуты: WooCommerce отдаёт имя терма, а не значение из таблицы.
+                return _FakeResponse(json_data={"create": [{
+                    "id": 55,
+                    "regular_price": "5.00",
+                    "attributes": [{"id": 9, "option": "5 KM"}, {"id": 4, "option": "Trail &amp; Run"}],
+                }]})
+            raise AssertionError(f"Unexpected call: {method} {endpoint}")
+
+        mock_wcapi.side_effect = side_effect
+
+        mapping = sync_variations_by_ids(
+            100,
+            [{
+                "row_index": 7,
+                "existing_variation_id": "",
+                "regular_price": "5",
+                "attributes": [{"name": "Distance", "option": "5 km"}, {"name": "Type", "option": "Trail & Run"}],
+            }],
+        )
+
+        self.assertEqual(mapping, {7: 55})
+
+    @patch("_6_create_variations._wcapi_request_with_retry")
+    def test_canonical_term_names_produce_no_operations(self, mock_wcapi):
+        calls = []
+
+        def side_effect(method, endpoint, payload=None):
+            calls.append((method, endpoint))
+            if method == "GET" and endpoint == "products/100":
+                return _FakeResponse(json_data={"attributes": [{"id": 9, "name": "Distance"}, {"id": 4, "name": "Type"}]})
+            if method == "GET" and endpoint.startswith("products/100/variations?"):
+                return _FakeResponse(json_data=[
+                    {"id": 55, "regular_price": "5", "attributes": [{"id": 9, "option": "5 KM"}, {"id": 4, "option": "Trail &amp; Run"}]},
+                    {"id": 66, "regular_price": "8", "attributes": [{"id": 9, "option": "10 KM"}, {"id": 4, "option": "Trail &amp; Run"}]},
+                ])
+            raise AssertionError(f"Unexpected call: {method} {endpoint}")
+
+        mock_wcapi.side_effect = side_effect
+
+        mapping = sync_variations_by_ids(
+            100,
+            [
+                {
+                    "row_index": 7,
+                    "existing_variation_id": "55",
+                    "regular_price": "5",
+                    "attributes": [{"name": "Distance", "option": "5 km"}, {"name": "Type", "option": "Trail & Run"}],
+                },
+                {
+                    "row_index": 8,
+                    "existing_variation_id": "",
+                    "regular_price": "8",
+                    "attributes": [{"name": "Distance", "option": "10 km"}, {"name": "Type", "option": "Trail & Run"}],
+                },
+            ],
+        )
+
+        self.assertEqual(mapping, {7: 55, 8: 66})
+        self.assertFalse([call for call in calls if call[0] != "GET"])
+
 if __name__ == "__main__":
     unittest.main()
@@ -1,4 +1,8 @@
+import hashlib
 import os
+import random
+import threading
+import time
 import unittest
 from unittest.mock import patch
 
@@ -10,11 +14,15 @@ if RUN_DIR not in sys.path:
 
 sys.modules.pop("website_snapshot", None)
 
+import website_snapshot  # noqa: E402
+from benchmark_html_normalizer import normalize_html_for_hash_legacy  # noqa: E402
 from website_snapshot import (
     fetch_website_html,
     normalize_html_for_hash,
     compute_website_hash,
     has_website_changed,
+    check_websites_changed,
+    check_website_snapshot,
 )
 
 
@@ -51,5 +59,120 @@ class WebsiteSnapshotTests(unittest.TestCase):
         self.assertEqual(current_hash, "new-hash")
 
 
+    @patch("website_snapshot.check_website_snapshot")
+    def test_check_websites_changed_caps_parallel_requests_per_host(self, mock_changed):
+        active = {}
+        peak = {}
+        lock = threading.Lock()
+
+        def fake_changed(previous_hash, website_url, etag, last_modified, deadline=None):
+            host = website_url.split("/")[2]
+            with lock:
+                active[host] = active.get(host, 0) + 1
+                peak[host] = max(peak.get(host, 0), active[host])
+            threading.Event().wait(0.02)
+            with lock:
+                active[host] -= 1
+            return {"changed": previous_hash != "same"}
+
+        mock_changed.side_effect = fake_changed
+        targets = [(i, f"https://site{i % 2}.pt/race{i}", "same" if i % 3 else "old", "", "") for i in range(8)]
+        results = check_websites_changed(targets, max_workers=8, max_per_host=2, budget_sec=5)
+
+        self.assertEqual(len(results), 8)
+        self.assertEqual(results[0], {"changed": True})
+        self.assertEqual(results[1], {"changed": False})
+        self.assertLessEqual(max(peak.values()), 2)
+
+    @patch("website_snapshot.check_website_snapshot")
+    def test_check_websites_changed_respects_budget(self, mock_changed):
+        def fake_changed(previous_hash, website_url, etag, last_modified, deadline=None):
+            if "slow" in website_url:
+                threading.Event().wait(0.3)
+            return {"changed": False}
+
+        mock_changed.side_effect = fake_changed
+        started = time.monotonic()
+        results = check_websites_changed(
+            [("fast", "https://fast.pt", "h", "", ""), ("slow", "https://slow.pt", "h", "", "")],
+            max_workers=2,
+            budget_sec=0.1,
+        )
+        self.assertLess(time.monotonic() - started, 0.25)
+        self.assertEqual(results, {"fast": {"changed": False}})
+
+    @patch("website_snapshot.get_website_body_size", return_value=5120)
+    @patch("website_snapshot._normalized_tokens")
+    @patch("website_snapshot._request_with_retries")
+    def test_not_modified_skips_normalization_and_hashing(self, mock_request, mock_normalize, _mock_size):
+        mock_request.return_value = (304, b"", {"ETag": '"abc"'})
+        snapshot = check_website_snapshot("prev-hash", "https://race.pt", etag='"abc"', last_modified="Mon, 01 Jan 2024 00:00:00 GMT")
+
+        sent_headers = mock_request.call_args.args[1]
+        self.assertEqual(sent_headers["If-None-Match"], '"abc"')
+        self.assertEqual(sent_headers["If-Modified-Since"], "Mon, 01 Jan 2024 00:00:00 GMT")
+        mock_normalize.assert_not_called()
+        self.assertFalse(snapshot["changed"])
+        self.assertTrue(snapshot["not_modified"])
+        self.assertEqual(snapshot["hash"], "prev-hash")
+        self.assertEqual(snapshot["last_modified"], "Mon, 01 Jan 2024 00:00:00 GMT")
+        self.assertEqual(snapshot["bytes_saved"], 5120)
+
+    @patch("website_snapshot.save_website_body_size")
+    @patch("website_snapshot._request_with_retries")
+    def test_full_response_returns_hash_and_validators(self, mock_request, mock_save_size):
+        mock_request.return_value = (200, b"<html>Race</html>", {"etag": '"v2"', "Last-Modified": "Tue"})
+        snapshot = check_website_snapshot("prev-hash", "https://race.pt")
+
+        self.assertEqual(mock_request.call_args.args[1], {})
+        self.assertTrue(snapshot["changed"])
+        self.assertEqual(snapshot["etag"], '"v2"')
+        self.assertEqual(snapshot["last_modified"], "Tue")
+        self.assertEqual(snapshot["bytes"], 17)
+        mock_save_size.assert_called_once_with("https://race.pt", 17)
+
+
+
+class HtmlNormalizerCompatibilityTests(unittest.TestCase):
+    """Однопроходный нормализатор обязан давать те же хеши, что исходная цепочка re.sub."""
+
+    CASES = [
+        "<html><!-- <script>x</script> --><p>Hi</p></html>",
+        "<script>var s = '<!-- </script> -->'; nonce='abcdef12'</script><p>ok</p>",
+        "<style>a{}<script>x</style></script></style><p>after</p>",
+        "<script>never closed <style>b{}</style><p>text</p>",
+        "<!-- never closed <script>x</script>",
+        "<style <!-- > --> media=x>p{}</style>tail",
+        "<a href='/r?utm_source=fb&v=12&id=7'>Go</a> token: 'ABCDEFG12'",
+        "nonce<!-- x -->=abcdefgh ?ver=1 =zzzzzzzz",
+        "<SCRIPT type=text/javascript>A</SCRIPT><STYLE>B</STYLE>  MIXED\xa0Case\x1c",
+        "<ſcript>x</script><scrİpt>y</script><scripté>z</script>",
+    ]
+
+    def _assert_compatible(self, html):
+        legacy = normalize_html_for_hash_legacy(html)
+        self.assertEqual(normalize_html_for_hash(html), legacy, repr(html))
+        self.assertEqual(website_snapshot._hash_html(html), hashlib.sha256(legacy.encode("utf-8")).hexdigest())
+
+    def test_known_edge_cases_match_legacy(self):
+        for html in self.CASES:
+            self._assert_compatible(html)
+
+    def test_random_documents_match_legacy(self):
+        fragments = [
+            "<!--", "-->", "<script>", "<script src='x'>", "</script>", "<SCRIPT>", "</SCRIPT >",
+            "<style>", "</style>", "<style media=x>", "<scriptx>", ">", "<", "a", "b c", "\n", "\xa0",
+            "?v=123", "&utm_source=abc", "nonce=abcdef123", "hash = \"1234567\"", "İ", "s", "&", "'",
+        ]
+        rnd = random.Random(20240601)
+        for _ in range(3000):
+            self._assert_compatible("".join(rnd.choice(fragments) for _ in range(rnd.randint(0, 30))))
+
+    def test_digest_is_fed_in_chunks(self):
+        html = " ".join(f"<p>word{i}</p>" for i in range(10000))
+        with patch.object(website_snapshot, "_DIGEST_TOKENS_PER_UPDATE", 7):
+            self._assert_compatible(html)
+
+
 if __name__ == "__main__":
     unittest.main()